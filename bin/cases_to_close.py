@@ -9,28 +9,39 @@ import sys
 import requests
 
 
+def query_api(api_url, data_type, params):
+    """
+    Fetch every page of a filtered /api/cards or /api/cases query
+    """
+    items = {}
+    params = dict(params, limit=1000)
+    while True:
+        response = requests.get("{}/api/{}".format(api_url, data_type), params=params)
+        if response.status_code != 200:
+            print("could not retrieve {}: {}".format(data_type, response.status_code))
+            sys.exit(1)
+        page = response.json()
+        items.update(page["items"])
+        if page["next_cursor"] is None:
+            return items
+        params["cursor"] = page["next_cursor"]
+
+
 def check_cases(api_url):
     """
     Compare cases to cards for a given tag
     """
-    cases = requests.get("{}/api/cases".format(api_url))
-    if cases.status_code == 200:
-        closed_cases = {
-            c: d for (c, d) in cases.json().items() if d["status"] == "Closed"
-        }
-    else:
-        print("could not retrieve cases: {}".format(cases.status_code))
-        sys.exit(1)
-    cards = requests.get("{}/api/cards".format(api_url))
-    if cases.status_code == 200:
-        open_cards = {
-            c: d
-            for (c, d) in cards.json().items()
-            if d["card_status"] not in ("Done", "Won't Fix / Obsolete")
-        }
-    else:
-        print("could not retrieve cards: {}".format(cards.status_code))
-        sys.exit(1)
+    closed_cases = query_api(api_url, "cases", {"status": "Closed", "fields": "status"})
+    cards = query_api(
+        api_url,
+        "cards",
+        {"case_status": "Closed", "fields": "card_status,case_number,assignee"},
+    )
+    open_cards = {
+        c: d
+        for (c, d) in cards.items()
+        if d["card_status"] not in ("Done", "Won't Fix / Obsolete")
+    }
     for card in open_cards:
         if open_cards[card]["case_number"] in closed_cases.keys():
             print(
@@ -1,376 +1,512 @@
 import argparse
 import datetime
 import json
-import re
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
 
 from faker import Faker
 
+# share of cases by severity, most cases are Normal and few are Urgent
+severity_weights = {"1 (Urgent)": 5, "2 (High)": 20, "3 (Normal)": 55, "4 (Low)": 20}
+# median days until relief and resolution by severity, durations are
+# lognormally distributed around them
+relief_days = {"Urgent": 2, "High": 5, "Normal": 14, "Low": 30}
+resolve_days = {"Urgent": 10, "High": 25, "Normal": 60, "Low": 120}
+open_statuses = ["Waiting on Red Hat", "Waiting on Customer"]
+card_statuses = ["Backlog", "Debugging", "Eng Working", "Backport", "Ready To Close"]
+# projects of the Jira issues linked to cases
+issue_projects = ["OCPBUGS", "RFE", "CNV", "ESCALATE"]
+sections = ("issues", "bugs", "cases", "cards")
 
-def generate_fake_data(number_of_cases):
-    """Generate fake data for use in development environments
 
-    Args:
-        number_of_cases (int): Amount of fake cases to generate
+class FakeCorpus:
+    """Pools of fake text and people, and the random distributions drawn from
 
-    Returns:
-        dict: A dictionary containing fake cases, issues, bugs, and cards
+    Faker is too slow to call for every field of 200k cases, so it only fills
+    pools of text and people that are sampled with random.Random.
+
+    Args:
+        seed (int): Seed of Faker and of the random generator
+        accounts (int): Number of fake accounts
+        engineers (int): Number of fake engineers that cards are assigned to
     """
-    fake = Faker(["en_US", "ja_JP", "es_ES", "ko_KR", "la"])
-    Faker.seed(0)
-
-    issues = {}
-    bugs = {}
-    cards = {}
-    accounts = [fake.company() for _ in range(10)]
-    engineers = [
-        {
-            "displayName": fake.name(),
-            "emailAddress": fake.safe_email(),
-            "accountId": fake.uuid4(),
-        }
-        for _ in range(5)
-    ]
-    cases = generate_fake_cases(fake, number_of_cases, accounts)
-    for case_number, case_details in cases.items():
-        if fake.boolean():
-            # Generate fake issues for case
-            private_keywords = generate_fake_private_keywords(fake)
-            issues[case_number] = generate_fake_issues(fake, private_keywords)
-
-        if fake.boolean():
-            # Generate fake bugs for case
-            bugs[case_number] = generate_fake_bugs(fake, case_number)
-
-        # Generate fake card for case
-        card = generate_fake_card(
-            fake, engineers, bugs, issues, case_number, case_details
+
+    def __init__(self, seed, accounts, engineers):
+        fake = Faker(["en_US", "ja_JP", "es_ES", "ko_KR", "la"])
+        Faker.seed(seed)
+        self.rng = random.Random(seed)
+        self.fake = fake
+        self.words = [fake.word() for _ in range(500)]
+        self.sentences = [fake.sentence() for _ in range(2000)]
+        self.paragraphs = [fake.paragraph() for _ in range(2000)]
+        self.names = [fake.name() for _ in range(500)]
+        self.emails = [fake.safe_email() for _ in range(500)]
+        self.domains = [fake.safe_domain_name() for _ in range(50)]
+        self.products = [f"{fake.word()} {fake.numerify('#.#')}" for _ in range(20)]
+        self.accounts = [fake.company() for _ in range(accounts)]
+        # a few accounts open most cases (Zipf distribution)
+        self.account_weights = list(
+            _cumulative([1 / (rank + 1) ** 1.1 for rank in range(accounts)])
         )
-        cards.update(card)
-    data = {"issues": issues, "bugs": bugs, "cases": cases, "cards": cards}
-    return data
+        self.engineers = [
+            {
+                "displayName": fake.name(),
+                "emailAddress": fake.safe_email(),
+                "accountId": fake.uuid4(),
+            }
+            for _ in range(engineers)
+        ]
+        self.engineer_weights = list(
+            _cumulative([1 / (rank + 1) ** 0.5 for rank in range(engineers)])
+        )
+        self.severity_weights = list(_cumulative(severity_weights.values()))
+        self.project = fake.bothify("????").upper()
+
+    def choice(self, pool):
+        return pool[self.rng.randrange(len(pool))]
 
+    def chance(self, probability):
+        return self.rng.random() < probability
 
-def generate_fake_cases(fake, number_of_cases, accounts):
-    """Generate fake portal cases for use in development environments
+    def count(self, median, cap, sigma=1.0):
+        """Draw a long-tailed count (lognormal around median, at most cap)"""
+        return min(cap, int(self.rng.lognormvariate(math.log(median), sigma)))
+
+    def account(self):
+        return self.rng.choices(self.accounts, cum_weights=self.account_weights)[0]
+
+    def engineer(self):
+        return self.rng.choices(self.engineers, cum_weights=self.engineer_weights)[0]
+
+    def severity(self):
+        return self.rng.choices(
+            list(severity_weights), cum_weights=self.severity_weights
+        )[0]
+
+    def duration(self, median_days):
+        """Draw a duration in days, lognormally distributed around median"""
+        return datetime.timedelta(
+            days=self.rng.lognormvariate(math.log(median_days), 1)
+        )
+
+    def between(self, start, end):
+        """Draw a datetime between start and end"""
+        return start + (end - start) * self.rng.random()
+
+
+def _cumulative(weights):
+    total = 0
+    for weight in weights:
+        total += weight
+        yield total
+
+
+def _portal_time(timestamp):
+    """Format a datetime like the portal API, e.g. 2024-01-31T12:00:00Z"""
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _jira_time(timestamp):
+    """Format a datetime like JIRA, e.g. 2024-01-31T12:00:00.000+0000"""
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "+0000"
+
+
+def generate_fake_records(number_of_cases, accounts=10, engineers=5, seed=0, years=5):
+    """Generate fake cases with their card, bugs and issues, one at a time
+
+    Cases are created over the last `years`, with 10% in the last week, and
+    case numbers grow with the creation date. Severities, accounts and
+    engineers are skewed; comments, bugs and issues per case and the time
+    to relief and resolution are long-tailed. Cases are closed once their
+    resolution time has passed.
 
     Args:
-        fake (faker.proxy.Faker): Faker object
         number_of_cases (int): Amount of fake cases to generate
-        accounts (list): Fake companies to assign cases to
-
-    Returns:
-        dict: A dictionary that contains fake cases
+        accounts (int): Number of fake accounts. Default: 10
+        engineers (int): Number of fake engineers. Default: 5
+        seed (int): Seed of the generator, the same seed generates the same
+            data. Default: 0
+        years (int): How far back cases are created. Default: 5
+
+    Yields:
+        dict: Section ('issues', 'bugs', 'cases', 'cards') -> (key, value)
+            of the records of a single case
     """
-    cases = {}
-    for _ in range(number_of_cases):
-        create_date = (
-            # 90% of cases "created" this decade, 10% "created" this week
-            fake.date_time_this_decade().replace(microsecond=0).isoformat() + "Z"
-            if fake.boolean(chance_of_getting_true=90)
-            else fake.date_time_between("-7d").replace(microsecond=0).isoformat() + "Z"
+    corpus = FakeCorpus(seed, accounts, engineers)
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    first = now - datetime.timedelta(days=365 * years)
+    last_week = now - datetime.timedelta(days=7)
+    recent = number_of_cases // 10
+    first_case = corpus.rng.randint(1000000, 9000000)
+    first_bug = corpus.rng.randint(100000, 900000)
+    next_bug = first_bug
+
+    for index in range(number_of_cases):
+        # creation dates increase with the case number
+        if index < number_of_cases - recent:
+            created = first + (last_week - first) * index / (number_of_cases - recent)
+        else:
+            position = index - number_of_cases + recent
+            created = last_week + (now - last_week) * position / max(recent, 1)
+        created = created.replace(microsecond=0)
+        case_number = f"{first_case + index:08d}"
+        records = {}
+
+        case = generate_fake_case(corpus, created, now)
+        records["cases"] = (case_number, case)
+        if corpus.chance(0.35):
+            bugs = generate_fake_bugs(corpus, case_number, created, now, next_bug)
+            next_bug += len(bugs)
+            records["bugs"] = (case_number, bugs)
+            case["bug"] = bugs[0]["bugzillaNumber"]
+        if corpus.chance(0.5):
+            records["issues"] = (
+                case_number,
+                generate_fake_issues(corpus, created, now),
+            )
+        card_key = f"{corpus.project}-{index + 1}"
+        records["cards"] = (
+            card_key,
+            generate_fake_card(
+                corpus,
+                case_number,
+                case,
+                records.get("bugs", (None, None))[1],
+                records.get("issues", (None, None))[1],
+                now,
+            ),
         )
-        entry = {
-            str(fake.random_number(8)): {
-                "account": fake.random_element(accounts),
-                "createdate": create_date,
-                "description": fake.paragraph(),
-                # last_update must be after createdate
-                "last_update": fake.date_time_between(
-                    start_date=datetime.datetime.strptime(
-                        create_date, "%Y-%m-%dT%H:%M:%SZ"
-                    )
-                )
-                .replace(microsecond=0)
-                .isoformat()
-                + "Z",
-                "owner": fake.name(),
-                "problem": fake.sentence(),
-                "product": f"{fake.word()} {fake.numerify('#.#')}",  # Ex: Word 4.5
-                "severity": fake.random_element(
-                    ["1 (Urgent)", "2 (High)", "3 (Normal)", "4 (Low)"]
-                ),
-                "status": fake.random_element(
-                    ["Waiting on Red Hat", "Closed", "Waiting on Customer"]
-                ),
-            }
-        }
-
-        # Handle values that may not be present in case
-        for case in entry:
-            if fake.boolean():
-                entry[case]["bug"] = str(fake.random_number(7))  # ex: 1234567
-            if fake.boolean():
-                # list of words that is any length from 0 to 3 inclusive
-                entry[case]["tags"] = [
-                    fake.word() for _ in range(fake.random_int(0, 3))
-                ]
-            if entry[case]["status"] == "Closed":
-                # closeddate must be after the createdate
-                entry[case]["closeddate"] = (
-                    fake.date_time_between(
-                        start_date=datetime.datetime.strptime(
-                            entry[case]["createdate"], "%Y-%m-%dT%H:%M:%SZ"
-                        )
-                    )
-                    .replace(microsecond=0)
-                    .isoformat()
-                    + "Z"
-                )
-        cases.update(entry)
-    return cases
+        yield records
 
 
-def generate_fake_private_keywords(fake):
-    """Generate fake private_keywords for use in development environments
+def generate_fake_case(corpus, created, now):
+    """Generate a fake portal case
 
     Args:
-        fake (faker.proxy.Faker): Faker object
+        corpus (FakeCorpus): Pools and distributions to draw from
+        created (datetime.datetime): Creation date of the case
+        now (datetime.datetime): Current date
 
     Returns:
-        list | None: Fake private keywords or None
+        dict: Fake case, with its relief and resolution dates under the
+            private '_relief_at' and '_resolved_at' keys
     """
-    option = fake.random_element([1, 2, 3])
-
-    if option == 1:
-        return [fake.word(), f"Telco:Priority-{fake.random_int(1, 4)}"]
-    elif option == 2:
-        return [fake.word(), fake.word()]
-    else:
-        return None
+    severity = corpus.severity()
+    name = severity.split("(")[1].rstrip(")")
+    relief_at = created + corpus.duration(relief_days[name])
+    resolved_at = relief_at + corpus.duration(resolve_days[name])
+    closed = resolved_at < now
+    product = corpus.choice(corpus.products)
+    case = {
+        "account": corpus.account(),
+        "createdate": _portal_time(created),
+        "description": corpus.choice(corpus.paragraphs),
+        "last_update": _portal_time(
+            corpus.between(created, resolved_at if closed else now)
+        ),
+        "owner": corpus.choice(corpus.names),
+        "problem": corpus.choice(corpus.sentences),
+        "product": product,
+        "product_version": product.split()[-1],
+        "severity": severity,
+        "status": "Closed" if closed else corpus.choice(open_statuses),
+        "_relief_at": relief_at if relief_at < now else None,
+        "_resolved_at": resolved_at if closed else None,
+    }
+    if corpus.chance(0.5):
+        case["tags"] = [corpus.choice(corpus.words) for _ in range(corpus.count(1, 5))]
+    if closed:
+        case["closeddate"] = _portal_time(resolved_at)
+    return case
 
 
-def generate_fake_issues(fake, private_keywords):
+def generate_fake_issues(corpus, created, now):
     """Generate fake Jira issues for a specific portal case
 
     Args:
-        fake (faker.proxy.Faker): Faker object
-        private_keywords (list | None): Private keywords generated by
-            generate_fake_private_keywords()
+        corpus (FakeCorpus): Pools and distributions to draw from
+        created (datetime.datetime): Creation date of the case
+        now (datetime.datetime): Current date
 
     Returns:
         list: Fake Jira issues for a specific case
     """
+    option = corpus.rng.randint(1, 3)
+    if option == 1:
+        private_keywords = [
+            corpus.choice(corpus.words),
+            f"Telco:Priority-{corpus.rng.randint(1, 4)}",
+        ]
+    elif option == 2:
+        private_keywords = [corpus.choice(corpus.words), corpus.choice(corpus.words)]
+    else:
+        private_keywords = None
+
     case_issues = []
-    for _ in range(fake.random_int(1, 5)):
-        issue = {
-            "assignee": fake.safe_email() if fake.boolean() else None,
-            "fix_versions": (
-                # ex: [Word-4.56] or ["---"] or None
-                [f"{fake.word()}-{fake.numerify('#.##')}" if fake.boolean() else "---"]
-                if fake.boolean()
-                else None
-            ),
-            "id": fake.random_number(6),  # ex: 123456
-            "jira_severity": (
-                fake.random_element(
-                    ["Critical", "Important", "Moderate", "Low", "Informational"]
-                )
-                if fake.boolean()
-                else None
-            ),
-            "jira_type": (
-                fake.random_element(["Feature Request", "Bug"])
-                if fake.boolean()
-                else None
-            ),
-            "priority": (
-                fake.random_element(
+    for _ in range(1 + corpus.count(1, 20)):
+        case_issues.append(
+            {
+                "assignee": (
+                    corpus.choice(corpus.emails) if corpus.chance(0.5) else None
+                ),
+                "fix_versions": (
+                    [f"{corpus.choice(corpus.words)}-{corpus.rng.randint(1, 9)}.1"]
+                    if corpus.chance(0.5)
+                    else None
+                ),
+                "id": f"{corpus.choice(issue_projects)}-{corpus.rng.randint(1, 99999)}",
+                "jira_severity": corpus.choice(
+                    ["Critical", "Important", "Moderate", "Low", "Informational", None]
+                ),
+                "jira_type": corpus.choice(["Feature Request", "Bug", None]),
+                "priority": corpus.choice(
                     ["Major", "Minor", "Normal", "Blocker", "Critical", "Undefined"]
-                )
-                if fake.boolean()
-                else None
-            ),
-            "private_keywords": private_keywords,
-            "qa_contact": fake.safe_email() if fake.boolean() else None,
-            "status": fake.random_element(
-                [
-                    "New",
-                    "ASSIGNED",
-                    "POST",
-                    "ON_QA",
-                    "Verified",
-                    "Release Pending",
-                    "Closed",
-                    "MODIFIED",
-                ]
-            ),
-            "title": fake.sentence(),
-            "updated": fake.date_time_this_decade().isoformat(),
-            "url": f"https://{fake.safe_domain_name()}",
-        }
-        case_issues.append(issue)
+                ),
+                "private_keywords": private_keywords,
+                "qa_contact": (
+                    corpus.choice(corpus.emails) if corpus.chance(0.5) else None
+                ),
+                "status": corpus.choice(
+                    [
+                        "New",
+                        "ASSIGNED",
+                        "POST",
+                        "ON_QA",
+                        "Verified",
+                        "Release Pending",
+                        "Closed",
+                        "MODIFIED",
+                    ]
+                ),
+                "title": corpus.choice(corpus.sentences),
+                "updated": corpus.between(created, now).isoformat(),
+                "url": f"https://{corpus.choice(corpus.domains)}",
+            }
+        )
     return case_issues
 
 
-def generate_fake_bugs(fake, case):
+def generate_fake_bugs(corpus, case_number, created, now, first_bug):
     """Generate fake Bugzilla bugs for a specific case
 
     Args:
-        fake (faker.proxy.Faker): Faker object
-        case (str): ID of fake case generated earlier
+        corpus (FakeCorpus): Pools and distributions to draw from
+        case_number (str): Number of the case
+        created (datetime.datetime): Creation date of the case
+        now (datetime.datetime): Current date
+        first_bug (int): Number of the first bug, bug numbers are unique
 
     Returns:
         list: Fake Bugzilla bugs for a specific case
     """
     case_bugs = []
-    for _ in range(fake.random_int(1, 5)):
-        bugzilla_number = str(fake.random_number(6))
-
-        bug = {
-            "bugzillaLink": (
-                f"https://{fake.safe_domain_name()}"
-                f"/show_bug.cgi?id={bugzilla_number}"
-            ),
-            "bugzillaNumber": bugzilla_number,
-            "caseNumber": case,
-            "linkedAt": fake.date_time_this_decade().isoformat() + "Z",
-            "status": fake.random_element(
-                [
-                    "POST",
-                    "MODIFIED",
-                    "ON_DEV",
-                    "ON_QA",
-                    "VERIFIED",
-                    "RELEASE_PENDING",
-                    "ASSIGNED",
-                    "CLOSED",
-                ]
-            ),
-            "summary": fake.sentence(),
-            "target_release": [fake.numerify(text="#.#z") if fake.boolean else "---"],
-            "assignee": fake.safe_email(),
-            "last_change_time": fake.date_time_this_decade().isoformat(),
-            "internal_whiteboard": fake.word(),
-            "qa_contact": fake.safe_email(),
-            "severity": fake.random_element(
-                ["low", "medium", "high", "urgent", "unspecified"]
-            ),
-        }
-        case_bugs.append(bug)
+    for number in range(first_bug, first_bug + 1 + corpus.count(1, 20)):
+        domain = corpus.choice(corpus.domains)
+        case_bugs.append(
+            {
+                "bugzillaLink": f"https://{domain}/show_bug.cgi?id={number}",
+                "bugzillaNumber": str(number),
+                "caseNumber": case_number,
+                "linkedAt": _portal_time(corpus.between(created, now)),
+                "status": corpus.choice(
+                    [
+                        "POST",
+                        "MODIFIED",
+                        "ON_DEV",
+                        "ON_QA",
+                        "VERIFIED",
+                        "RELEASE_PENDING",
+                        "ASSIGNED",
+                        "CLOSED",
+                    ]
+                ),
+                "summary": corpus.choice(corpus.sentences),
+                "target_release": [
+                    f"4.{corpus.rng.randint(1, 18)}z" if corpus.chance(0.5) else "---"
+                ],
+                "assignee": corpus.choice(corpus.emails),
+                "last_change_time": corpus.between(created, now).isoformat(),
+                "internal_whiteboard": corpus.choice(corpus.words),
+                "qa_contact": corpus.choice(corpus.emails),
+                "severity": corpus.choice(
+                    ["low", "medium", "high", "urgent", "unspecified"]
+                ),
+            }
+        )
     return case_bugs
 
 
-def generate_fake_card(fake, engineers, bugs, issues, case_number, case_details):
-    """Generate fake T5G cards using previously generated fake data.
+def generate_fake_comment(corpus):
+    """Generate the body of a fake Jira comment
+
+    A fifth of the comments link to a bug or a must-gather, as plain URLs or
+    in Jira's [text|url] syntax.
 
     Args:
-        fake (faker.proxy.Faker): Faker object
-        engineers (list): Pool of fakepod engineers to assign to card
-        bugs (dict): All fake bugs that have been generated
-        issues (dict): All fake Jira issues that have been generated
-        case_number (int): ID of fake case to create card for
-        case_details (dict): Details of fake case to create card for
+        corpus (FakeCorpus): Pools and distributions to draw from
+
+    Returns:
+        str: Body of the comment
+    """
+    body = corpus.choice(corpus.paragraphs)
+    if corpus.chance(0.2):
+        url = f"https://{corpus.choice(corpus.domains)}/{corpus.choice(corpus.words)}"
+        if corpus.chance(0.5):
+            body += f" See {url}"
+        else:
+            body += f" [{corpus.choice(corpus.words)}|{url}]"
+    return body
+
+
+def generate_fake_card(corpus, case_number, case, bugs, issues, now):
+    """Generate a fake T5G card for a case
+
+    Args:
+        corpus (FakeCorpus): Pools and distributions to draw from
+        case_number (str): Number of the case
+        case (dict): Fake case generated by generate_fake_case(); its private
+            '_relief_at' and '_resolved_at' keys are removed
+        bugs (list | None): Fake bugs of the case
+        issues (list | None): Fake Jira issues of the case
+        now (datetime.datetime): Current date
 
     Returns:
         dict: Fake T5G Card intended to mimic production data
     """
-    time_now = datetime.datetime.now(datetime.timezone.utc)
-
-    card = {
-        # ex: TEST-1234
-        fake.bothify("????-####").upper(): {
-            "account": case_details["account"],
-            "assignee": (
-                fake.random_element(engineers)
-                if fake.boolean(chance_of_getting_true=95)
-                else {"displayName": None, "accountId": None, "emailAddress": None}
-            ),
-            "bugzilla": bugs.get(case_number),
-            "card_created": fake.date_time_this_decade().isoformat() + ".000+0000",
-            "card_status": fake.random_element(
-                [
-                    "Eng Working",
-                    "Backlog",
-                    "Debugging",
-                    "Backport",
-                    "Ready To Close",
-                    "Done",
-                ]
-            ),
-            "case_created": case_details["createdate"],
-            "case_days_open": (  # Calculate number of days since "createdate"
-                time_now.replace(tzinfo=None)
-                - datetime.datetime.strptime(
-                    case_details["createdate"], "%Y-%m-%dT%H:%M:%SZ"
-                )
-            ).days,
-            "case_number": case_number,
-            "case_status": case_details["status"],
-            # Convert last_update to correct format
-            "case_updated_date": datetime.datetime.strftime(
-                datetime.datetime.strptime(
-                    case_details["last_update"], "%Y-%m-%dT%H:%M:%SZ"
-                ),
-                "%Y-%m-%d %H:%M",
-            ),
-            "comments": [
-                (
-                    fake.paragraph(),
-                    fake.date_time_this_decade().isoformat() + "Z",
-                )
-                for _ in range(fake.random_int(0, 5))
-            ],
-            "contributor": (
-                [
-                    {
-                        "displayName": fake.name(),
-                        "accountId": fake.uuid4(),
-                        "emailAddress": fake.safe_email(),
-                    }
-                    for _ in range(fake.random_int(0, 3))
-                ]
-            ),
-            "crit_sit": fake.boolean(),
-            "daily_telco": fake.boolean(),
-            "description": case_details["description"],
-            "escalated": fake.boolean(),
-            "escalated_link": (
-                f"https://{fake.safe_domain_name()}" if fake.boolean() else None
-            ),
-            "group_name": fake.word() if fake.boolean() else None,
-            "issues": issues.get(case_number),
-            "labels": [fake.word() for _ in range(fake.random_int(1, 3))],
-            "notified_users": [
-                {"ssoUsername": fake.safe_email(), "title": fake.name()}
-                for _ in range(fake.random_int(0, 2))
-            ],
-            "potential_escalation": fake.boolean(),
-            "priority": fake.random_element(["Major", "Minor"]),
-            "product": case_details["product"],
-            "relief_at": (  # relief_at must be after createdate
-                fake.date_time_between(
-                    start_date=datetime.datetime.strptime(
-                        case_details["createdate"], "%Y-%m-%dT%H:%M:%SZ"
-                    )
-                )
-                .replace(microsecond=0)
-                .isoformat()
-                + "Z"
-                if fake.boolean()
-                else None
-            ),
-            "resolved_at": (  # resolved_at must be after createdate
-                fake.date_time_between(
-                    start_date=datetime.datetime.strptime(
-                        case_details["createdate"], "%Y-%m-%dT%H:%M:%SZ"
-                    )
-                )
-                .replace(microsecond=0)
-                .isoformat()
-                + "Z"
-                if fake.boolean()
-                else None
-            ),
-            "severity": re.search(r"[a-zA-Z]+", case_details["severity"]).group(),
-            "summary": case_details["problem"],
-            "tags": case_details.get("tags", []),
-        }
+    created = datetime.datetime.strptime(case["createdate"], "%Y-%m-%dT%H:%M:%SZ")
+    relief_at = case.pop("_relief_at")
+    resolved_at = case.pop("_resolved_at")
+    closed = resolved_at is not None
+    # comments are sorted, most cards have a few and some have hundreds
+    comment_times = sorted(
+        corpus.between(created, resolved_at or now) for _ in range(corpus.count(4, 300))
+    )
+    return {
+        "account": case["account"],
+        "assignee": (
+            corpus.engineer()
+            if corpus.chance(0.95)
+            else {"displayName": None, "accountId": None, "emailAddress": None}
+        ),
+        "bugzilla": bugs,
+        "card_created": _jira_time(created),
+        "card_status": (
+            "Done" if closed and corpus.chance(0.9) else corpus.choice(card_statuses)
+        ),
+        "case_created": case["createdate"],
+        "case_days_open": (now - created).days,
+        "case_number": case_number,
+        "case_status": case["status"],
+        "case_updated_date": datetime.datetime.strptime(
+            case["last_update"], "%Y-%m-%dT%H:%M:%SZ"
+        ).strftime("%Y-%m-%d %H:%M"),
+        "comments": [
+            (generate_fake_comment(corpus), _jira_time(timestamp))
+            for timestamp in comment_times
+        ],
+        "contributor": [
+            {
+                "displayName": corpus.choice(corpus.names),
+                "accountId": corpus.fake.uuid4(),
+                "emailAddress": corpus.choice(corpus.emails),
+            }
+            for _ in range(corpus.rng.randint(0, 3))
+        ],
+        "crit_sit": corpus.chance(0.05),
+        "daily_telco": corpus.chance(0.1),
+        "description": case["description"],
+        "escalated": corpus.chance(0.1),
+        "escalated_link": (
+            f"https://{corpus.choice(corpus.domains)}" if corpus.chance(0.1) else None
+        ),
+        "group_name": corpus.choice(corpus.words) if corpus.chance(0.5) else None,
+        "issues": issues,
+        "labels": [
+            corpus.choice(corpus.words) for _ in range(corpus.rng.randint(1, 3))
+        ],
+        "notified_users": [
+            {
+                "ssoUsername": corpus.choice(corpus.emails),
+                "title": corpus.choice(corpus.names),
+            }
+            for _ in range(corpus.rng.randint(0, 2))
+        ],
+        "potential_escalation": corpus.chance(0.1),
+        "priority": corpus.choice(["Major", "Minor"]),
+        "product": case["product"],
+        "relief_at": _portal_time(relief_at) if relief_at else None,
+        "resolved_at": _portal_time(resolved_at) if closed else None,
+        "severity": case["severity"].split("(")[1].rstrip(")"),
+        "summary": case["problem"],
+        "tags": case.get("tags", []),
     }
-    return card
+
+
+def generate_fake_data(number_of_cases, **options):
+    """Generate fake data for use in development environments
+
+    Args:
+        number_of_cases (int): Amount of fake cases to generate
+        **options: Options of generate_fake_records()
+
+    Returns:
+        dict: A dictionary containing fake cases, issues, bugs, and cards
+    """
+    data = {section: {} for section in sections}
+    for records in generate_fake_records(number_of_cases, **options):
+        for section, (key, value) in records.items():
+            data[section][key] = value
+    return data
+
+
+def write_fake_data(records, path):
+    """Stream fake records to a JSON file
+
+    Each section is written to a temporary file as records are generated and
+    the sections are then concatenated, so memory use doesn't grow with the
+    number of cases. The output has the same layout as generate_fake_data().
+
+    Args:
+        records (iterable): Records yielded by generate_fake_records()
+        path (str): Path of the JSON file
+
+    Returns:
+        dict: Number of records written per section
+    """
+    counts = dict.fromkeys(sections, 0)
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        parts = {
+            section: open(os.path.join(tmp, section), "w+", encoding="utf8")
+            for section in sections
+        }
+        try:
+            for record in records:
+                for section, (key, value) in record.items():
+                    separator = "," if counts[section] else ""
+                    parts[section].write(
+                        f"{separator}{json.dumps(key)}:"
+                        f"{json.dumps(value, ensure_ascii=False)}"
+                    )
+                    counts[section] += 1
+            with open(path, "w", encoding="utf8") as json_file:
+                for index, section in enumerate(sections):
+                    json_file.write(("{" if index == 0 else "},") + f'"{section}":{{')
+                    parts[section].seek(0)
+                    shutil.copyfileobj(parts[section], json_file)
+                json_file.write("}}")
+        finally:
+            for part in parts.values():
+                part.close()
+    return counts
 
 
 def main():
-    """Parse arguments, generate fake data, and dump to JSON."""
+    """Parse arguments, generate fake data, dump it to JSON and load it"""
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-n",
@@ -389,11 +525,48 @@ def main():
         ),
         default="../dashboard/src/data/fake_data.json",
     )
+    parser.add_argument(
+        "--accounts", type=int, default=10, help="number of accounts. Default: 10"
+    )
+    parser.add_argument(
+        "--engineers", type=int, default=5, help="number of engineers. Default: 5"
+    )
+    parser.add_argument(
+        "--years",
+        type=int,
+        default=5,
+        help="how far back cases are created, in years. Default: 5",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed. Default: 0")
+    parser.add_argument(
+        "--load",
+        action="store_true",
+        help="load the generated data into Redis, as 'flask load-fake-data' does",
+    )
+    parser.add_argument(
+        "--postgres",
+        action="store_true",
+        help="with --load, also load the cases and cards into PostgreSQL",
+    )
     args = parser.parse_args()
-    fake_data = generate_fake_data(args.number_of_cases)
-    with open(f"{args.output}", "w", encoding="utf8") as json_file:
-        json.dump(fake_data, json_file, ensure_ascii=False)
-    print(f"dumped fake data to {args.output}")
+    records = generate_fake_records(
+        args.number_of_cases,
+        accounts=args.accounts,
+        engineers=args.engineers,
+        seed=args.seed,
+        years=args.years,
+    )
+    counts = write_fake_data(records, args.output)
+    print(f"dumped fake data to {args.output}: {counts}")
+
+    if args.load:
+        sys.path.insert(
+            0, os.path.join(os.path.dirname(__file__), "..", "dashboard", "src")
+        )
+        from t5gweb.t5gweb import load_fake_data
+
+        load_fake_data(args.output, postgres=args.postgres)
+        print("loaded fake data")
 
 
 if __name__ == "__main__":
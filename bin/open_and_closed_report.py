@@ -10,20 +10,39 @@ import sys
 import requests
 
 
+def get_cases(api_url, updated_since):
+    """
+    Fetch every page of the cases updated since a given date
+    """
+    cases = {}
+    params = {
+        "updated_since": updated_since.isoformat(),
+        "fields": "status,problem,createdate,last_update,tags",
+        "limit": 1000,
+    }
+    while True:
+        response = requests.get("{}/api/cases".format(api_url), params=params)
+        if response.status_code != 200:
+            print("could not retrieve cases: {}".format(response.status_code))
+            sys.exit(1)
+        page = response.json()
+        cases.update(page["items"])
+        if page["next_cursor"] is None:
+            return cases
+        params["cursor"] = page["next_cursor"]
+
+
 def case_report(api_url, case_tag):
     """
     Checks for newly opened and closed cases for a given tag
     """
-    cases = requests.get("{}/api/cases/{}".format(api_url, case_tag))
-    if cases.status_code == 200:
-        cases = cases.json()
-    else:
-        print("could not retrieve cases: {}".format(cases.status_code))
-        sys.exit(1)
-
     today = datetime.date.today()
     age = 7
 
+    # cases opened or closed within the window were also updated within it
+    updated = get_cases(api_url, today - datetime.timedelta(days=age))
+    cases = {c: d for (c, d) in updated.items() if case_tag in d.get("tags", [])}
+
     closed_cases = {
         c: d
         for (c, d) in cases.items()
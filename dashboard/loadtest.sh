@@ -0,0 +1,31 @@
+#!/bin/bash
+# Load test the dashboard UI on synthetic data in the compose stack
+#
+# Usage: ./loadtest.sh [benchmarks.loadtest options], e.g.
+#   CASES=50000 ./loadtest.sh --users 40 --duration 300 --json /srv/after.json
+#
+# Environment:
+#   COMPOSE               compose command (default: podman-compose)
+#   CASES                 number of synthetic cases (default: 20000)
+#   T5G_LOADTEST_WORKERS  gunicorn workers of the UI (default: 4)
+#
+# The data is generated on the host (needs Faker) and seeded, so runs with
+# the same CASES serve the same data. The load test runs in the UI
+# container, where it can read the RSS of the gunicorn workers.
+set -euo pipefail
+cd "$(dirname "$0")"
+
+COMPOSE="${COMPOSE:-podman-compose} -f docker-compose.yml -f docker-compose.loadtest.yml"
+CASES=${CASES:-20000}
+DATA=data/loadtest_${CASES}.json
+
+if [ ! -f "src/${DATA}" ]; then
+    python3 ../bin/generate_fake_data.py -n "${CASES}" --seed 1 -o "src/${DATA}"
+fi
+${COMPOSE} up -d redis postgresql dashboard-ui
+until ${COMPOSE} exec -T dashboard-ui python3 -c \
+    "import socket; socket.create_connection(('localhost', 8080))" 2>/dev/null; do
+    sleep 2
+done
+${COMPOSE} exec -T dashboard-ui flask load-fake-data "${DATA}"
+${COMPOSE} exec -T dashboard-ui python3 -m benchmarks.loadtest http://localhost:8080 "$@"
@@ -0,0 +1,173 @@
+import datetime
+import json
+
+import pytest
+
+from t5gweb import cache, libtelco5g
+from t5gweb.records import build_records
+from t5gweb.snapshots import Snapshot, write_snapshot
+from t5gweb.t5gweb import fake_jira_issue
+from t5gweb.utils import (
+    build_cfg,
+    comment_key,
+    format_comment,
+    format_date,
+    parse_timestamp,
+    reload_cfg,
+    set_cfg,
+)
+
+cfg = {"jira_escalations_project": "ESCALATE"}
+
+
+@pytest.fixture(scope="module")
+def jira_issues(corpus):
+    """Cards of the corpus as the JIRA issues get_cards() builds them from"""
+    return [fake_jira_issue(key, card) for key, card in corpus["cards"].items()]
+
+
+@pytest.fixture(scope="module")
+def details(corpus):
+    """Case details of the corpus, as cached by get_case_details()"""
+    fields = ("crit_sit", "group_name", "notified_users", "relief_at", "resolved_at")
+    return {
+        card["case_number"]: {field: card[field] for field in fields}
+        for card in corpus["cards"].values()
+    }
+
+
+@pytest.mark.benchmark(group="build_card_data")
+@pytest.mark.parametrize("comments", ["new", "cached"])
+def bench_build_card_data(benchmark, corpus, jira_issues, details, comments):
+    escalations = [c["case_number"] for c in corpus["cards"].values() if c["escalated"]]
+    time_now = datetime.datetime.now(datetime.timezone.utc)
+    # bodies formatted by the previous refresh, see cache.get_cards()
+    formatted = {
+        comment_key(comment): format_comment(comment)
+        for issue in jira_issues
+        for comment in issue.fields.comment.comments
+    }
+
+    def build_cards():
+        cached = dict(formatted) if comments == "cached" else None
+        return [
+            cache._build_card_data(
+                issue,
+                corpus["cases"],
+                corpus["bugs"],
+                corpus["issues"],
+                escalations,
+                details,
+                time_now,
+                cfg,
+                cached,
+            )
+            for issue in jira_issues
+        ]
+
+    cards = benchmark.pedantic(build_cards, rounds=5)
+    assert None not in cards
+
+
+@pytest.mark.benchmark(group="format_comment")
+def bench_format_comment(benchmark, jira_issues):
+    comments = [c for issue in jira_issues for c in issue.fields.comment.comments]
+
+    bodies = benchmark(lambda: [format_comment(comment) for comment in comments])
+    assert any("target='_blank'" in body for body in bodies)
+
+
+@pytest.fixture(scope="module")
+def dates(corpus):
+    """Case dates and comment timestamps of the corpus"""
+    case_dates = [
+        case[field]
+        for case in corpus["cases"].values()
+        for field in ("createdate", "last_update", "closeddate")
+        if case.get(field)
+    ]
+    timestamps = [t for card in corpus["cards"].values() for _, t in card["comments"]]
+    return case_dates, timestamps
+
+
+@pytest.mark.benchmark(group="parse_dates")
+@pytest.mark.parametrize("parser", ["strptime", "first_call", "cached"])
+def bench_parse_dates(benchmark, dates, parser):
+    case_dates, timestamps = dates
+
+    def parse():
+        if parser == "strptime":
+            return [
+                datetime.datetime.strptime(d, "%Y-%m-%dT%H:%M:%SZ") for d in case_dates
+            ], [
+                datetime.datetime.strptime(t, "%Y-%m-%dT%H:%M:%S.%f%z")
+                for t in timestamps
+            ]
+        if parser == "first_call":
+            format_date.cache_clear()
+            parse_timestamp.cache_clear()
+        return [format_date(d) for d in case_dates], [
+            parse_timestamp(t) for t in timestamps
+        ]
+
+    parsed_dates, parsed_timestamps = benchmark(parse)
+    assert len(parsed_dates) == len(case_dates)
+    assert len(parsed_timestamps) == len(timestamps)
+
+
+@pytest.fixture
+def team_env(monkeypatch):
+    """Team and SLA settings in the environment, like a deployment has them"""
+    team = [
+        {"name": "Engineer {}".format(i), "user": "user{}".format(i), "active": "true"}
+        for i in range(30)
+    ]
+    sla_settings = {
+        "days": {"Urgent": 14, "High": 20, "Normal": 90, "Low": 180},
+        "partners": ["Partner {}".format(i) for i in range(20)],
+    }
+    monkeypatch.setenv("team", json.dumps(team))
+    monkeypatch.setenv("sla_settings", json.dumps(sla_settings))
+    yield reload_cfg()
+    monkeypatch.undo()
+    reload_cfg()
+
+
+@pytest.mark.usefixtures("team_env")
+@pytest.mark.benchmark(group="set_cfg")
+@pytest.mark.parametrize("config", ["build", "cached"])
+def bench_set_cfg(benchmark, config):
+    # build_cfg() is what every set_cfg() call used to do
+    cfg = benchmark(build_cfg if config == "build" else set_cfg)
+    assert len(cfg["team"]) == 30
+
+
+@pytest.mark.usefixtures("redis_cache")
+@pytest.mark.benchmark(group="redis_get")
+@pytest.mark.parametrize("key", ["cards", "cases", "bugs", "issues"])
+def bench_redis_get(benchmark, corpus, key):
+    data = benchmark(libtelco5g.redis_get, key)
+    assert len(data) == len(corpus[key])
+
+
+@pytest.mark.benchmark(group="records")
+@pytest.mark.parametrize("key", ["cards", "cases"])
+def bench_build_records(benchmark, corpus, key):
+    records = benchmark.pedantic(
+        build_records, (corpus[key], libtelco5g.record_classes[key]), rounds=5
+    )
+    assert len(records) == len(corpus[key])
+
+
+@pytest.mark.benchmark(group="records")
+def bench_write_snapshot(benchmark, corpus, tmp_path):
+    path = str(tmp_path / "cards.snapshot")
+    benchmark.pedantic(write_snapshot, (path, corpus["cards"]), rounds=5)
+    assert len(Snapshot(path)) == len(corpus["cards"])
+
+
+@pytest.mark.usefixtures("redis_cache")
+@pytest.mark.benchmark(group="records")
+def bench_get_records(benchmark, corpus):
+    records = benchmark(libtelco5g.get_records, "cards")
+    assert len(records) == len(corpus["cards"])
@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import func, select
+
+from t5gweb.database import (
+    Base,
+    Case,
+    JiraCard,
+    JiraComment,
+    load_cases_postgres,
+    load_jira_card_postgres,
+)
+from t5gweb.t5gweb import fake_jira_issue
+
+# the loaders run queries per case, card and comment: a sample of the corpus
+# keeps the rounds short
+sample_size = 1000
+
+
+@pytest.fixture(scope="module")
+def sample(corpus):
+    cards = dict(list(corpus["cards"].items())[:sample_size])
+    cases = {
+        c["case_number"]: corpus["cases"][c["case_number"]] for c in cards.values()
+    }
+    return cases, cards
+
+
+@pytest.mark.benchmark(group="postgres")
+def bench_load_cases_postgres(benchmark, database, sample):
+    cases, _ = sample
+
+    def reset():
+        Base.metadata.drop_all(database)
+        Base.metadata.create_all(database)
+
+    benchmark.pedantic(load_cases_postgres, args=(cases,), setup=reset, rounds=5)
+    with database.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Case)) == len(cases)
+
+
+@pytest.mark.benchmark(group="postgres")
+def bench_load_jira_card_postgres(benchmark, database, sample):
+    cases, cards = sample
+    load_cases_postgres(cases)
+    issues = [fake_jira_issue(key, card) for key, card in cards.items()]
+
+    tables = [JiraCard.__table__, JiraComment.__table__]
+
+    def reset():
+        Base.metadata.drop_all(database, tables=tables)
+        Base.metadata.create_all(database, tables=tables)
+
+    def load_cards():
+        for key, issue in zip(cards, issues):
+            load_jira_card_postgres(cases, cards[key]["case_number"], issue)
+
+    benchmark.pedantic(load_cards, setup=reset, rounds=3)
+    with database.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(JiraCard)) == len(
+            cards
+        )
+        assert connection.scalar(select(func.count()).select_from(JiraComment))
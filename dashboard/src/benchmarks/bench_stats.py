@@ -0,0 +1,41 @@
+import pytest
+
+from t5gweb import libtelco5g
+
+pytestmark = pytest.mark.usefixtures("redis_cache")
+
+
+@pytest.mark.benchmark(group="generate_stats")
+def bench_generate_stats(benchmark):
+    stats = benchmark(libtelco5g.generate_stats)
+    assert sum(stats["by_severity"].values()) > 0
+
+
+@pytest.mark.benchmark(group="generate_stats")
+def bench_generate_stats_account(benchmark, top_account):
+    stats = benchmark(libtelco5g.generate_stats, account=top_account)
+    assert list(stats["by_customer"]) in ([top_account], [])
+
+
+@pytest.mark.benchmark(group="generate_stats")
+def bench_generate_stats_engineer(benchmark, top_engineer):
+    stats = benchmark(libtelco5g.generate_stats, engineer=top_engineer)
+    assert set(stats["by_engineer"]) <= {top_engineer}
+
+
+@pytest.mark.benchmark(group="generate_histogram_stats")
+def bench_generate_histogram_stats(benchmark):
+    histograms = benchmark(libtelco5g.generate_histogram_stats)
+    assert set(histograms) == {"Resolved", "Relief"}
+
+
+@pytest.mark.benchmark(group="generate_histogram_stats")
+def bench_generate_histogram_stats_account(benchmark, top_account):
+    histograms = benchmark(libtelco5g.generate_histogram_stats, account=top_account)
+    assert set(histograms) == {"Resolved", "Relief"}
+
+
+@pytest.mark.benchmark(group="plot_stats")
+def bench_plot_stats(benchmark):
+    x_values, y_values = benchmark(libtelco5g.plot_stats)
+    assert len(x_values) == len(y_values["open_cases"]) == 365
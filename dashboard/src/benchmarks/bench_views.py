@@ -0,0 +1,49 @@
+import pytest
+
+from t5gweb import t5gweb
+
+
+@pytest.fixture(params=["dicts", "records", "snapshot"])
+def cards(request, corpus):
+    if request.param == "records":
+        return request.getfixturevalue("card_records")
+    if request.param == "snapshot":
+        return request.getfixturevalue("card_snapshot")
+    return corpus["cards"]
+
+
+@pytest.mark.benchmark(group="get_new_comments")
+def bench_get_new_comments(benchmark, cards):
+    accounts = benchmark(t5gweb.get_new_comments, cards)
+    assert accounts
+
+
+@pytest.mark.benchmark(group="get_new_comments")
+def bench_get_new_comments_all(benchmark, cards):
+    accounts = benchmark(t5gweb.get_new_comments, cards, new_comments_only=False)
+    assert len(accounts) > 1
+
+
+@pytest.mark.benchmark(group="get_new_comments")
+def bench_get_new_comments_account(benchmark, cards, top_account):
+    accounts = benchmark(
+        t5gweb.get_new_comments, cards, new_comments_only=False, account=top_account
+    )
+    assert list(accounts) == [top_account]
+
+
+@pytest.mark.benchmark(group="organize_cards")
+def bench_organize_cards(benchmark, corpus):
+    cards = corpus["cards"]
+    account_list = sorted(card["account"] for card in cards.values())
+    accounts = benchmark(t5gweb.organize_cards, cards, account_list)
+    assert sum(len(s) for a in accounts.values() for s in a.values()) == len(cards)
+
+
+@pytest.mark.usefixtures("redis_cache")
+@pytest.mark.benchmark(group="get_card_view")
+@pytest.mark.parametrize("view", ["recent", "all", "trends"])
+def bench_get_card_view(benchmark, view):
+    accounts = benchmark(t5gweb.get_card_view, view)
+    # built by the first round, looked up by the others
+    assert t5gweb.get_card_view(view) is accounts
@@ -0,0 +1,127 @@
+"""
+Shared fixtures of the t5gweb benchmarks
+"""
+
+import json
+import logging
+import os
+import sys
+from collections import Counter
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from t5gweb.database import Base
+from t5gweb.records import Card, build_records
+from t5gweb.snapshots import Snapshot, write_snapshot
+
+# the benchmarks need more than the tests, skip them when pytest runs
+# everything in an environment set up for the tests only
+pytest.importorskip("pytest_benchmark")
+pytest.importorskip("faker")
+fakeredis = pytest.importorskip("fakeredis")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "..", "bin"))
+from generate_fake_data import generate_fake_data  # noqa: E402
+
+# measure the code, not the log handlers: every cache read and write logs
+logging.disable(logging.WARNING)
+
+
+@pytest.fixture(scope="session")
+def corpus():
+    """Synthetic dataset the benchmarks run against
+
+    Generated by bin/generate_fake_data.py with t5g_bench_cases cases
+    (default: 5000), or read from the JSON file t5g_bench_data points to.
+    The generator is seeded, so the same number of cases always gives the
+    same data.
+    """
+    path = os.environ.get("t5g_bench_data")
+    if path:
+        with open(path, encoding="utf-8") as data:
+            return json.load(data)
+    number_of_cases = int(os.environ.get("t5g_bench_cases", 5000))
+    return generate_fake_data(
+        number_of_cases,
+        accounts=max(10, number_of_cases // 200),
+        engineers=max(5, number_of_cases // 500),
+    )
+
+
+@pytest.fixture(scope="session")
+def top_account(corpus):
+    """Account with the most cards"""
+    return Counter(c["account"] for c in corpus["cards"].values()).most_common(1)[0][0]
+
+
+@pytest.fixture(scope="session")
+def top_engineer(corpus):
+    """Engineer assigned the most cards"""
+    engineers = Counter(
+        c["assignee"]["displayName"]
+        for c in corpus["cards"].values()
+        if c["assignee"]["displayName"]
+    )
+    return engineers.most_common(1)[0][0]
+
+
+@pytest.fixture(scope="session")
+def redis_cache(corpus, tmp_path_factory):
+    """Fake Redis server holding the corpus like the refresh tasks store it
+
+    The 'stats' history holds a year of daily statistics. Every key has a
+    cache version, so the records of libtelco5g.get_records() are loaded
+    once, from a snapshot in a temporary directory.
+    """
+    server = fakeredis.FakeServer()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("t5g_snapshot_dir", str(tmp_path_factory.mktemp("cache")))
+        monkeypatch.setattr(
+            "redis.Redis", lambda *args, **kwargs: fakeredis.FakeRedis(server=server)
+        )
+        from t5gweb import libtelco5g
+
+        r_cache = fakeredis.FakeRedis(server=server)
+        for key, value in corpus.items():
+            r_cache.set(key, json.dumps(value))
+            r_cache.hset("cache_versions", key, 1)
+        escalations = [
+            c["case_number"] for c in corpus["cards"].values() if c["escalated"]
+        ]
+        r_cache.set("escalations", json.dumps(escalations))
+
+        stats = libtelco5g.generate_stats()
+        history = {"2025-{:03d}".format(day): stats for day in range(1, 366)}
+        r_cache.set("stats", json.dumps(history))
+        yield r_cache
+
+
+@pytest.fixture(scope="session")
+def card_records(corpus):
+    """Cards of the corpus as the compact records the views read"""
+    return build_records(corpus["cards"], Card)
+
+
+@pytest.fixture(scope="session")
+def card_snapshot(corpus, tmp_path_factory):
+    """Cards of the corpus in a memory-mapped snapshot"""
+    path = str(tmp_path_factory.mktemp("snapshots") / "cards.snapshot")
+    write_snapshot(path, corpus["cards"])
+    return Snapshot(path, Card.shared)
+
+
+@pytest.fixture
+def database():
+    """Empty in-memory SQLite database used by the PostgreSQL loaders"""
+    from t5gweb.database.session import db_config
+
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(db_config, "_engine", engine)
+        monkeypatch.setattr(db_config, "_session_local", session_local)
+        monkeypatch.setattr(db_config, "SessionLocal", session_local)
+        yield engine
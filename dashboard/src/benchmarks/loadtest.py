@@ -0,0 +1,400 @@
+"""loadtest.py: HTTP load test of the dashboard
+
+Virtual users browse the dashboard concurrently, each picking the next page
+from a weighted mix of the heavy views and waiting an exponentially
+distributed think time between pages. The users and their choices are
+seeded, so two runs against the same data send the same requests. Reports
+the p50/p95/p99 latency of every page and the resident memory (RSS) of the
+gunicorn workers, sampled from /proc while the test runs.
+
+Meant to run against the compose stack with synthetic data and the login
+disabled, see dashboard/loadtest.sh:
+    python -m benchmarks.loadtest http://localhost:8080 --users 20 --duration 120
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import ssl
+import time
+from collections import Counter, defaultdict
+from urllib.parse import quote, urlencode, urlparse
+
+# page -> weight, the share of the requests of the default mix
+default_mix = {
+    "home": 15,
+    "table_all": 10,
+    "table_data": 20,
+    "stats": 10,
+    "account": 20,
+    "engineer": 15,
+    "api_cards": 10,
+}
+
+
+def page_path(page, rng, accounts, engineers):
+    """Build the path of a page of the mix
+
+    Accounts and engineers are drawn weighted by their number of cards, so
+    the big accounts are looked at the most, as they are in production.
+
+    Args:
+        page: Page of the mix, see default_mix
+        rng: random.Random of the virtual user
+        accounts: Counter of cards per account
+        engineers: Counter of cards per engineer
+
+    Returns:
+        str: Path of the request
+    """
+    if page == "home":
+        return "/home"
+    if page == "table_all":
+        return "/table/all"
+    if page == "table_data":
+        # the request DataTables sends once /table/all is loaded
+        return "/table/data/all?" + urlencode(
+            {
+                "draw": 1,
+                "start": 0,
+                "length": 50,
+                "order[0][column]": 1,
+                "order[0][dir]": "asc",
+            }
+        )
+    if page == "stats":
+        return "/stats"
+    if page == "account":
+        account = rng.choices(list(accounts), weights=accounts.values())[0]
+        return "/account/" + quote(account, safe="")
+    if page == "engineer":
+        engineer = rng.choices(list(engineers), weights=engineers.values())[0]
+        return "/engineer/" + quote(engineer, safe="")
+    if page == "api_cards":
+        return "/api/cards"
+    raise ValueError("unknown page: {}".format(page))
+
+
+def parse_mix(value):
+    """Parse a mix given as 'page=weight,...'
+
+    Args:
+        value: e.g. 'home=1,stats=2'
+
+    Returns:
+        dict: page -> weight
+    """
+    mix = {}
+    for item in value.split(","):
+        page, _, weight = item.partition("=")
+        if page not in default_mix:
+            raise argparse.ArgumentTypeError("unknown page: {}".format(page))
+        mix[page] = float(weight or 1)
+    return mix
+
+
+def percentile(values, p):
+    """Nearest-rank percentile
+
+    Args:
+        values: Sorted list of values
+        p: Percentile, between 0 and 100
+
+    Returns:
+        float: Value of the percentile, None if there are no values
+    """
+    if not values:
+        return None
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+async def fetch(url, path, timeout):
+    """Send a GET request and read the whole response
+
+    A minimal HTTP/1.1 client, so the load test only needs the standard
+    library. The connection is closed after every request, like gunicorn's
+    sync workers do.
+
+    Args:
+        url: Parsed base URL of the dashboard
+        path: Path of the request
+        timeout: Seconds to wait for the complete response
+
+    Returns:
+        tuple: HTTP status (int) and response body (bytes)
+    """
+    secure = url.scheme == "https"
+    port = url.port or (443 if secure else 80)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(
+            url.hostname, port, ssl=ssl.create_default_context() if secure else None
+        ),
+        timeout,
+    )
+    try:
+        request = "GET {}{} HTTP/1.1\r\nHost: {}\r\nConnection: close\r\n\r\n".format(
+            url.path.rstrip("/"), path, url.netloc
+        )
+        writer.write(request.encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    if b"transfer-encoding: chunked" in head.lower():
+        body = dechunk(body)
+    return status, body
+
+
+def dechunk(body):
+    """Decode a body sent with chunked transfer encoding"""
+    decoded = b""
+    while body:
+        size, _, body = body.partition(b"\r\n")
+        size = int(size.split(b";")[0], 16)
+        if size == 0:
+            break
+        decoded += body[:size]
+        body = body[size + 2 :]
+    return decoded
+
+
+async def get_names(url, timeout):
+    """Count the cards of every account and engineer
+
+    Args:
+        url: Parsed base URL of the dashboard
+        timeout: Seconds to wait for each page of /api/cards
+
+    Returns:
+        tuple: Counters of cards per account and per engineer
+    """
+    accounts = Counter()
+    engineers = Counter()
+    query = {"fields": "account,assignee", "limit": 1000}
+    while True:
+        status, body = await fetch(url, "/api/cards?" + urlencode(query), timeout)
+        if status != 200:
+            raise RuntimeError("/api/cards returned {}".format(status))
+        page = json.loads(body)
+        for card in page["items"].values():
+            accounts[card["account"]] += 1
+            if card["assignee"]["displayName"]:
+                engineers[card["assignee"]["displayName"]] += 1
+        if not page["next_cursor"]:
+            return accounts, engineers
+        query["cursor"] = page["next_cursor"]
+
+
+async def user(number, settings, accounts, engineers, results, deadline):
+    """Browse the dashboard as a virtual user until the deadline
+
+    Args:
+        number: Number of the user, seeds its choices
+        settings: Parsed arguments
+        accounts: Counter of cards per account
+        engineers: Counter of cards per engineer
+        results: List of (start time, page, status, seconds) to add to
+        deadline: time.monotonic() at which to stop
+    """
+    rng = random.Random("{}:{}".format(settings.seed, number))
+    pages = list(settings.mix)
+    weights = list(settings.mix.values())
+    # spread the first requests over the first think time
+    await asyncio.sleep(rng.uniform(0, settings.think))
+    while time.monotonic() < deadline:
+        page = rng.choices(pages, weights=weights)[0]
+        path = page_path(page, rng, accounts, engineers)
+        start = time.monotonic()
+        try:
+            status, _ = await fetch(settings.url, path, settings.timeout)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            status = 0
+        results.append((start, page, status, time.monotonic() - start))
+        await asyncio.sleep(rng.expovariate(1 / settings.think))
+
+
+def worker_rss(match):
+    """Resident memory of the processes whose command line contains match
+
+    Args:
+        match: e.g. 'gunicorn'
+
+    Returns:
+        dict: pid -> RSS in bytes, empty where /proc is not available
+    """
+    rss = {}
+    if not os.path.isdir("/proc"):
+        return rss
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            with open("/proc/{}/cmdline".format(pid), "rb") as cmdline:
+                if match.encode() not in cmdline.read():
+                    continue
+            with open("/proc/{}/status".format(pid)) as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        rss[int(pid)] = int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return rss
+
+
+async def sample_rss(match, samples, deadline, interval=1.0):
+    """Sample worker_rss() every interval seconds until the deadline"""
+    while time.monotonic() < deadline:
+        samples.append(worker_rss(match))
+        await asyncio.sleep(interval)
+
+
+def summarize(results, samples, settings, elapsed):
+    """Latency percentiles of every page and RSS of every worker
+
+    Args:
+        results: List of (start time, page, status, seconds)
+        samples: List of worker_rss() samples
+        settings: Parsed arguments
+        elapsed: Seconds the requests counted in the report were sent over
+
+    Returns:
+        dict: 'settings', 'pages' (page -> requests, errors, throughput and
+            latency percentiles, plus a page 'all') and 'workers' (pid ->
+            first, max and last RSS)
+    """
+    latencies = defaultdict(list)
+    errors = Counter()
+    for _, page, status, seconds in results:
+        for name in (page, "all"):
+            latencies[name].append(seconds)
+            if status != 200:
+                errors[name] += 1
+    pages = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        pages[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "rps": len(values) / elapsed if elapsed else None,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1],
+        }
+    workers = {}
+    for sample in samples:
+        for pid, rss in sample.items():
+            worker = workers.setdefault(pid, {"first": rss, "max": rss})
+            worker["max"] = max(worker["max"], rss)
+            worker["last"] = rss
+    return {
+        "settings": {
+            "url": settings.url.geturl(),
+            "users": settings.users,
+            "duration": settings.duration,
+            "warmup": settings.warmup,
+            "think": settings.think,
+            "seed": settings.seed,
+            "mix": settings.mix,
+        },
+        "pages": pages,
+        "workers": workers,
+    }
+
+
+def print_report(report):
+    """Print the summary as tables"""
+    print(
+        "{:<12}{:>9}{:>8}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+            "page", "requests", "errors", "rps", "p50 ms", "p95 ms", "p99 ms", "max ms"
+        )
+    )
+    for name, page in report["pages"].items():
+        print(
+            "{:<12}{:>9}{:>8}{:>8.1f}{:>10.0f}{:>10.0f}{:>10.0f}{:>10.0f}".format(
+                name,
+                page["requests"],
+                page["errors"],
+                page["rps"],
+                *(page[p] * 1000 for p in ("p50", "p95", "p99", "max")),
+            )
+        )
+    if not report["workers"]:
+        print("\nno worker found, RSS not sampled")
+        return
+    print("\n{:<10}{:>12}{:>12}{:>12}".format("pid", "first MB", "max MB", "last MB"))
+    for pid, worker in sorted(report["workers"].items()):
+        print(
+            "{:<10}{:>12.1f}{:>12.1f}{:>12.1f}".format(
+                pid, *(worker[k] / 2**20 for k in ("first", "max", "last"))
+            )
+        )
+
+
+async def run(settings):
+    """Run the load test
+
+    Args:
+        settings: Parsed arguments
+
+    Returns:
+        dict: Report, see summarize()
+    """
+    accounts, engineers = await get_names(settings.url, settings.timeout)
+    if not accounts:
+        raise RuntimeError("no cards found, load data first")
+    start = time.monotonic()
+    deadline = start + settings.warmup + settings.duration
+    results = []
+    samples = []
+    await asyncio.gather(
+        sample_rss(settings.process, samples, deadline),
+        *(
+            user(number, settings, accounts, engineers, results, deadline)
+            for number in range(settings.users)
+        ),
+    )
+    measured = [r for r in results if r[0] >= start + settings.warmup]
+    return summarize(measured, samples, settings, settings.duration)
+
+
+def main():
+    """Parse arguments, run the load test and report"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("url", type=urlparse, help="e.g. http://localhost:8080")
+    parser.add_argument("--users", type=int, default=10, help="concurrent users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument(
+        "--warmup", type=float, default=10, help="seconds not counted in the report"
+    )
+    parser.add_argument(
+        "--think", type=float, default=1.0, help="mean seconds between pages"
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=default_mix,
+        help="page=weight,... of {}".format(",".join(default_mix)),
+    )
+    parser.add_argument("--timeout", type=float, default=120, help="seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--process", default="gunicorn", help="command line of the workers"
+    )
+    parser.add_argument("--json", help="also write the report to this file")
+    settings = parser.parse_args()
+
+    report = asyncio.run(run(settings))
+    print_report(report)
+    if settings.json:
+        with open(settings.json, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""memory.py: memory used by the cards and cases of a synthetic corpus
+
+Compares the cached cards and cases loaded as dictionaries, the way the
+views used to read them, with the compact records of t5gweb.records. Each
+representation is loaded in a fresh process, which reports the growth of
+its resident memory (RSS) and the memory allocated by Python (tracemalloc).
+
+Usage:
+    python -m benchmarks.memory --cases 20000
+"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from t5gweb.records import Card, Case, record_hook
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "..", "bin"))
+from generate_fake_data import generate_fake_data  # noqa: E402
+
+representations = {
+    "dicts": lambda encoded, record_class: json.loads(encoded),
+    "records": lambda encoded, record_class: json.loads(
+        encoded, object_hook=record_hook(record_class)
+    ),
+}
+
+
+def rss():
+    """Resident memory of the current process in bytes"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def measure(path, key, representation, results):
+    """Load a key of the corpus and report the memory it uses
+
+    Runs in a child process, so every measurement starts from the same
+    memory.
+
+    Args:
+        path: JSON file of the cached key
+        key: 'cards' or 'cases'
+        representation: Key of representations
+        results: Queue to put (key, representation, RSS, allocated, number
+            of records) on
+    """
+    record_class = {"cards": Card, "cases": Case}[key]
+    with open(path, encoding="utf-8") as cached:
+        encoded = cached.read()
+    load = representations[representation]
+    gc.collect()
+    before = rss()
+    loaded = load(encoded, record_class)
+    gc.collect()
+    grown = rss() - before
+    # tracemalloc's own memory would count in the RSS, measure it separately
+    del loaded
+    gc.collect()
+    tracemalloc.start()
+    loaded = load(encoded, record_class)
+    gc.collect()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    results.put((key, representation, grown, allocated, len(loaded)))
+
+
+def main():
+    """Generate a corpus and measure every representation of it"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--cases", type=int, default=5000)
+    args = parser.parse_args()
+
+    data = generate_fake_data(
+        args.cases,
+        accounts=max(10, args.cases // 200),
+        engineers=max(5, args.cases // 500),
+    )
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as directory:
+        for key in ("cards", "cases"):
+            path = os.path.join(directory, key + ".json")
+            with open(path, "w", encoding="utf-8") as cached:
+                json.dump(data[key], cached)
+            for representation in representations:
+                process = context.Process(
+                    target=measure, args=(path, key, representation, results)
+                )
+                process.start()
+                process.join()
+
+    print(
+        "{:<8}{:<10}{:>10}{:>14}{:>12}".format(
+            "key", "loaded as", "RSS MB", "allocated MB", "records"
+        )
+    )
+    while not results.empty():
+        key, representation, grown, allocated, count = results.get()
+        print(
+            "{:<8}{:<10}{:>10.1f}{:>14.1f}{:>12}".format(
+                key, representation, grown / 2**20, allocated / 2**20, count
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,12 @@ setup(
     install_requires=[
         "celery==5.4.0",
         "Flask==3.1.0",
+        "Flask-Compress==1.25",
         "Flask-Login==0.6.3",
         "flower==2.0.1",
         "gunicorn==23.0.0",
         "jira==3.10.5",
+        "prometheus_client==0.21.1",
         "prometheus_flask_exporter==0.23.1",
         "python-bugzilla==3.3.0",
         "python3-saml==1.16.0",
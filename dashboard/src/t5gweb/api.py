@@ -1,20 +1,37 @@
 """API endpoints for t5gweb"""
 
-import json
-
-from flask import Blueprint, jsonify, request
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    jsonify,
+    request,
+    stream_with_context,
+    url_for,
+)
 from flask_login import login_required
-from t5gweb.cache import (
-    get_bz_details,
-    get_cards,
-    get_case_details,
-    get_cases,
-    get_escalations,
-    get_issue_details,
-    get_stats,
+from t5gweb import profiling
+from t5gweb.httpcache import conditional
+from t5gweb.libtelco5g import (
+    generate_stats,
+    get_cache_version,
+    get_duration_percentiles,
+    redis_get,
+    redis_hget,
+    redis_hmget,
+    redis_hscan,
+)
+from t5gweb.queries import (
+    build_query_index,
+    export_csv,
+    export_ndjson,
+    parse_query,
+    project,
+    run_query,
 )
-from t5gweb.libtelco5g import generate_stats, redis_get, redis_set, sync_portal_to_jira
-from t5gweb.utils import set_cfg
+from t5gweb.t5gweb import new_cases_window
+from t5gweb.tables import build_card_detail, recent_comments, recent_expiry
+from t5gweb.taskmgr import refresh_job, refresh_types, start_refresh
 
 BP = Blueprint("api", __name__, url_prefix="/api")
 
@@ -39,6 +56,11 @@ def index():
             "{}escalations".format(request.base_url),
             "{}issues".format(request.base_url),
             "{}stats".format(request.base_url),
+            "{}cards/<card>/detail".format(request.base_url),
+            "{}export/cards".format(request.base_url),
+            "{}export/cases".format(request.base_url),
+            "{}percentiles/relief".format(request.base_url),
+            "{}percentiles/resolved".format(request.base_url),
         ]
     }
     return endpoints
@@ -47,11 +69,11 @@ def index():
 @BP.route("/refresh/<string:data_type>")
 @login_required
 def refresh(data_type):
-    """Force an immediate refresh of cached data
+    """Start a background refresh of cached data
 
-    Triggers synchronous data refresh for the specified data type. Supported
-    types include cards, cases, details, bugs, escalations, issues,
-    create_jira_cards, and stats.
+    Dispatches the refresh as a Celery job and returns immediately. If a
+    refresh of the same data type is already running, its job is returned
+    instead of starting another one.
 
     Args:
         data_type: Type of data to refresh. Valid values:
@@ -65,56 +87,235 @@ def refresh(data_type):
             - 'stats': Statistics cache
 
     Returns:
-        Response: JSON response indicating success or error for the operation
+        tuple: JSON response with the job ID, 202 status code, and Location
+            header pointing to the job status endpoint, or an error for an
+            unknown data type
     """
-    cfg = set_cfg()
-    if data_type == "cards":
-        get_cards(cfg)
-        return jsonify({"caching cards": "ok"})
-    elif data_type == "cases":
-        get_cases(cfg)
-        return jsonify({"caching cases": "ok"})
-    elif data_type == "details":
-        get_case_details(cfg)
-        return jsonify({"caching details": "ok"})
-    elif data_type == "bugs":
-        get_bz_details(cfg)
-    elif data_type == "escalations":
-        cases = redis_get("cases")
-        escalations = get_escalations(cfg, cases)
-        redis_set("escalations", json.dumps(escalations))
-        return jsonify({"caching escalations": "ok"})
-    elif data_type == "issues":
-        get_issue_details(cfg)
-        return jsonify({"caching issues": "ok"})
-    elif data_type == "create_jira_cards":
-        sync_portal_to_jira()
-        return jsonify({"create_jira_cards": "ok"})
-    elif data_type == "stats":
-        get_stats()
-        return jsonify({"caching stats": "ok"})
-    else:
+    if data_type not in refresh_types:
         return jsonify({"error": "unknown data type: {}".format(data_type)})
+    job_id, started = start_refresh(data_type)
+    status_url = url_for("api.refresh_status", job_id=job_id)
+    return (
+        jsonify(
+            {
+                "job_id": job_id,
+                "data_type": data_type,
+                "started": started,
+                "status_url": status_url,
+            }
+        ),
+        202,
+        {"Location": status_url},
+    )
+
+
+@BP.route("/refresh/status/<string:job_id>")
+@login_required
+def refresh_status(job_id):
+    """Return the state of a refresh job started by /api/refresh
+
+    Args:
+        job_id: Job ID returned by /api/refresh
+
+    Returns:
+        Response: JSON response with the job state (PENDING, STARTED,
+            SUCCESS or FAILURE) and its result or error
+    """
+    job = refresh_job.AsyncResult(job_id)
+    response = {"job_id": job_id, "state": job.state}
+    if job.state == "SUCCESS":
+        response["result"] = job.result
+    elif job.state == "FAILURE":
+        response["error"] = str(job.info)  # this is the exception raised
+    return jsonify(response)
+
+
+def _query_cached(data_type):
+    """Answer a filtered, projected and paginated query of cards or cases
+
+    Without query parameters the whole cache is returned, as before. Otherwise
+    the matching keys are selected with the query index and only the records
+    of the requested page are read from the '<data_type>_records' hash.
+
+    Args:
+        data_type: 'cards' or 'cases'
+
+    Returns:
+        Response: JSON response with 'count' (number of matching records),
+            'next_cursor' and the 'items' of the page, or the whole cache
+    """
+    try:
+        query = parse_query(data_type, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if query is None:
+        return jsonify(redis_get(data_type))
+
+    # the records are rewritten by every refresh of the index, after the data,
+    # while the index is only written when it changed
+    index_key = "{}_query_index".format(data_type)
+    records_version = get_cache_version("{}_records".format(data_type))
+    data_version = get_cache_version(data_type)
+    if records_version is not None and records_version >= (data_version or 0):
+        index = redis_get(index_key)
+        keys, count, next_cursor = run_query(index, query)
+        records = redis_hmget("{}_records".format(data_type), keys)
+    else:
+        # the index is missing or older than the data, e.g. after a portal sync
+        records = redis_get(data_type)
+        keys, count, next_cursor = run_query(
+            build_query_index(data_type, records), query
+        )
+    items = {
+        key: project(records[key], query["fields"]) for key in keys if key in records
+    }
+    return jsonify({"count": count, "next_cursor": next_cursor, "items": items})
 
 
 @BP.route("/cards")
 @login_required
+@conditional("cards", "cards_query_index")
 def show_cards():
-    """Return cached JIRA cards data in JSON format."""
-    cards = redis_get("cards")
-    return jsonify(cards)
+    """Return cached JIRA cards data in JSON format
+
+    Query Parameters:
+        status, case_status, severity, account, assignee: Only return cards
+            matching one of the (comma separated) values
+        updated_since: Only return cards whose case was updated since this
+            date or datetime (e.g. '2024-06-01' or '2024-06-01T10:00')
+        fields: Comma separated list of fields to return for each card
+        limit: Maximum number of cards per page. Defaults to 100.
+        cursor: 'next_cursor' of the previous page
+    """
+    return _query_cached("cards")
+
+
+def _card_detail(card):
+    """Get the child row detail of a card, None if the card is unknown"""
+    detail = redis_hget("card_details", card)
+    if not detail:
+        cards = redis_get("cards")
+        if card not in cards:
+            return None
+        detail = build_card_detail(cards[card])
+    return detail
+
+
+def _recent_comments_window(card):
+    """Expiry of the oldest recent comment of a card, for ?comments=recent"""
+    if request.args.get("comments") != "recent":
+        return None
+    detail = _card_detail(card)
+    expires = recent_expiry(detail["comments"]) if detail else None
+    return expires.isoformat() if expires else None
+
+
+@BP.route("/cards/<string:card>/detail")
+@login_required
+@conditional("card_details", window=_recent_comments_window)
+def show_card_detail(card):
+    """Return the child row detail of a single card in JSON format
+
+    Used by the card tables to load bugzillas, JIRA issues and comments only
+    when a row is expanded.
+
+    Args:
+        card: JIRA card key (e.g. 'KTL-1234')
+
+    Query Parameters:
+        comments: 'recent' to only return comments from the last 7 days
+
+    Returns:
+        Response: JSON response with group_name, severity, bugzilla, issues and
+            comments, or 404 if the card is unknown
+    """
+    detail = _card_detail(card)
+    if detail is None:
+        abort(404)
+    if request.args.get("comments") == "recent":
+        detail["comments"] = recent_comments(detail["comments"])
+    return jsonify(detail)
 
 
 @BP.route("/cases")
 @login_required
+@conditional("cases", "cases_query_index")
 def show_cases():
-    """Return all Red Hat Portal cases from cache in JSON format."""
-    cases = redis_get("cases")
-    return jsonify(cases)
+    """Return all Red Hat Portal cases from cache in JSON format
+
+    Accepts the same query parameters as /api/cards, except 'case_status'.
+    The 'assignee' is the case owner and 'updated_since' applies to the last
+    update of the case.
+    """
+    return _query_cached("cases")
+
+
+def _export(data_type):
+    """Stream every cached card or case as NDJSON or CSV
+
+    Records are read from the '<data_type>_records' hash in batches and
+    written out one at a time, so memory use doesn't grow with the number of
+    records.
+
+    Args:
+        data_type: 'cards' or 'cases'
+
+    Returns:
+        Response: Streamed response in the format requested by the 'format'
+            query parameter ('ndjson' by default, or 'csv')
+    """
+    fields = request.args.get("fields")
+    fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    export_format = request.args.get("format", "ndjson")
+    records = redis_hscan("{}_records".format(data_type))
+    if export_format == "ndjson":
+        lines = export_ndjson(data_type, records, fields)
+        mimetype = "application/x-ndjson"
+    elif export_format == "csv":
+        lines = export_csv(data_type, records, fields)
+        mimetype = "text/csv"
+    else:
+        return jsonify({"error": "unknown format: {}".format(export_format)}), 400
+    return Response(
+        stream_with_context(lines),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": "attachment; filename={}.{}".format(
+                data_type, export_format
+            )
+        },
+    )
+
+
+@BP.route("/export/cards")
+@login_required
+@conditional("cards_records")
+def export_cards():
+    """Stream all cached JIRA cards as NDJSON or CSV
+
+    Query Parameters:
+        format: 'ndjson' (default) or 'csv'
+        fields: Comma separated list of fields to export for each card
+    """
+    return _export("cards")
+
+
+@BP.route("/export/cases")
+@login_required
+@conditional("cases_records")
+def export_cases():
+    """Stream all cached Red Hat Portal cases as NDJSON or CSV
+
+    Query Parameters:
+        format: 'ndjson' (default) or 'csv'
+        fields: Comma separated list of fields to export for each case
+    """
+    return _export("cases")
 
 
 @BP.route("/bugs")
 @login_required
+@conditional("bugs")
 def show_bugs():
     """Return all Bugzilla bugs from cache in JSON format."""
     bugs = redis_get("bugs")
@@ -123,6 +324,7 @@ def show_bugs():
 
 @BP.route("/escalations")
 @login_required
+@conditional("escalations")
 def show_escalations():
     """Return all escalated cases from cache in JSON format."""
     escalations = redis_get("escalations")
@@ -131,6 +333,7 @@ def show_escalations():
 
 @BP.route("/details")
 @login_required
+@conditional("details")
 def show_details():
     """Return case details including CritSit status and group names in JSON format."""
     details = redis_get("details")
@@ -139,6 +342,7 @@ def show_details():
 
 @BP.route("/issues")
 @login_required
+@conditional("issues")
 def show_issues():
     """Return all JIRA issues associated with open cases in JSON format."""
     issues = redis_get("issues")
@@ -147,7 +351,113 @@ def show_issues():
 
 @BP.route("/stats")
 @login_required
+@conditional("cards", "cases", "bugs", "issues", window=new_cases_window)
 def show_stats():
     """Generate and return current statistics in JSON format."""
     stats = generate_stats()
     return jsonify(stats)
+
+
+@BP.route("/percentiles/<string:outcome>")
+@login_required
+@conditional("duration_sketches")
+def show_percentiles(outcome):
+    """Return time to relief or resolution percentiles in JSON format
+
+    Percentiles are computed from the cached quantile sketches, so any window
+    and combination of filters can be answered without reading the cards.
+
+    Args:
+        outcome: Either 'relief' or 'resolved'
+
+    Query Parameters:
+        start: First day (YYYY-MM-DD) or month (YYYY-MM) of the window,
+            inclusive. The window is widened to whole months.
+        end: Last day (YYYY-MM-DD) or month (YYYY-MM) of the window, inclusive
+        severity: Only include cases of this severity (e.g. 'Urgent')
+        account: Only include cases of this account
+        engineer: Only include cards assigned to this engineer, can't be
+            combined with account
+
+    Returns:
+        Response: JSON response with count, mean, p50, p90 and p99 (in days)
+            per severity and for all severities combined
+    """
+    outcomes = {"relief": "Relief", "resolved": "Resolved"}
+    if outcome not in outcomes:
+        return jsonify({"error": "unknown outcome: {}".format(outcome)})
+    try:
+        percentiles = get_duration_percentiles(
+            outcomes[outcome],
+            start=request.args.get("start"),
+            end=request.args.get("end"),
+            severity=request.args.get("severity"),
+            account=request.args.get("account"),
+            engineer=request.args.get("engineer"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(percentiles)
+
+
+def _profile_token():
+    """Profiling token sent with the request, see profiling.is_authorized()"""
+    return request.headers.get("X-Profile-Token")
+
+
+@BP.route("/profiles")
+@login_required
+def show_profiles():
+    """List the stored profiles, newest first
+
+    Requires the profiling token in the X-Profile-Token header.
+
+    Returns:
+        Response: JSON list of profiles with their id, name, start, duration,
+            number of samples and the URLs of their artifacts
+    """
+    if not profiling.is_authorized(_profile_token()):
+        abort(403)
+    profiles = profiling.list_profiles()
+    for profile in profiles:
+        profile["urls"] = {
+            artifact: url_for(
+                "api.show_profile", profile_id=profile["id"], artifact=artifact
+            )
+            for artifact in ("pstats", "collapsed")
+        }
+    return jsonify(profiles)
+
+
+@BP.route("/profiles/<string:profile_id>.<string:artifact>")
+@login_required
+def show_profile(profile_id, artifact):
+    """Download an artifact of a stored profile
+
+    Requires the profiling token, like show_profiles().
+
+    Args:
+        profile_id: Id of the profile
+        artifact: 'pstats' (load with pstats.Stats or snakeviz) or 'collapsed'
+            (collapsed stacks for flamegraph.pl or speedscope)
+
+    Returns:
+        Response: The artifact as an attachment, 404 if it doesn't exist
+    """
+    if not profiling.is_authorized(_profile_token()):
+        abort(403)
+    if artifact not in ("pstats", "collapsed"):
+        abort(404)
+    data = profiling.get_profile(profile_id, artifact)
+    if data is None:
+        abort(404)
+    mimetype = "text/plain" if artifact == "collapsed" else "application/octet-stream"
+    return Response(
+        data,
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": "attachment; filename={}.{}".format(
+                profile_id, artifact
+            )
+        },
+    )
@@ -11,15 +11,19 @@ import bugzilla
 import requests
 from jira.exceptions import JIRAError
 
-from t5gweb import libtelco5g
+from t5gweb import libtelco5g, queries, tables
 from t5gweb.database import (
     load_cases_postgres,
     load_comments_postgres,
     load_jira_card_postgres,
 )
-from t5gweb.utils import format_comment, format_date, make_headers
+from t5gweb.metrics import REAUTHS, external_call
+from t5gweb.profiling import profiled
+from t5gweb.tracing import span, traced
+from t5gweb.utils import comment_key, format_comment, format_date, make_headers
 
 
+@traced()
 def get_cases(cfg):
     """Get cases from Red Hat Portal API and cache them
 
@@ -36,7 +40,7 @@ def get_cases(cfg):
     """
     # https://source.redhat.com/groups/public/hydra/hydra_integration_platform_cee_integration_wiki/hydras_api_layer
 
-    token = libtelco5g.get_token(cfg["offline_token"])
+    token = libtelco5g.get_token(cfg["offline_token"], cfg["sso_url"])
     query = cfg["query"]
     fields = ",".join(cfg["fields"])
     query = f"({query})"
@@ -47,7 +51,8 @@ def get_cases(cfg):
 
     logging.warning("searching the portal for cases")
     start = time.time()
-    r = requests.get(url, headers=headers, params=payload)
+    with external_call("portal", "search"):
+        r = requests.get(url, headers=headers, params=payload)
     r.raise_for_status()
     cases_json = r.json()["response"]["docs"]
     # The case portal only allows 9999 cases to be returned by a query, so we cannot
@@ -70,7 +75,8 @@ def get_cases(cfg):
             "rows": num_cases,
             "fl": fields,
         }
-        r = requests.get(url, headers=headers, params=payload)
+        with external_call("portal", "search"):
+            r = requests.get(url, headers=headers, params=payload)
         r.raise_for_status()
         cases_json.extend(r.json()["response"]["docs"])
     end = time.time()
@@ -108,9 +114,12 @@ def get_cases(cfg):
     except Exception as e:
         logging.error("Failed to load cases to Postgres: %s ", e)
 
-    libtelco5g.redis_set("cases", json.dumps(cases))
+    if libtelco5g.redis_set("cases", json.dumps(cases)):
+        libtelco5g.publish_records("cases", cases)
+    get_query_index("cases", cases)
 
 
+@traced()
 def get_escalations(cfg, cases):
     """Get cases that have been escalated by querying the escalations JIRA board
 
@@ -152,6 +161,8 @@ def get_escalations(cfg, cases):
     return escalations
 
 
+@traced()
+@profiled("get_cards")
 def get_cards(cfg, self=None, background=False):
     """Pull the latest information from the JIRA cards
 
@@ -182,6 +193,8 @@ def get_cards(cfg, self=None, background=False):
 
     # Process each card
     jira_cards = {}
+    formatted = _get_formatted_comments(card_list)
+    formatted_before = len(formatted)
     time_now = datetime.datetime.now(datetime.timezone.utc)
 
     for index, card in enumerate(card_list):
@@ -189,32 +202,72 @@ def get_cards(cfg, self=None, background=False):
             _update_progress(self, index, len(card_list))
 
         try:
-            card_data = _build_card_data(
-                card,
-                cases,
-                bugs,
-                issues,
-                escalations,
-                details,
-                time_now,
-                cfg,
-            )
-            if card_data:
-                jira_cards[card.key] = card_data
-                load_jira_card_postgres(cases, card_data["case_number"], card)
+            with span("build_card", card=card.key):
+                card_data = _build_card_data(
+                    card,
+                    cases,
+                    bugs,
+                    issues,
+                    escalations,
+                    details,
+                    time_now,
+                    cfg,
+                    formatted,
+                )
+                if card_data:
+                    jira_cards[card.key] = card_data
+                    load_jira_card_postgres(
+                        cases, card_data["case_number"], card, formatted
+                    )
 
         except Exception as e:
             logging.warning("Error processing card %s: %s", card, str(e))
             continue
 
     # Cache the results
-    libtelco5g.redis_set("cards", json.dumps(jira_cards))
+    logging.warning(
+        "formatted %d new or edited comments", len(formatted) - formatted_before
+    )
+    # only the comments of the current cards are kept
+    libtelco5g.redis_hset(
+        "formatted_comments",
+        {key: json.dumps(body) for key, body in formatted.items()},
+    )
+    if libtelco5g.redis_set("cards", json.dumps(jira_cards)):
+        libtelco5g.publish_records("cards", jira_cards)
     libtelco5g.redis_set(
         "timestamp", json.dumps(str(datetime.datetime.now(datetime.timezone.utc)))
     )
+    get_card_indexes(jira_cards)
     return {"cards cached": len(jira_cards)}
 
 
+def _get_formatted_comments(card_list):
+    """Get the cached formatted bodies of the comments of the cards
+
+    Formatted bodies are kept in the 'formatted_comments' hash, keyed by
+    utils.comment_key(), so a refresh only formats the new and edited
+    comments.
+
+    Args:
+        card_list: List of JIRA card objects
+
+    Returns:
+        dict: Formatted bodies found in the cache, keyed by comment key
+    """
+    keys = [
+        comment_key(comment)
+        for card in card_list
+        for comment in card.fields.comment.comments
+    ]
+    formatted = {}
+    for start in range(0, len(keys), 1000):
+        formatted.update(
+            libtelco5g.redis_hmget("formatted_comments", keys[start : start + 1000])
+        )
+    return formatted
+
+
 def _get_cached_data():
     # Generated by: Cursor
     """Get all cached data needed for card processing
@@ -254,10 +307,12 @@ def _execute_jira_query_with_retry(jira_conn, jira_query, cfg, max_results):
         return jira_conn.search_issues(jira_query, 0, max_results)
     except JIRAError:
         logging.warning("JIRA Exception. Possible 401. Reconnecting.....")
+        REAUTHS.labels("jira").inc()
         jira_conn = libtelco5g.jira_connection(cfg)
         return jira_conn.search_issues(jira_query, 0, max_results)
 
 
+@traced()
 def _get_jira_cards_list(cfg, jira_conn):
     # Generated by: Cursor
     """Get the list of JIRA cards based on configuration
@@ -316,7 +371,9 @@ def _update_progress(self, current, total):
     )
 
 
-def _build_card_data(card, cases, bugs, issues, escalations, details, time_now, cfg):
+def _build_card_data(
+    card, cases, bugs, issues, escalations, details, time_now, cfg, formatted=None
+):
     # Generated by: Cursor
     """Build complete card data for a single JIRA card
 
@@ -332,6 +389,8 @@ def _build_card_data(card, cases, bugs, issues, escalations, details, time_now,
         details: Dictionary of cached case detail information
         time_now: Current datetime for calculating days open
         cfg: Configuration dictionary
+        formatted: Optional dictionary of formatted comment bodies, see
+            _get_card_comments()
 
     Returns:
         dict: Complete card data dictionary with all relevant fields, or None
@@ -348,7 +407,8 @@ def _build_card_data(card, cases, bugs, issues, escalations, details, time_now,
         return None
 
     # Get comments
-    comments = _get_card_comments(card.fields.comment.comments)
+    with span("format_comments"):
+        comments = _get_card_comments(card.fields.comment.comments, formatted)
 
     # Get assignee and contributor info
     assignee = _get_assignee_info(card)
@@ -414,7 +474,7 @@ def _build_card_data(card, cases, bugs, issues, escalations, details, time_now,
     }
 
 
-def _get_card_comments(comments):
+def _get_card_comments(comments, formatted=None):
     # Generated by: Cursor
     """Extract and format card comments
 
@@ -422,14 +482,22 @@ def _get_card_comments(comments):
 
     Args:
         comments: List of JIRA comment objects
+        formatted: Optional dictionary of the bodies already formatted, keyed
+            by utils.comment_key(). Reused when found, and the bodies of the
+            other comments are added to it.
 
     Returns:
         list: List of tuples containing (formatted_body, timestamp) for each
             comment
     """
+    if formatted is None:
+        formatted = {}
     card_comments = []
     for comment in comments:
-        body = format_comment(comment)
+        key = comment_key(comment)
+        body = formatted.get(key)
+        if body is None:
+            body = formatted[key] = format_comment(comment)
         tstamp = comment.updated
         card_comments.append((body, tstamp))
     return card_comments
@@ -589,6 +657,7 @@ def _get_label_flags(labels, escalated):
     return {"potential_escalation": potential_escalation, "daily_telco": daily_telco}
 
 
+@traced()
 def get_case_details(cfg):
     """Caches CritSit and CaseGroup from open cases
 
@@ -609,18 +678,21 @@ def get_case_details(cfg):
         return
 
     bz_dict = {}
-    token = libtelco5g.get_token(cfg["offline_token"])
+    token = libtelco5g.get_token(cfg["offline_token"], cfg["sso_url"])
     headers = make_headers(token)
     case_details = {}
     logging.warning("getting all bugzillas and case details")
     for case in cases:
         if cases[case]["status"] != "Closed":
             case_endpoint = f"{cfg['redhat_api']}/v1/cases/{case}"
-            r_case = requests.get(case_endpoint, headers=headers)
+            with external_call("portal", "case"):
+                r_case = requests.get(case_endpoint, headers=headers)
             if r_case.status_code == 401:
-                token = libtelco5g.get_token(cfg["offline_token"])
+                REAUTHS.labels("portal").inc()
+                token = libtelco5g.get_token(cfg["offline_token"], cfg["sso_url"])
                 headers = make_headers(token)
-                r_case = requests.get(case_endpoint, headers=headers)
+                with external_call("portal", "case"):
+                    r_case = requests.get(case_endpoint, headers=headers)
 
             case_json = r_case.json()
             crit_sit = case_json.get("critSit", False)
@@ -651,6 +723,7 @@ def get_case_details(cfg):
     libtelco5g.redis_set("case_bz", json.dumps(bz_dict))
 
 
+@traced()
 def get_bz_details(cfg):
     """Get details about Bugzillas from API
 
@@ -670,12 +743,12 @@ def get_bz_details(cfg):
         libtelco5g.redis_set("bugs", json.dumps(None))
         return
 
-    bz_url = "bugzilla.redhat.com"
-    bz_api = bugzilla.Bugzilla(bz_url, api_key=cfg["bz_key"])
+    bz_api = bugzilla.Bugzilla(cfg["bz_url"], api_key=cfg["bz_key"])
     for case in bz_dict:
         for bug in bz_dict[case]:
             try:
-                bugs = bz_api.getbug(bug["bugzillaNumber"])
+                with external_call("bugzilla", "getbug"):
+                    bugs = bz_api.getbug(bug["bugzillaNumber"])
             except xmlrpc.client.Fault:
                 logging.warning(
                     "error retrieving bug %s - restricted?", bug["bugzillaNumber"]
@@ -704,6 +777,7 @@ def get_bz_details(cfg):
     libtelco5g.redis_set("bugs", json.dumps(bz_dict))
 
 
+@traced()
 def get_issue_details(cfg):
     """Cache issues associated with cases
 
@@ -761,7 +835,7 @@ def _setup_issue_processing(cfg):
         tuple: A 3-tuple containing (token, headers, jira_conn) for API access
     """
     # Reuse the existing libtelco5g setup pattern for consistency
-    token = libtelco5g.get_token(cfg["offline_token"])
+    token = libtelco5g.get_token(cfg["offline_token"], cfg["sso_url"])
     headers = make_headers(token)
     jira_conn = libtelco5g.jira_connection(cfg)
 
@@ -830,13 +904,16 @@ def _get_case_issues_from_api(case, cfg, token, headers):
             request fails
     """
     issues_url = f"{cfg['redhat_api']}/cases/{case}/jiras"
-    issues = requests.get(issues_url, headers=headers)
+    with external_call("portal", "case jiras"):
+        issues = requests.get(issues_url, headers=headers)
 
     # Handle 401 authorization errors
     if issues.status_code == 401:
-        token = libtelco5g.get_token(cfg["offline_token"])
+        REAUTHS.labels("portal").inc()
+        token = libtelco5g.get_token(cfg["offline_token"], cfg["sso_url"])
         headers = make_headers(token)
-        issues = requests.get(issues_url, headers=headers)
+        with external_call("portal", "case jiras"):
+            issues = requests.get(issues_url, headers=headers)
 
     if issues.status_code == 200 and len(issues.json()) > 0:
         return issues.json()
@@ -1056,6 +1133,7 @@ def _extract_private_keywords(bug):
     return None
 
 
+@traced()
 def get_stats():
     """Generate and cache daily statistics
 
@@ -1073,3 +1151,127 @@ def get_stats():
     stats = {today: new_stats}
     all_stats.update(stats)
     libtelco5g.redis_set("stats", json.dumps(all_stats))
+
+
+def get_card_indexes(cards=None):
+    """Generate and cache everything derived from the cards
+
+    Called whenever the 'cards' cache is written, so the histograms, duration
+    sketches, table index and card query index don't go stale.
+
+    Args:
+        cards: Dictionary of cards to use. If None, the 'cards' cache is read.
+            Defaults to None.
+
+    Returns:
+        None. See get_histogram_stats(), get_duration_sketches(),
+            get_table_index() and get_query_index().
+    """
+    if cards is None:
+        cards = libtelco5g.redis_get("cards")
+    get_histogram_stats(cards)
+    get_duration_sketches(cards)
+    get_table_index(cards)
+    get_query_index("cards", cards)
+
+
+@traced()
+def get_histogram_stats(cards=None):
+    """Generate and cache time to resolution/relief histograms
+
+    Computes the bucketed histogram statistics overall, per account and per
+    engineer in a single pass over the cards so that the stats, account and
+    engineer views only need to look them up.
+
+    Args:
+        cards: Dictionary of cards to use. If None, the 'cards' cache is read.
+            Defaults to None.
+
+    Returns:
+        None. Results are cached in Redis under the 'histograms' key.
+    """
+    logging.warning("caching histogram stats")
+    if cards is None:
+        cards = libtelco5g.redis_get("cards")
+    histograms = libtelco5g.generate_all_histogram_stats(cards)
+    libtelco5g.redis_set("histograms", json.dumps(histograms))
+
+
+@traced()
+def get_duration_sketches(cards=None):
+    """Incrementally update the cached time to relief/resolution sketches
+
+    Adds cards that were relieved or resolved since the last refresh to the
+    quantile sketches kept per day, severity, account and engineer.
+
+    Args:
+        cards: Dictionary of cards to use. If None, the 'cards' cache is read.
+            Defaults to None.
+
+    Returns:
+        None. Results are cached in Redis under the 'duration_sketches' key.
+    """
+    logging.warning("updating duration sketches")
+    if cards is None:
+        cards = libtelco5g.redis_get("cards")
+    duration_sketches = libtelco5g.redis_get("duration_sketches")
+    libtelco5g.update_duration_sketches(duration_sketches, cards)
+    libtelco5g.redis_set("duration_sketches", json.dumps(duration_sketches))
+
+
+@traced()
+def get_table_index(cards=None):
+    """Generate and cache the indexes behind the server-side card tables
+
+    Args:
+        cards: Dictionary of cards to use. If None, the 'cards' cache is read.
+            Defaults to None.
+
+    Returns:
+        None. The index is cached in Redis under the 'table_index' key, the
+            row and search text of each card in the 'table_rows' and
+            'table_search' hashes, and the child row detail of each card in
+            the 'card_details' hash.
+    """
+    logging.warning("caching table index")
+    if cards is None:
+        cards = libtelco5g.redis_get("cards")
+    index, rows, search = tables.build_table_index(cards)
+    # the rows are written first, the index only references cards they have
+    libtelco5g.redis_hset(
+        "table_rows", {card: json.dumps(row) for card, row in rows.items()}
+    )
+    libtelco5g.redis_hset(
+        "table_search", {card: json.dumps(text) for card, text in search.items()}
+    )
+    libtelco5g.redis_set("table_index", json.dumps(index))
+    details = {
+        card: json.dumps(tables.build_card_detail(data)) for card, data in cards.items()
+    }
+    libtelco5g.redis_hset("card_details", details)
+
+
+@traced()
+def get_query_index(data_type, records=None):
+    """Generate and cache the indexes behind the /api/cards and /api/cases queries
+
+    Args:
+        data_type: 'cards' or 'cases'
+        records: Dictionary of cards or cases to use. If None, the cache of
+            data_type is read. Defaults to None.
+
+    Returns:
+        None. The index is cached in Redis under the '<data_type>_query_index'
+            key and every record in the '<data_type>_records' hash.
+    """
+    logging.warning("caching {} query index".format(data_type))
+    if records is None:
+        records = libtelco5g.redis_get(data_type)
+    libtelco5g.redis_hset(
+        "{}_records".format(data_type),
+        {key: json.dumps(record) for key, record in records.items()},
+    )
+    libtelco5g.redis_set(
+        "{}_query_index".format(data_type),
+        json.dumps(queries.build_query_index(data_type, records)),
+    )
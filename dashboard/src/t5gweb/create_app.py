@@ -1,12 +1,29 @@
 """initialize t5gweb application"""
 
 import os
+from collections.abc import Mapping
 
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 from prometheus_flask_exporter import PrometheusMetrics
 
-from . import api, t5gweb, ui
+from . import api, profiling, t5gweb, tracing, ui
 from .database import create_postgres_tables
+from .metrics import register_collectors
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, also serializing cached records like dicts
+
+    See t5gweb.records and t5gweb.snapshots.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Mapping):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
 
 
 def create_app(test_config=None):
@@ -28,7 +45,19 @@ def create_app(test_config=None):
     """
     # create and configure the app
     app = Flask(__name__, instance_relative_config=True)
+    app.json = JSONProvider(app)
     app.config["SECRET_KEY"] = os.environ.get("secret_key")
+    # compress large HTML/JSON responses, the card tables and API can be MBs
+    app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+    app.config["COMPRESS_ALGORITHM_STREAMING"] = ["br", "deflate"]
+    app.config["COMPRESS_MIMETYPES"] = [
+        "text/html",
+        "text/css",
+        "text/csv",
+        "application/javascript",
+        "application/json",
+        "application/x-ndjson",
+    ]
     app.config.from_prefixed_env()
     ui.login_manager.init_app(app)
     if test_config is None:
@@ -47,9 +76,14 @@ def create_app(test_config=None):
     # Create database tables
     create_postgres_tables()
 
+    Compress(app)
+
     metrics = PrometheusMetrics(app)
     metrics.info("app_info", "App Info", version="1.230428")
+    register_collectors()
 
+    tracing.init_app(app)
+    profiling.init_app(app)
     t5gweb.init_app(app)
     app.register_blueprint(api.BP)
     app.register_blueprint(ui.BP)
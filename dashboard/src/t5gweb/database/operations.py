@@ -6,12 +6,14 @@ from datetime import datetime, timezone
 
 from dateutil import parser
 
-from t5gweb.utils import format_comment
+from t5gweb.tracing import traced
+from t5gweb.utils import comment_key, format_comment
 
 from .models import Case, Comment, JiraCard, JiraComment
 from .session import db_config
 
 
+@traced()
 def load_cases_postgres(cases):
     """Load or update cases data in PostgreSQL database
 
@@ -74,6 +76,7 @@ def load_cases_postgres(cases):
         logging.warning("Loaded cases to Postgres")
 
 
+@traced()
 def load_comments_postgres(case_number, case_created_date, api_comments):
     """Load or update Portal case comments in PostgreSQL.
 
@@ -137,7 +140,8 @@ def load_comments_postgres(case_number, case_created_date, api_comments):
         session.close()
 
 
-def load_jira_card_postgres(cases, case_number, issue):
+@traced()
+def load_jira_card_postgres(cases, case_number, issue, formatted=None):
     """Load or update a JIRA card and its comments in PostgreSQL database
 
     Creates or updates a JIRA card record and all its associated comments in
@@ -156,6 +160,8 @@ def load_jira_card_postgres(cases, case_number, issue):
             - fields.assignee: Assignee object
             - fields.comment.comments: List of comment objects
             - fields.customfield_10020: Sprint information
+        formatted: Optional dictionary of formatted comment bodies keyed by
+            utils.comment_key(), see cache.get_cards()
     Returns:
         tuple: (card_processed: bool, card_comments: list) where card_processed
             indicates if card was successfully stored and card_comments contains
@@ -237,7 +243,11 @@ def load_jira_card_postgres(cases, case_number, issue):
             comments = issue.fields.comment.comments
 
             for comment in comments:
-                body = format_comment(comment)
+                body = None
+                if formatted is not None:
+                    body = formatted.get(comment_key(comment))
+                if body is None:
+                    body = format_comment(comment)
                 tstamp = comment.updated
                 card_comments.append((body, tstamp))
 
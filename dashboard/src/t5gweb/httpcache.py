@@ -0,0 +1,109 @@
+"""httpcache.py: conditional GET support for t5gweb views"""
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import make_response, request
+from t5gweb.libtelco5g import get_cache_version
+
+
+def cache_validators(*keys, window=None):
+    """Build the ETag and Last-Modified validators of the current request
+
+    The validators are derived from the versions of the cached keys a view
+    reads, so they change whenever one of the keys is refreshed. The query
+    string is part of the ETag, since it changes the response of most views.
+
+    Args:
+        *keys: Redis keys the response is built from
+        window: Value identifying the current state of a time window the
+            response depends on (see conditional()). Defaults to None.
+
+    Returns:
+        tuple: (etag, last_modified), or (None, None) if a key has no recorded
+            version yet. last_modified is None for a time-windowed response,
+            since the time its window last moved isn't known.
+    """
+    version = get_cache_version(*keys)
+    if version is None:
+        return None, None
+    tag = "{}|{}|{}".format(request.full_path, ",".join(keys), version)
+    if window is not None:
+        tag = "{}|{}".format(tag, window)
+    etag = hashlib.sha1(tag.encode("utf-8")).hexdigest()
+    if window is not None:
+        return etag, None
+    # HTTP dates have a resolution of one second
+    last_modified = datetime.fromtimestamp(int(version), timezone.utc)
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified):
+    """Check the conditional request headers against the validators
+
+    If-None-Match takes precedence over If-Modified-Since, as required by
+    RFC 9110.
+
+    Args:
+        etag: Current ETag of the resource
+        last_modified: Current Last-Modified datetime of the resource, or
+            None if it has none
+
+    Returns:
+        bool: True if the client's copy is still valid
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(*keys, window=None):
+    """Decorator adding ETag/Last-Modified validation to a GET view
+
+    A 304 response is returned without calling the view when the client
+    already has the current version, so the cached data isn't loaded or
+    serialized. Otherwise the validators are added to the view's response.
+    Responses must be revalidated on every use ('no-cache'), so clients
+    never see data older than the cache.
+
+    Views showing a time window (e.g. the comments of the last 7 days) also
+    change when the window moves while the cache doesn't, so they pass a
+    window function whose value is added to the ETag.
+
+    Args:
+        *keys: Redis keys the response of the view is built from
+        window: Optional function called with the arguments of the view,
+            returning a value that changes whenever the window moves, e.g.
+            the current day or the time the oldest item of the window
+            expires. None if the request doesn't depend on a window.
+            Defaults to None.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = cache_validators(
+                *keys, window=window(**kwargs) if window else None
+            )
+            if etag is None:
+                return view(*args, **kwargs)
+            if is_not_modified(etag, last_modified):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            # weak, since the same ETag is used for every content encoding
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+    return decorator
@@ -2,13 +2,16 @@
 
 from __future__ import print_function
 
+import bisect
 import datetime
+import hashlib
 import json
 import logging
 import os
 import random
 import re
 import statistics
+import threading
 import time
 import xmlrpc
 from urllib.parse import urlparse
@@ -20,6 +23,12 @@ from jira import JIRA
 from jira.exceptions import JIRAError
 from slack_sdk import WebClient
 
+from t5gweb.metrics import REAUTHS, REDIS_VALUE_SIZE, external_call, response_hook
+from t5gweb.profiling import profiled
+from t5gweb.records import Card, Case, record_hook
+from t5gweb.sketches import DDSketch
+from t5gweb.snapshots import load_snapshot, publish_snapshot, publishing
+from t5gweb.tracing import span, traced
 from t5gweb.utils import (
     email_notify,
     exists_or_zero,
@@ -52,6 +61,11 @@ status_map = {
     "Closed": "Done",
 }
 
+# compact records of the cached cards and cases, see get_records()
+record_classes = {"cards": Card, "cases": Case}
+_records = {}
+_records_lock = threading.Lock()
+
 
 def jira_connection(cfg):
     """Initiate a connection to the JIRA server
@@ -68,7 +82,10 @@ def jira_connection(cfg):
     """
 
     logging.warning("attempting to connect to jira...")
-    jira = JIRA(server=cfg["server"], basic_auth=(cfg["username"], cfg["password"]))
+    with external_call("jira", "connect"):
+        jira = JIRA(server=cfg["server"], basic_auth=(cfg["username"], cfg["password"]))
+    # time every request made through the connection
+    jira._session.hooks["response"].append(response_hook("jira"))
 
     return jira
 
@@ -232,7 +249,7 @@ def get_card_summary():
             - ready_to_close: Count of cards in Ready To Close status
             - done: Count of cards in Done status
     """
-    cards = redis_get("cards")
+    cards = get_records("cards")
     backlog = [card for card in cards if cards[card]["card_status"] == "Backlog"]
     debugging = [card for card in cards if cards[card]["card_status"] == "Debugging"]
     eng_working = [
@@ -304,7 +321,8 @@ def add_watcher_to_case(cfg, case, username, token):
     # Send the POST request to add the watcher
     headers = make_headers(token)
     url = f"{cfg['redhat_api']}/v1/cases/{case}/notifiedusers"
-    response = requests.post(url, headers=headers, json=payload)
+    with external_call("portal", "add watcher"):
+        response = requests.post(url, headers=headers, json=payload)
 
     # Check the response status code.
     if response.status_code != 201:
@@ -319,6 +337,7 @@ def add_watcher_to_case(cfg, case, username, token):
     return True
 
 
+@traced()
 def create_cards(cfg, new_cases, action="none"):
     """Create JIRA cards for new support cases
 
@@ -388,7 +407,7 @@ def _setup_card_creation_context(cfg):
 
     jira_conn = jira_connection(cfg)
     board = get_board_id(jira_conn, cfg["board"])
-    token = get_token(cfg["offline_token"])
+    token = get_token(cfg["offline_token"], cfg["sso_url"])
 
     if not cfg["sprintname"]:
         raise ValueError("No sprintname is defined.")
@@ -451,10 +470,11 @@ def _notify_slack_error(cfg, case, error_msg):
             f":warning: Failed to create JIRA card for case {case}\n"
             f"Error: {error_msg[:200]}"  # Truncate long error messages
         )
-        client.chat_postMessage(
-            channel=cfg["low_severity_slack_channel"],
-            text=message,
-        )
+        with external_call("slack", "post"):
+            client.chat_postMessage(
+                channel=cfg["low_severity_slack_channel"],
+                text=message,
+            )
     except Exception as slack_err:
         logging.error(f"Failed to send Slack error notification: {slack_err}")
 
@@ -524,9 +544,7 @@ def _is_old_case(case_data):
     Returns:
         bool: True if case is older than 15 days, False otherwise
     """
-    case_creation_date = datetime.datetime.strptime(
-        case_data["createdate"], "%Y-%m-%dT%H:%M:%SZ"
-    )
+    case_creation_date = format_date(case_data["createdate"])
     date_now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
     return case_creation_date < date_now - datetime.timedelta(days=15)
 
@@ -856,19 +874,34 @@ def redis_set(key, value):
     """Store a key-value pair in Redis cache
 
     Connects to the Redis server and stores the provided value under the
-    specified key.
+    specified key. The time of the update is recorded in the 'cache_versions'
+    hash, see get_cache_version(). Values identical to the cached one are
+    not written again, so the version only changes when the data does.
 
     Args:
         key: Redis key name
         value: Value to store (should be JSON-serialized string for complex data)
+
+    Returns:
+        bool: True if the cached value changed
     """
     logging.warning("syncing {}..".format(key))
     r_cache = redis.Redis(host="redis")
-    r_cache.mset({key: value})
+    encoded = str(value).encode("utf-8")
+    REDIS_VALUE_SIZE.labels(key).observe(len(encoded))
+    digest = hashlib.sha1(encoded).hexdigest()
+    if r_cache.hget("cache_digests", key) == digest.encode("utf-8"):
+        logging.warning("{}....unchanged".format(key))
+        return False
+    with span("redis set", key=key, size=len(encoded)):
+        r_cache.mset({key: value})
+        r_cache.hset("cache_versions", key, time.time())
+        r_cache.hset("cache_digests", key, digest)
     logging.warning("{}....synced".format(key))
+    return True
 
 
-def redis_get(key):
+def redis_get(key, object_hook=None):
     """Retrieve a value from Redis cache
 
     Connects to the Redis server and retrieves the value for the specified
@@ -876,6 +909,8 @@ def redis_get(key):
 
     Args:
         key: Redis key name to retrieve
+        object_hook: Optional json object_hook applied while decoding.
+            Defaults to None.
 
     Returns:
         dict or other: Deserialized value from Redis, or empty dict if key
@@ -883,18 +918,219 @@ def redis_get(key):
     """
     logging.warning("fetching {}..".format(key))
     r_cache = redis.Redis(host="redis")
+    with span("redis get", key=key):
+        try:
+            data = r_cache.get(key)
+        except redis.exceptions.ConnectionError:
+            logging.warning("Couldn't connect to redis host, setting data to None")
+            data = None
+        if data is not None:
+            data = json.loads(data.decode("utf-8"), object_hook=object_hook)
+        else:
+            data = {}
+    logging.warning("{} ....fetched".format(key))
+
+    return data
+
+
+def redis_hset(key, mapping):
+    """Replace a Redis hash with the provided fields
+
+    Deletes the existing hash and stores every field in a single transaction,
+    so readers never see a mix of old and new fields.
+
+    Args:
+        key: Redis key name of the hash
+        mapping: Dictionary of field name to value (should be JSON-serialized
+            strings for complex data)
+    """
+    logging.warning("syncing {}..".format(key))
+    REDIS_VALUE_SIZE.labels(key).observe(
+        sum(len(str(value).encode("utf-8")) for value in mapping.values())
+    )
+    r_cache = redis.Redis(host="redis")
+    pipe = r_cache.pipeline()
+    pipe.delete(key)
+    if mapping:
+        pipe.hset(key, mapping=mapping)
+    pipe.hset("cache_versions", key, time.time())
+    pipe.execute()
+    logging.warning("{}....synced".format(key))
+
+
+def redis_hmget(key, fields):
+    """Retrieve several fields of a Redis hash
+
+    Args:
+        key: Redis key name of the hash
+        fields: List of field names to retrieve
+
+    Returns:
+        dict: Deserialized value of each existing field, keyed by field name
+    """
+    if not fields:
+        return {}
+    r_cache = redis.Redis(host="redis")
+    try:
+        values = r_cache.hmget(key, fields)
+    except redis.exceptions.ConnectionError:
+        logging.warning("Couldn't connect to redis host, setting data to None")
+        values = [None] * len(fields)
+    return {
+        field: json.loads(value.decode("utf-8"))
+        for field, value in zip(fields, values)
+        if value is not None
+    }
+
+
+def redis_hscan(key, count=500):
+    """Iterate over the fields of a Redis hash without loading it at once
+
+    Args:
+        key: Redis key name of the hash
+        count: Number of fields fetched per round trip. Defaults to 500.
+
+    Yields:
+        tuple: (field name, deserialized value) for every field of the hash
+    """
+    r_cache = redis.Redis(host="redis")
+    for field, value in r_cache.hscan_iter(key, count=count):
+        yield field.decode("utf-8"), json.loads(value.decode("utf-8"))
+
+
+def count_record_changes(key, records):
+    """Count the records that changed since the last call for the same key
+
+    A digest of every record is kept in the 'record_digests:<key>' hash, so
+    the previous records don't need to be loaded to compare them.
+
+    Args:
+        key: Redis key name of the records (e.g. 'cases')
+        records: Dictionary of records keyed by ID
+
+    Returns:
+        int: Number of added, modified and removed records
+    """
+    digests = {
+        record_id: hashlib.sha1(
+            json.dumps(record, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        for record_id, record in records.items()
+    }
+    r_cache = redis.Redis(host="redis")
+    digest_key = "record_digests:{}".format(key)
+    previous = {
+        record_id.decode("utf-8"): digest.decode("utf-8")
+        for record_id, digest in r_cache.hgetall(digest_key).items()
+    }
+    changes = sum(
+        1 for record_id, digest in digests.items() if previous.get(record_id) != digest
+    )
+    changes += len(previous.keys() - digests.keys())
+    pipe = r_cache.pipeline()
+    pipe.delete(digest_key)
+    if digests:
+        pipe.hset(digest_key, mapping=digests)
+    pipe.execute()
+    return changes
+
+
+def get_cache_version(*keys):
+    """Get the time of the last update of one or more cached keys
+
+    Cheap to call since only the 'cache_versions' hash is read, so it can be
+    used to validate HTTP caches without loading the cached data.
+
+    Args:
+        *keys: Redis key names
+
+    Returns:
+        float: Unix time of the most recent update of any of the keys, or None
+            if a key has no recorded version or connection fails
+    """
+    r_cache = redis.Redis(host="redis")
     try:
-        data = r_cache.get(key)
+        versions = r_cache.hmget("cache_versions", keys)
+    except redis.exceptions.ConnectionError:
+        logging.warning("Couldn't connect to redis host, setting versions to None")
+        return None
+    if not versions or None in versions:
+        return None
+    return max(float(version) for version in versions)
+
+
+def get_records(key):
+    """Get the cached cards or cases as compact records
+
+    The records are kept by the process and only reloaded when the cache
+    version of the key changes, so the views don't parse the whole cache on
+    every request. They are read from the memory-mapped snapshot of the
+    version, shared by the workers of the host (see t5gweb.snapshots), or
+    built from the cache when snapshots are disabled (see t5gweb.records).
+    Empty records, e.g. from a failed read, are not kept.
+
+    Args:
+        key: 'cards' or 'cases'
+
+    Returns:
+        Mapping: Records keyed like the cache. They are shared by every
+            caller, use records.replace() instead of modifying them.
+    """
+    version = get_cache_version(key)
+    record_class = record_classes[key]
+    with _records_lock:
+        cached = _records.get(key)
+        if version is not None and cached is not None and cached[0] == version:
+            return cached[1]
+        records = load_snapshot(
+            key, version, lambda: redis_get(key), shared=record_class.shared
+        )
+        if records is None:
+            records = redis_get(key, object_hook=record_hook(record_class))
+        # redis_get() returns {} when Redis can't be reached, don't keep that
+        # for the whole version
+        if records:
+            _records[key] = (version, records)
+    return records
+
+
+def publish_records(key, data):
+    """Publish the snapshot of freshly cached cards or cases
+
+    Only done when t5g_snapshot_dir is set, see t5gweb.snapshots.
+
+    Args:
+        key: 'cards' or 'cases'
+        data: Dictionary of records just cached under key
+    """
+    if not publishing():
+        return
+    try:
+        publish_snapshot(key, get_cache_version(key), data)
+    except OSError as e:
+        logging.warning("couldn't publish the snapshot of %s: %s", key, e)
+
+
+def redis_hget(key, field):
+    """Retrieve a single field of a Redis hash
+
+    Args:
+        key: Redis key name of the hash
+        field: Field name to retrieve
+
+    Returns:
+        dict or other: Deserialized value of the field, or empty dict if the
+            field doesn't exist or connection fails
+    """
+    r_cache = redis.Redis(host="redis")
+    try:
+        data = r_cache.hget(key, field)
     except redis.exceptions.ConnectionError:
         logging.warning("Couldn't connect to redis host, setting data to None")
         data = None
     if data is not None:
-        data = json.loads(data.decode("utf-8"))
-    else:
-        data = {}
-    logging.warning("{} ....fetched".format(key))
-
-    return data
+        return json.loads(data.decode("utf-8"))
+    return {}
 
 
 def get_case_from_link(jira_conn, card):
@@ -920,6 +1156,8 @@ def get_case_from_link(jira_conn, card):
     return None
 
 
+@traced()
+@profiled("generate_stats")
 def generate_stats(account=None, engineer=None):
     """Generate comprehensive statistics from cached cards and cases
 
@@ -956,8 +1194,8 @@ def generate_stats(account=None, engineer=None):
     logging.warning("generating stats")
     start = time.time()
 
-    cards = redis_get("cards")
-    cases = redis_get("cases")
+    cards = get_records("cards")
+    cases = get_records("cases")
     bugs = redis_get("bugs")
     issues = redis_get("issues")
 
@@ -971,17 +1209,10 @@ def generate_stats(account=None, engineer=None):
             c: d for (c, d) in cards.items() if d["assignee"]["displayName"] == engineer
         }
 
-        # get case number and assignee from cards so that we can determine which cases
+        # get case number from cards so that we can determine which cases
         # belong to the engineer
-        temp_cases = {}
-        for case, details in cases.items():
-            for card in cards:
-                if (
-                    case == cards[card]["case_number"]
-                    and cards[card]["assignee"]["displayName"] == engineer
-                ):
-                    temp_cases[case] = details
-        cases = temp_cases
+        engineer_cases = {cards[card]["case_number"] for card in cards}
+        cases = {c: d for (c, d) in cases.items() if c in engineer_cases}
 
     today = datetime.date.today()
 
@@ -1142,54 +1373,192 @@ def plot_stats():
     return x_values, y_values
 
 
-def generate_histogram_stats(account=None, engineer=None):
+# Upper bound (in days) of each histogram bucket; the last bucket is open-ended
+histogram_bucket_edges = [0, 1, 2, 3, 7, 14, 30, 60, 90, 180, 365]
+
+histogram_severities = ["Urgent", "High", "Normal", "Low"]
+# format of the 'duration_sketches' cache, see update_duration_sketches()
+duration_sketches_version = 2
+
+
+def histogram_bucket_labels():
+    """Build display labels for the fixed histogram buckets
+
+    Returns:
+        list: Labels such as '0-1', '1-2', ... '365+' matching the bucket
+            counts returned by generate_histogram_stats()
+    """
+    labels = [
+        f"{low}-{high}"
+        for low, high in zip(histogram_bucket_edges, histogram_bucket_edges[1:])
+    ]
+    labels.append(f"{histogram_bucket_edges[-1]}+")
+    return labels
+
+
+def _new_histogram_accumulator():
+    """Create empty per-outcome, per-severity lists of durations
+
+    Each outcome gets its own dictionary so that relief and resolution times
+    are never collected into the same lists.
+
+    Returns:
+        dict: {"Resolved": {severity: []}, "Relief": {severity: []}}
+    """
+    return {
+        outcome: {severity: [] for severity in histogram_severities}
+        for outcome in ("Resolved", "Relief")
+    }
+
+
+def _outcome_datetime(timestamp):
+    """Parse a relief/resolution timestamp from the portal API
+
+    Args:
+        timestamp: Either epoch milliseconds (int) or a '%Y-%m-%dT%H:%M:%SZ'
+            string
+
+    Returns:
+        datetime.datetime: Parsed timestamp
     """
-    Calculates histogram statistics for resolved and relief times of cards.
+    if isinstance(timestamp, int):
+        # Timestamp is provided w/ empty milliseconds, so divide by 1000
+        return datetime.datetime.fromtimestamp(timestamp / 1000)
+    return format_date(timestamp)
+
+
+def _days_since_creation(timestamp, case_created):
+    """Calculate the number of days between case creation and a timestamp
+
+    Args:
+        timestamp: Either epoch milliseconds (int) or a '%Y-%m-%dT%H:%M:%SZ'
+            string as returned by the portal API
+        case_created: Case creation date string
+
+    Returns:
+        float: Fractional number of days from creation until the timestamp
+    """
+    elapsed = _outcome_datetime(timestamp) - format_date(case_created)
+    return elapsed.total_seconds() / (60 * 60 * 24)
+
+
+def _percentile(sorted_data, percent):
+    """Linearly interpolated percentile of already sorted data
+
+    Args:
+        sorted_data: Non-empty list of numbers in ascending order
+        percent: Percentile to compute, between 0 and 100
+
+    Returns:
+        float: The requested percentile
+    """
+    position = (len(sorted_data) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_data) - 1)
+    fraction = position - lower
+    return sorted_data[lower] + (sorted_data[upper] - sorted_data[lower]) * fraction
+
+
+def _summarize_histogram(durations):
+    """Bin durations into the fixed buckets and compute summary statistics
+
+    Args:
+        durations: List of durations (in days) for a single outcome/severity
+
+    Returns:
+        dict: Dictionary with 'buckets' (count per bucket in
+            histogram_bucket_edges), 'count', 'mean', 'median' and 'p90'. The
+            statistics are None when there is no data.
+    """
+    buckets = [0] * len(histogram_bucket_edges)
+    for days in durations:
+        index = max(bisect.bisect_right(histogram_bucket_edges, days) - 1, 0)
+        buckets[index] += 1
+
+    summary = {
+        "buckets": buckets,
+        "count": len(durations),
+        "mean": None,
+        "median": None,
+        "p90": None,
+    }
+    if durations:
+        sorted_durations = sorted(durations)
+        summary["mean"] = statistics.fmean(sorted_durations)
+        summary["median"] = statistics.median(sorted_durations)
+        summary["p90"] = _percentile(sorted_durations, 90)
+    return summary
+
+
+def _card_durations(details):
+    """Get the time to resolution and relief of a single card
+
+    Args:
+        details: Card dictionary from the 'cards' cache
+
+    Returns:
+        dict: {"Resolved": days or None, "Relief": days or None}
+    """
+    case_created = details.get("case_created")
+    durations = {"Resolved": None, "Relief": None}
+    for outcome, key in (("Resolved", "resolved_at"), ("Relief", "relief_at")):
+        if details.get(key) is not None:
+            durations[outcome] = _days_since_creation(details[key], case_created)
+    return durations
+
+
+def _accumulate_durations(accumulator, severity, durations):
+    """Add a card's durations to an accumulator built by
+    _new_histogram_accumulator()"""
+    for outcome, days in durations.items():
+        if days is not None and severity in accumulator[outcome]:
+            accumulator[outcome][severity].append(days)
+
+
+def _summarize_accumulator(accumulator):
+    """Summarize every outcome/severity list of an accumulator"""
+    return {
+        outcome: {
+            severity: _summarize_histogram(durations)
+            for severity, durations in by_severity.items()
+        }
+        for outcome, by_severity in accumulator.items()
+    }
+
+
+def generate_histogram_stats(account=None, engineer=None, cards=None):
+    """Calculate bucketed time to resolution and relief statistics of cards
+
+    Durations are binned server-side into the fixed histogram_bucket_edges so
+    only the bucket counts and summary statistics are sent to the browser.
 
     Args:
         account (str, optional): Filter cards by account. Defaults to None.
+        engineer (str, optional): Filter cards by assignee. Defaults to None.
+        cards (dict, optional): Cards to use instead of reading the 'cards'
+            cache. Defaults to None.
 
     Returns:
-        dict: A dictionary containing histogram statistics for resolved / relief times.
-              The structure of the dictionary is as follows:
+        dict: A dictionary containing histogram statistics for resolved / relief
+              times. The structure of the dictionary is as follows:
               {
                   "Resolved": {
-                      "<severity1>": {
-                          "data": [<time1>, <time2>, ...],
+                      "<severity>": {
+                          "buckets": [<count per bucket>, ...],
+                          "count": <number of cards>,
                           "mean": <mean of data>,
-                          "median": <median of data>
-                      },
-                      "<severity2>": {
-                          "data": [<time1>, <time2>, ...],
-                          "mean": <mean of data>,
-                          "median": <median of data>
+                          "median": <median of data>,
+                          "p90": <90th percentile of data>
                       },
                       ...
                   },
-                  "Relief": {
-                      "<severity1>": {
-                          "data": [<time1>, <time2>, ...],
-                          "mean": <mean of data>,
-                          "median": <median of data>
-                      },
-                      "<severity2>": {
-                          "data": [<time1>, <time2>, ...],
-                          "mean": <mean of data>,
-                          "median": <median of data>
-                      },
-                      ...
-                  }
+                  "Relief": {...same as "Resolved"...}
               }
-              The times are represented as the number of days until resolution / relief.
+              The times are represented as the number of days until
+              resolution / relief.
     """
-    seconds_per_day = 60 * 60 * 24
-    base_dictionary = {
-        "Urgent": {"data": [], "mean": None, "median": None},
-        "High": {"data": [], "mean": None, "median": None},
-        "Normal": {"data": [], "mean": None, "median": None},
-        "Low": {"data": [], "mean": None, "median": None},
-    }
-    cards = redis_get("cards")
+    if cards is None:
+        cards = redis_get("cards")
     if account is not None:
         logging.warning(f"filtering cards for {account}")
         cards = {c: d for (c, d) in cards.items() if d["account"] == account}
@@ -1200,53 +1569,258 @@ def generate_histogram_stats(account=None, engineer=None):
             c: d for (c, d) in cards.items() if d["assignee"]["displayName"] == engineer
         }
 
-    histogram_data = {
-        "Resolved": base_dictionary,
-        "Relief": base_dictionary,
-    }
+    accumulator = _new_histogram_accumulator()
+    for details in cards.values():
+        _accumulate_durations(
+            accumulator, details.get("severity"), _card_durations(details)
+        )
+
+    return _summarize_accumulator(accumulator)
+
+
+def generate_all_histogram_stats(cards):
+    """Calculate histogram statistics overall, per account and per engineer
 
-    # Iterate over each entry in the input dictionary
-    for card, details in cards.items():
+    Walks the cards once and accumulates every card into the overall, account
+    and engineer accumulators so the results can be cached together after a
+    card refresh.
+
+    Args:
+        cards: Dictionary of cards from the 'cards' cache
+
+    Returns:
+        dict: {"all": stats, "accounts": {account: stats},
+            "engineers": {engineer: stats}} where each stats value has the
+            structure returned by generate_histogram_stats()
+    """
+    overall = _new_histogram_accumulator()
+    accounts = {}
+    engineers = {}
+    for details in cards.values():
         severity = details.get("severity")
-        resolved_at = details.get("resolved_at")
-        relief_at = details.get("relief_at")
-        case_created = details.get("case_created")
-
-        # Add time to resolution to the "Resolved" dictionary, indexed by severity
-        if resolved_at is not None:
-            if isinstance(resolved_at, int):
-                # Timestamp is provided w/ empty milliseconds, so divide by 1000
-                resolved_at = datetime.datetime.fromtimestamp(resolved_at / 1000)
-            else:
-                resolved_at = format_date(resolved_at)
-            days_until_resolved = (
-                resolved_at - format_date(case_created)
-            ).total_seconds() / seconds_per_day
-            histogram_data["Resolved"][severity]["data"].append(days_until_resolved)
-
-        # Add time to relief to the "Relief" dictionary, indexed by severity
-        if relief_at is not None:
-            if isinstance(relief_at, int):
-                # Timestamp is provided w/ empty milliseconds, so divide by 1000
-                relief_at = datetime.datetime.fromtimestamp(relief_at / 1000)
+        durations = _card_durations(details)
+        _accumulate_durations(overall, severity, durations)
+
+        account = details.get("account")
+        if account not in accounts:
+            accounts[account] = _new_histogram_accumulator()
+        _accumulate_durations(accounts[account], severity, durations)
+
+        engineer = details["assignee"]["displayName"]
+        if engineer is not None:
+            if engineer not in engineers:
+                engineers[engineer] = _new_histogram_accumulator()
+            _accumulate_durations(engineers[engineer], severity, durations)
+
+    return {
+        "all": _summarize_accumulator(overall),
+        "accounts": {a: _summarize_accumulator(d) for a, d in accounts.items()},
+        "engineers": {e: _summarize_accumulator(d) for e, d in engineers.items()},
+    }
+
+
+def lookup_histogram_stats(account=None, engineer=None):
+    """Look up histogram statistics from the cache
+
+    Uses the statistics precomputed by cache.get_histogram_stats() after each
+    card refresh and falls back to computing them from the cards cache when
+    they are missing.
+
+    Args:
+        account (str, optional): Account to look up. Defaults to None.
+        engineer (str, optional): Engineer to look up. Defaults to None.
+
+    Returns:
+        dict: Histogram statistics as returned by generate_histogram_stats()
+    """
+    histograms = redis_get("histograms")
+    if histograms:
+        if account is not None and engineer is None:
+            cached = histograms["accounts"].get(account)
+        elif engineer is not None and account is None:
+            cached = histograms["engineers"].get(engineer)
+        elif account is None and engineer is None:
+            cached = histograms["all"]
+        else:
+            cached = None
+        if cached is not None:
+            return cached
+    return generate_histogram_stats(account, engineer)
+
+
+def update_duration_sketches(duration_sketches, cards):
+    """Add newly relieved/resolved cards to the duration sketches
+
+    Sketches are kept per outcome, per month of relief/resolution and per
+    severity, for all cards and for every account and engineer, so that
+    percentiles can be computed for any range of months by merging sketches.
+    Each card is recorded once per outcome, with its timestamp and
+    dimensions, so the sketches can be updated incrementally on every card
+    refresh: a card is only re-recorded when one of them changes. Cards no
+    longer cached are forgotten, their durations stay in the sketches.
+
+    Args:
+        duration_sketches: Structure previously returned by this function, or
+            an empty dict to start from scratch. Updated in place; a
+            structure of an older format is rebuilt.
+        cards: Dictionary of cards from the 'cards' cache
+
+    Returns:
+        dict: The updated structure:
+            {
+                "version": 2,
+                "recorded": {
+                    "<outcome>": {
+                        "<card key>": [<timestamp>, <case created>,
+                                       <severity>, <account>, <engineer>]
+                    }
+                },
+                "sketches": {
+                    "<outcome>": {
+                        "<YYYY-MM>": {
+                            "<severity>": {
+                                "all": <DDSketch dict>,
+                                "accounts": {"<account>": <DDSketch dict>},
+                                "engineers": {"<engineer>": <DDSketch dict>}
+                            }
+                        }
+                    }
+                }
+            }
+    """
+    if duration_sketches.get("version") != duration_sketches_version:
+        duration_sketches.clear()
+        duration_sketches["version"] = duration_sketches_version
+    recorded = duration_sketches.setdefault("recorded", {})
+    sketches = duration_sketches.setdefault("sketches", {})
+    for outcome, key in (("Resolved", "resolved_at"), ("Relief", "relief_at")):
+        previous = recorded.get(outcome, {})
+        current = {}
+        by_month = sketches.setdefault(outcome, {})
+        for card, details in cards.items():
+            if details.get(key) is None:
+                entry = None
             else:
-                relief_at = format_date(relief_at)
-            days_until_relief = (
-                relief_at - format_date(case_created)
-            ).total_seconds() / seconds_per_day
-            histogram_data["Relief"][severity]["data"].append(days_until_relief)
+                entry = [
+                    details[key],
+                    details["case_created"],
+                    details["severity"],
+                    details["account"],
+                    details["assignee"]["displayName"] or "",
+                ]
+            old = previous.get(card)
+            if old != entry:
+                if old is not None:
+                    _record_duration(by_month, old, remove=True)
+                if entry is not None:
+                    _record_duration(by_month, entry)
+            if entry is not None:
+                current[card] = entry
+        recorded[outcome] = current
+    return duration_sketches
+
+
+def _record_duration(by_month, entry, remove=False):
+    """Add or remove the duration of a recorded card to/from its sketches
+
+    Args:
+        by_month: Sketches of an outcome, see update_duration_sketches()
+        entry: Recorded [timestamp, case created, severity, account, engineer]
+        remove: Remove the duration instead of adding it. Defaults to False.
+    """
+    timestamp, case_created, severity, account, engineer = entry
+    month = _outcome_datetime(timestamp).strftime("%Y-%m")
+    duration = _days_since_creation(timestamp, case_created)
+    by_severity = by_month.setdefault(month, {}).setdefault(
+        severity, {"all": None, "accounts": {}, "engineers": {}}
+    )
+    for container, name in (
+        (by_severity, "all"),
+        (by_severity["accounts"], account),
+        (by_severity["engineers"], engineer),
+    ):
+        data = container.get(name)
+        sketch = DDSketch() if data is None else DDSketch.from_dict(data)
+        if remove:
+            sketch.remove(duration)
+        else:
+            sketch.add(duration)
+        container[name] = sketch.to_dict()
+
+
+def _summarize_sketch(sketch):
+    """Summarize a DDSketch as count, mean, p50, p90 and p99"""
+    return {
+        "count": sketch.count,
+        "mean": sketch.mean,
+        "p50": sketch.quantile(0.5),
+        "p90": sketch.quantile(0.9),
+        "p99": sketch.quantile(0.99),
+    }
 
-    # Calculate mean and median for each severity level
-    for status in ["Resolved", "Relief"]:
-        for severity in histogram_data[status]:
-            data = histogram_data[status][severity]["data"]
-            if data:
-                histogram_data[status][severity]["mean"] = statistics.mean(data)
-                histogram_data[status][severity]["median"] = statistics.median(data)
 
-    return histogram_data
+def get_duration_percentiles(
+    outcome, start=None, end=None, severity=None, account=None, engineer=None
+):
+    """Get time to relief/resolution percentiles from the cached sketches
 
+    Merges the sketches maintained by cache.get_duration_sketches() that
+    match the requested window and dimensions, without reading any cards.
+    Sketches are kept per month, so the window is widened to whole months.
 
+    Args:
+        outcome: Either 'Relief' or 'Resolved'
+        start (str, optional): First day (YYYY-MM-DD) or month (YYYY-MM) of
+            the window, inclusive. Defaults to None (no lower bound).
+        end (str, optional): Last day (YYYY-MM-DD) or month (YYYY-MM) of the
+            window, inclusive. Defaults to None (no upper bound).
+        severity (str, optional): Only include this severity. Defaults to None.
+        account (str, optional): Only include this account. Defaults to None.
+        engineer (str, optional): Only include this engineer. Defaults to None.
+
+    Returns:
+        dict: Summary with 'count', 'mean', 'p50', 'p90' and 'p99' (in days)
+            for every severity and for all severities combined under 'All'
+
+    Raises:
+        ValueError: Both account and engineer are given, sketches are only
+            kept per account and per engineer
+    """
+    if account is not None and engineer is not None:
+        raise ValueError("filter by account or by engineer, not both")
+    duration_sketches = redis_get("duration_sketches")
+    if duration_sketches.get("version") != duration_sketches_version:
+        duration_sketches = {}
+    by_month = duration_sketches.get("sketches", {}).get(outcome, {})
+    start = start[:7] if start is not None else None
+    end = end[:7] if end is not None else None
+    merged = {s: DDSketch() for s in histogram_severities}
+    for month, by_severity in by_month.items():
+        if (start is not None and month < start) or (end is not None and month > end):
+            continue
+        for sketch_severity, sketches in by_severity.items():
+            if severity is not None and sketch_severity != severity:
+                continue
+            if account is not None:
+                sketch = sketches["accounts"].get(account)
+            elif engineer is not None:
+                sketch = sketches["engineers"].get(engineer)
+            else:
+                sketch = sketches["all"]
+            if sketch is not None:
+                merged.setdefault(sketch_severity, DDSketch()).merge(
+                    DDSketch.from_dict(sketch)
+                )
+
+    combined = DDSketch()
+    for sketch in merged.values():
+        combined.merge(sketch)
+    percentiles = {s: _summarize_sketch(sketch) for s, sketch in merged.items()}
+    percentiles["All"] = _summarize_sketch(combined)
+    return percentiles
+
+
+@traced()
 def sync_priority(cfg):
     """Synchronize JIRA card priorities with case severities
 
@@ -1311,6 +1885,7 @@ def _get_jira_issue_with_retry(jira_conn, issue_key, cfg, expand=None):
         return jira_conn.issue(issue_key, expand=expand)
     except JIRAError:
         logging.warning("JIRA Exception. Possible 401. Reconnecting.....")
+        REAUTHS.labels("jira").inc()
         jira_conn = jira_connection(cfg)
         return jira_conn.issue(issue_key, expand=expand)
 
@@ -1337,6 +1912,7 @@ def get_issues_in_sprint(cfg, sprint, jira_conn, max_results=False):
     return cards["issues"]
 
 
+@traced()
 def sync_portal_to_jira():
     """Synchronize Red Hat Portal cases to JIRA by creating missing cards
 
@@ -1372,9 +1948,10 @@ def sync_portal_to_jira():
                 "full_message": (f"{max_warning_message}\nNew cases: {new_cases}\n")
             }
         }
-        cfg["to"] = cfg["alert_email"]
-        cfg["subject"] = "High New Case Count Detected"
-        email_notify(cfg, notification_content)
+        alert_cfg = dict(
+            cfg, to=cfg["alert_email"], subject="High New Case Count Detected"
+        )
+        email_notify(alert_cfg, notification_content)
     elif len(new_cases) > 0:
         logging.warning("need to create {} cases".format(len(new_cases)))
         notification_content, new_cards, novel_cases = create_cards(
@@ -1384,16 +1961,19 @@ def sync_portal_to_jira():
             logging.warning("notifying team about new JIRA cards")
             if len(new_cards) != len(notification_content):
                 logging.warning("# of notifications does not match number of new cards")
-            cfg["subject"] += ": {}".format(", ".join(novel_cases))
-            email_notify(cfg, notification_content)
+            notify_cfg = dict(
+                cfg, subject="{}: {}".format(cfg["subject"], ", ".join(novel_cases))
+            )
+            email_notify(notify_cfg, notification_content)
             if cfg["slack_token"] and (
                 cfg["high_severity_slack_channel"] or cfg["low_severity_slack_channel"]
             ):
-                slack_notify(cfg, notification_content)
+                slack_notify(notify_cfg, notification_content)
             else:
                 logging.warning("no slack token or channel specified")
             cards.update(new_cards)
-            redis_set("cards", json.dumps(cards))
+            if redis_set("cards", json.dumps(cards)):
+                publish_records("cards", cards)
         response = {"cards_created": len(new_cases)}
     else:
         logging.warning("no new cards required")
@@ -1403,6 +1983,7 @@ def sync_portal_to_jira():
     return response
 
 
+@traced()
 def tag_bz():
     """Function to tag Bugzilla and JIRA bugs with Telco keywords
 
@@ -1426,8 +2007,7 @@ def tag_bz():
         return
 
     logging.warning("getting bugzillas")
-    bz_url = "bugzilla.redhat.com"
-    bz_api = bugzilla.Bugzilla(bz_url, api_key=cfg["bz_key"])
+    bz_api = bugzilla.Bugzilla(cfg["bz_url"], api_key=cfg["bz_key"])
     cases = redis_get("cases")
     bugs = redis_get("bugs")
     issues = redis_get("issues")
@@ -1447,7 +2027,8 @@ def tag_bz():
         if case in cases:
             for bug in bugs[case]:
                 try:
-                    bz = bz_api.getbug(bug["bugzillaNumber"])
+                    with external_call("bugzilla", "getbug"):
+                        bz = bz_api.getbug(bug["bugzillaNumber"])
                 except xmlrpc.client.Fault:
                     logging.warning(
                         "error: {} is restricted".format(bug["bugzillaNumber"])
@@ -1469,7 +2050,8 @@ def tag_bz():
                     if update:
                         logging.warning("tagging BZ:" + str(bz.id))
                         try:
-                            bz_api.update_bugs([bz.id], update)
+                            with external_call("bugzilla", "update"):
+                                bz_api.update_bugs([bz.id], update)
                             num_tagged += 1
                         except xmlrpc.client.Fault:
                             logging.warning("Tried and failed to tag " + str(bz.id))
@@ -1576,9 +2158,10 @@ def tag_bz():
         else:
             message += "   - No cards in this category\n"
         email_body[category]["full_message"] = message
-    cfg["to"] = os.environ.get("bug_email")
-    cfg["subject"] = "Summary: Jira Bug Tagging"
-    email_notify(cfg, email_body)
+    email_cfg = dict(
+        cfg, to=os.environ.get("bug_email"), subject="Summary: Jira Bug Tagging"
+    )
+    email_notify(email_cfg, email_body)
 
     return num_tagged
 
@@ -0,0 +1,158 @@
+"""metrics.py: Prometheus metrics of the web app and Celery workers"""
+
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+
+import redis
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import REGISTRY, CounterMetricFamily
+
+from t5gweb import tracing
+
+TASK_DURATION = Histogram(
+    "t5gweb_task_duration_seconds",
+    "Run time of Celery tasks",
+    ["task", "state"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, float("inf")),
+)
+TASK_RETRIES = Counter("t5gweb_task_retries", "Retries of Celery tasks", ["task"])
+EXTERNAL_CALL_DURATION = Histogram(
+    "t5gweb_external_call_duration_seconds",
+    "Latency of calls to external services",
+    ["target"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf")),
+)
+REAUTHS = Counter(
+    "t5gweb_reauths",
+    "Reconnections to an external service after an authentication error (401)",
+    ["target"],
+)
+REDIS_VALUE_SIZE = Histogram(
+    "t5gweb_redis_value_bytes",
+    "Size of the values written to the Redis cache",
+    ["key"],
+    buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8, float("inf")),
+)
+
+
+@contextmanager
+def external_call(target, operation="call"):
+    """Time and trace a call to an external service
+
+    Usage: with external_call("portal", "search"): requests.get(...)
+
+    Args:
+        target: 'portal', 'sso', 'jira', 'bugzilla', 'slack' or 'smtp'
+        operation: Name of the call, only used in the span name. Defaults to
+            'call'.
+    """
+    with tracing.span("{} {}".format(target, operation), target=target):
+        with EXTERNAL_CALL_DURATION.labels(target).time():
+            yield
+
+
+def response_hook(target):
+    """Build a requests response hook timing every request of a session
+
+    Used for clients that make requests internally, like the JIRA library.
+    The requests are also traced as children of the current span.
+
+    Args:
+        target: Name of the external service
+
+    Returns:
+        function: Hook to add to a session's hooks["response"]
+    """
+
+    def hook(response, *args, **kwargs):
+        duration = response.elapsed.total_seconds()
+        EXTERNAL_CALL_DURATION.labels(target).observe(duration)
+        tracing.record_span(
+            "{} {}".format(target, response.request.method),
+            duration,
+            target=target,
+            url=response.request.path_url,
+            status_code=response.status_code,
+        )
+
+    return hook
+
+
+def start_worker_server(port):
+    """Expose the metrics of a Celery worker over HTTP
+
+    The pool processes of a worker each have their own metrics, so they are
+    aggregated with prometheus_client's multiprocess mode when
+    PROMETHEUS_MULTIPROC_DIR is set. The directory is emptied first, so
+    metrics of a previous run aren't reported again.
+
+    Args:
+        port: Port of the metrics server, 0 to disable it
+    """
+    if not port:
+        return
+    registry = REGISTRY
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=path)
+    start_http_server(port, registry=registry)
+    logging.warning("serving worker metrics on port %s", port)
+
+
+class SingleflightCollector:
+    """Expose the singleflight attempts counted by the Celery workers
+
+    The workers run in other processes than the web app, so they count
+    attempts in the 'singleflight_attempts' Redis hash (fields are
+    '<key>|<outcome>') and this collector reads it on every scrape.
+    """
+
+    def describe(self):
+        return [self._family()]
+
+    def collect(self):
+        family = self._family()
+        try:
+            attempts = redis.Redis(host="redis").hgetall("singleflight_attempts")
+        except redis.exceptions.ConnectionError:
+            logging.warning("Couldn't connect to redis host, skipping metrics")
+            attempts = {}
+        for field, count in sorted(attempts.items()):
+            key, outcome = field.decode("utf-8").rsplit("|", 1)
+            family.add_metric([key, outcome], int(count))
+        yield family
+
+    @staticmethod
+    def _family():
+        return CounterMetricFamily(
+            "t5gweb_singleflight_attempts",
+            "Attempts to run a refresh, by outcome "
+            "(leader, coalesced, failed or timeout)",
+            labels=["key", "outcome"],
+        )
+
+
+def register_collectors(registry=REGISTRY):
+    """Register the worker metrics collectors with a Prometheus registry
+
+    Safe to call more than once, e.g. when several apps are created.
+
+    Args:
+        registry: Prometheus registry. Defaults to the global registry, which
+            is exposed on /metrics by prometheus_flask_exporter.
+    """
+    try:
+        registry.register(SingleflightCollector())
+    except ValueError:
+        logging.warning("worker metrics collectors already registered")
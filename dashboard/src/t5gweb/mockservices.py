@@ -0,0 +1,568 @@
+"""mockservices.py: stand-in Portal, SSO, JIRA and Bugzilla APIs for load tests
+
+Serves the endpoints used by the ingest tasks (get_cases, get_case_details,
+get_issue_details, get_bz_details, get_escalations and get_cards) from a
+synthetic corpus generated by bin/generate_fake_data.py, so the ingest
+pipeline can be run and benchmarked without the Red Hat APIs. Latency, error
+and 401 rates are configurable, and faults are drawn from a seeded generator
+so a run can be repeated.
+
+Point the dashboard at it with (see sample.env):
+    redhat_api=http://<host>:<port>
+    jira_server=http://<host>:<port>
+    t5g_sso_url=http://<host>:<port>
+    t5g_bz_url=http://<host>:<port>/xmlrpc.cgi
+
+Usage:
+    python -m t5gweb.mockservices data/fake_data.json --port 8000 --latency 0.05
+"""
+
+import argparse
+import datetime
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import xmlrpc.client
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xmlrpc.server import SimpleXMLRPCDispatcher
+
+from t5gweb.libtelco5g import status_map
+
+# JIRA status names of the card statuses shown by the dashboard
+jira_statuses = {shown: jira for jira, shown in status_map.items()}
+# largest page returned by the JIRA search
+max_jira_page = 1000
+
+
+def _portal_date(value):
+    """Format an ISO 8601 date like the portal, e.g. 2024-01-31T12:00:00Z"""
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class MockServices:
+    """State of the stand-in services: corpus, fault settings and counters
+
+    Args:
+        data: Fake data, as generated by bin/generate_fake_data.py
+        latency: Seconds added to every response. Defaults to 0.
+        jitter: Up to this many more seconds are added at random. Defaults
+            to 0.
+        error_rate: Fraction of requests failing with a 503. Defaults to 0.
+        unauthorized_rate: Fraction of authenticated Portal and JIRA requests
+            rejected with a 401. Defaults to 0.
+        token_ttl: Seconds an SSO access token is valid, None for no expiry.
+            Defaults to None.
+        seed: Seed of the fault injection. Defaults to 0.
+        escalations_project: JIRA project holding the escalations, see
+            jira_escalations_project. Defaults to 'ESCALATE'.
+    """
+
+    def __init__(
+        self,
+        data,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        unauthorized_rate=0.0,
+        token_ttl=None,
+        seed=0,
+        escalations_project="ESCALATE",
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.unauthorized_rate = unauthorized_rate
+        self.token_ttl = token_ttl
+        self.seed = seed
+        self.escalations_project = escalations_project
+        self.tokens = {}
+        self.projects = {}
+        self.requests = Counter()
+        self._calls = Counter()
+        self._lock = threading.Lock()
+        self._load(data)
+        self.xmlrpc = SimpleXMLRPCDispatcher(allow_none=True)
+        self.xmlrpc.register_function(self.bugzilla_version, "Bugzilla.version")
+        self.xmlrpc.register_function(self.bugzilla_get_bugs, "Bug.get")
+
+    def _load(self, data):
+        cards = data.get("cards") or {}
+        bugs = data.get("bugs") or {}
+        issues = data.get("issues") or {}
+        self.cases = data.get("cases") or {}
+        self.cards_by_case = {card["case_number"]: card for card in cards.values()}
+
+        self.portal_cases = []
+        for case_number, case in sorted(
+            self.cases.items(), key=lambda item: item[1]["createdate"]
+        ):
+            version = case.get("product_version", case["product"].split()[-1])
+            doc = {
+                "case_number": case_number,
+                "case_account_name": case["account"],
+                "case_summary": case["problem"],
+                "case_status": case["status"],
+                "case_owner": case["owner"],
+                "case_severity": case["severity"],
+                "case_createdDate": case["createdate"],
+                "case_lastModifiedDate": case["last_update"],
+                "case_description": case["description"],
+                "case_product": [case["product"].rsplit(" " + version, 1)[0]],
+                "case_version": version,
+            }
+            if "bug" in case:
+                doc["case_bugzillaNumber"] = case["bug"]
+            if case.get("tags"):
+                doc["case_tags"] = case["tags"]
+            if "closeddate" in case:
+                doc["case_closedDate"] = case["closeddate"]
+            self.portal_cases.append(doc)
+
+        self.case_bugs = bugs
+        self.bugzilla = {
+            int(bug["bugzillaNumber"]): bug
+            for case_bugs in bugs.values()
+            for bug in case_bugs
+        }
+        self.case_issues = issues
+        self.jira_issues = {
+            str(issue["id"]): issue
+            for case_issues in issues.values()
+            for issue in case_issues
+        }
+        self.jira_cards = [self._jira_card(key, card) for key, card in cards.items()]
+        self.escalations = [
+            {
+                "id": str(index),
+                "key": "{}-{}".format(self.escalations_project, index),
+                "fields": {"customfield_10979": card["case_number"]},
+                "renderedFields": {"customfield_10979": card["case_number"]},
+            }
+            for index, card in enumerate(cards.values(), 1)
+            if card.get("escalated")
+        ]
+
+    @staticmethod
+    def _jira_card(key, card):
+        """JIRA issue a fake card is built from, see cache._build_card_data()"""
+        author = {"displayName": card["assignee"]["displayName"] or "fake"}
+        comments = [
+            {
+                "id": "{}-{}".format(key, index),
+                "body": body,
+                "created": updated,
+                "updated": updated,
+                "author": author,
+            }
+            for index, (body, updated) in enumerate(card["comments"] or [])
+        ]
+        return {
+            "id": key.rsplit("-", 1)[-1],
+            "key": key,
+            "fields": {
+                "summary": "{}: {}".format(card["case_number"], card["summary"]),
+                "created": card["card_created"],
+                "labels": card["labels"],
+                "priority": {"name": card["priority"]},
+                "status": {"name": jira_statuses[card["card_status"]]},
+                "assignee": (
+                    card["assignee"] if card["assignee"]["displayName"] else None
+                ),
+                "customfield_10466": card["contributor"] or None,
+                "comment": {
+                    "comments": comments,
+                    "startAt": 0,
+                    "maxResults": len(comments),
+                    "total": len(comments),
+                },
+            },
+        }
+
+    def configure(self, **settings):
+        """Change the latency and fault settings while the server runs"""
+        for name in ("latency", "jitter", "error_rate", "unauthorized_rate"):
+            if name in settings:
+                setattr(self, name, float(settings[name]))
+        if "token_ttl" in settings:
+            ttl = settings["token_ttl"]
+            self.token_ttl = float(ttl) if ttl is not None else None
+
+    def stats(self):
+        """Number of requests per service, operation and status"""
+        with self._lock:
+            return {
+                "{} {} {}".format(*key): count for key, count in self.requests.items()
+            }
+
+    def fault(self, route, authenticated):
+        """Decide the delay and injected failure of a request
+
+        The n-th request of a route always gets the same outcome, whatever
+        the order the concurrent requests arrive in.
+
+        Args:
+            route: Name of the route
+            authenticated: True if the route can answer with a 401
+
+        Returns:
+            tuple: (delay in seconds, status code to fail with or None)
+        """
+        with self._lock:
+            self._calls[route] += 1
+            rng = random.Random("{}:{}:{}".format(self.seed, route, self._calls[route]))
+        delay = self.latency + rng.uniform(0, self.jitter)
+        roll = rng.random()
+        if authenticated and roll < self.unauthorized_rate:
+            return delay, 401
+        if roll < self.unauthorized_rate + self.error_rate:
+            return delay, 503
+        return delay, None
+
+    def count(self, service, operation, status):
+        with self._lock:
+            self.requests[(service, operation, status)] += 1
+
+    # SSO
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self.tokens[token] = time.monotonic()
+        return {"access_token": token, "expires_in": self.token_ttl or 900}
+
+    def token_valid(self, authorization):
+        token = (authorization or "").replace("Bearer ", "", 1)
+        issued = self.tokens.get(token)
+        if issued is None:
+            return False
+        return self.token_ttl is None or time.monotonic() - issued < self.token_ttl
+
+    # Portal
+
+    def search_cases(self, params):
+        query = params.get("q", "")
+        docs = self.portal_cases
+        since = re.search(r"case_createdDate:\[(\S+) TO \*\]", query)
+        if since:
+            docs = [d for d in docs if d["case_createdDate"] >= since.group(1)]
+        start = int(params.get("start", 0))
+        rows = int(params.get("rows", 10))
+        return {"response": {"numFound": len(docs), "docs": docs[start : start + rows]}}
+
+    def case_details(self, case_number):
+        if case_number not in self.cases:
+            return None
+        case = self.cases[case_number]
+        card = self.cards_by_case.get(case_number, {})
+        return {
+            "caseNumber": case_number,
+            "critSit": card.get("crit_sit", False),
+            "groupName": card.get("group_name"),
+            "notifiedUsers": card.get("notified_users", []),
+            "reliefAt": card.get("relief_at"),
+            "resolvedAt": card.get("resolved_at"),
+            "bugzillas": self.case_bugs.get(case_number, []),
+            "comments": [
+                {"createdBy": case["owner"], "commentBody": body, "createdDate": date}
+                for body, date in card.get("comments") or []
+            ],
+        }
+
+    def case_jiras(self, case_number):
+        return [
+            {
+                "resourceKey": str(issue["id"]),
+                "resourceURL": issue["url"],
+                "title": issue["title"],
+                "status": issue["status"],
+                "lastModifiedDate": _portal_date(issue["updated"]),
+            }
+            for issue in self.case_issues.get(case_number) or []
+        ]
+
+    # JIRA
+
+    def jira_project(self, name):
+        with self._lock:
+            project_id = self.projects.setdefault(name, str(10000 + len(self.projects)))
+        return {"id": project_id, "key": name, "name": name}
+
+    def jira_search(self, params):
+        project = re.search(r"project\s*=\s*(\w+)", params.get("jql", ""))
+        names = {project_id: name for name, project_id in self.projects.items()}
+        project_name = names.get(project.group(1)) if project else None
+        if project_name == self.escalations_project:
+            issues = self.escalations
+        else:
+            issues = self.jira_cards
+        start = int(params.get("startAt") or 0)
+        page_size = min(int(params.get("maxResults") or 50), max_jira_page)
+        return {
+            "startAt": start,
+            "maxResults": page_size,
+            "total": len(issues),
+            "issues": issues[start : start + page_size],
+        }
+
+    def jira_issue(self, key):
+        issue = self.jira_issues.get(key)
+        if issue is None:
+            return None
+        fields = {
+            "summary": issue["title"],
+            "status": {"name": issue["status"]},
+            "issuetype": {"name": issue["jira_type"]} if issue["jira_type"] else None,
+            "priority": {"name": issue["priority"]} if issue["priority"] else None,
+            "assignee": (
+                {"emailAddress": issue["assignee"]} if issue["assignee"] else None
+            ),
+            "fixVersions": [{"name": v} for v in issue["fix_versions"] or []],
+            "customfield_10470": (
+                {"emailAddress": issue["qa_contact"]} if issue["qa_contact"] else None
+            ),
+            "customfield_10840": (
+                {"value": issue["jira_severity"]} if issue["jira_severity"] else None
+            ),
+        }
+        keywords = issue["private_keywords"]
+        return {
+            "id": key.rsplit("-", 1)[-1],
+            "key": key,
+            "fields": fields,
+            "renderedFields": {
+                "customfield_11087": ", ".join(keywords) if keywords else None
+            },
+        }
+
+    # Bugzilla
+
+    @staticmethod
+    def bugzilla_version(params=None):
+        return {"version": "5.0.4.rh100"}
+
+    def bugzilla_get_bugs(self, params):
+        bugs = []
+        for bug_id in params.get("ids", []):
+            bug = self.bugzilla.get(int(bug_id))
+            if bug is None:
+                raise xmlrpc.client.Fault(101, "Bug #{} does not exist.".format(bug_id))
+            changed = datetime.datetime.fromisoformat(bug["last_change_time"])
+            bugs.append(
+                {
+                    "id": int(bug_id),
+                    "summary": bug["summary"],
+                    "status": bug["status"],
+                    "target_release": bug["target_release"],
+                    "assigned_to": bug["assignee"],
+                    "last_change_time": xmlrpc.client.DateTime(changed),
+                    "internal_whiteboard": bug["internal_whiteboard"],
+                    "qa_contact": bug["qa_contact"],
+                    "severity": bug["severity"],
+                }
+            )
+        return {"bugs": bugs, "faults": []}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Route the requests of the stand-in services to MockServices"""
+
+    protocol_version = "HTTP/1.1"
+    # (method, path pattern, service, operation)
+    routes = [
+        ("POST", r"/auth/realms/[^/]+/protocol/openid-connect/token", "sso", "token"),
+        ("GET", r"/search/cases", "portal", "search"),
+        ("GET", r"/v1/cases/(\w+)", "portal", "case"),
+        ("POST", r"/v1/cases/(\w+)/notifiedusers", "portal", "add watcher"),
+        ("GET", r"/cases/(\w+)/jiras", "portal", "case jiras"),
+        ("GET", r"/rest/api/2/serverInfo", "jira", "server info"),
+        ("GET", r"/rest/api/2/field", "jira", "fields"),
+        ("GET", r"/rest/api/2/project/([^/]+)", "jira", "project"),
+        ("GET", r"/rest/agile/1.0/board", "jira", "boards"),
+        ("GET", r"/rest/agile/1.0/board/(\d+)/sprint", "jira", "sprints"),
+        ("GET", r"/rest/api/2/search", "jira", "search"),
+        ("POST", r"/rest/api/2/search", "jira", "search"),
+        ("GET", r"/rest/api/2/issue/([^/]+)", "jira", "issue"),
+        ("POST", r"/xmlrpc.cgi", "bugzilla", "xmlrpc"),
+        ("GET", r"/_mock/stats", "mock", "stats"),
+        ("POST", r"/_mock/config", "mock", "config"),
+    ]
+
+    def log_message(self, format, *args):
+        # one line per request would drown the load test output
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _send(self, status, body=None, content_type="application/json"):
+        if body is None:
+            payload = b""
+        elif isinstance(body, bytes):
+            payload = body
+        else:
+            payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _dispatch(self, method):
+        services = self.server.services
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        for route_method, pattern, service, operation in self.routes:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                break
+        else:
+            self._send(404, {"errorMessages": ["Not found: " + url.path]})
+            return
+
+        if service != "mock":
+            authenticated = service in ("portal", "jira")
+            delay, failure = services.fault(service + " " + operation, authenticated)
+            time.sleep(delay)
+            if failure is None and service == "portal":
+                if not services.token_valid(self.headers.get("Authorization")):
+                    failure = 401
+            if failure is not None:
+                services.count(service, operation, failure)
+                self._send(failure, {"errorMessages": ["injected failure"]})
+                return
+
+        status, response, content_type = self._respond(
+            services, service, operation, match.groups(), params, body
+        )
+        if service != "mock":
+            services.count(service, operation, status)
+        self._send(status, response, content_type)
+
+    def _respond(self, services, service, operation, args, params, body):
+        """Build the response of a route
+
+        Returns:
+            tuple: (status, body, content type)
+        """
+        json_type = "application/json"
+        if operation == "token":
+            return 200, services.issue_token(), json_type
+        if operation == "search" and service == "portal":
+            return 200, services.search_cases(params), json_type
+        if operation == "case":
+            details = services.case_details(args[0])
+            return (200, details, json_type) if details else (404, [], json_type)
+        if operation == "add watcher":
+            return 201, None, json_type
+        if operation == "case jiras":
+            return 200, services.case_jiras(args[0]), json_type
+        if operation == "server info":
+            info = {
+                "baseUrl": "http://{}:{}".format(*self.server.server_address[:2]),
+                "version": "9.12.0",
+                "versionNumbers": [9, 12, 0],
+                "deploymentType": "Server",
+            }
+            return 200, info, json_type
+        if operation == "fields":
+            return 200, [], json_type
+        if operation == "project":
+            return 200, services.jira_project(args[0]), json_type
+        if operation == "boards":
+            name = params.get("name", "board")
+            boards = {
+                "startAt": 0,
+                "maxResults": 50,
+                "total": 1,
+                "isLast": True,
+                "values": [{"id": 1, "name": name, "type": "scrum"}],
+            }
+            return 200, boards, json_type
+        if operation == "sprints":
+            sprint = {"id": 1, "name": "Sprint 1", "state": "active"}
+            sprints = {"startAt": 0, "maxResults": 50, "isLast": True}
+            return 200, dict(sprints, values=[sprint]), json_type
+        if operation == "search":
+            if body:
+                params = dict(params, **json.loads(body))
+            return 200, services.jira_search(params), json_type
+        if operation == "issue":
+            issue = services.jira_issue(args[0])
+            if issue is None:
+                return 404, {"errorMessages": ["Issue does not exist"]}, json_type
+            return 200, issue, json_type
+        if operation == "xmlrpc":
+            return 200, services.xmlrpc._marshaled_dispatch(body), "text/xml"
+        if operation == "stats":
+            return 200, services.stats(), json_type
+        if operation == "config":
+            services.configure(**json.loads(body or b"{}"))
+            return 204, None, json_type
+        raise ValueError("unknown operation " + operation)
+
+
+def make_server(services, host="127.0.0.1", port=0):
+    """Create the HTTP server of the stand-in services
+
+    Args:
+        services: MockServices answering the requests
+        host: Address to listen on. Defaults to 127.0.0.1.
+        port: Port to listen on, 0 for a random free port. Defaults to 0.
+
+    Returns:
+        ThreadingHTTPServer: Server, not started yet; see serve_forever()
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.services = services
+    return server
+
+
+def main():
+    """Parse arguments and serve the stand-in services until interrupted"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("data", help="fake data, see bin/generate_fake_data.py")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--unauthorized-rate", type=float, default=0.0)
+    parser.add_argument("--token-ttl", type=float, default=None, help="seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--escalations-project", default="ESCALATE")
+    args = parser.parse_args()
+
+    with open(args.data, encoding="utf-8") as data:
+        services = MockServices(
+            json.load(data),
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            unauthorized_rate=args.unauthorized_rate,
+            token_ttl=args.token_ttl,
+            seed=args.seed,
+            escalations_project=args.escalations_project,
+        )
+    server = make_server(services, args.host, args.port)
+    print("serving {} cases on {}:{}".format(len(services.cases), args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""profiling.py: opt-in profiling of refresh tasks and heavy views"""
+
+import contextvars
+import cProfile
+import datetime
+import hmac
+import json
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+
+import redis
+
+# profiles older than this are deleted from Redis
+profile_ttl = 7 * 24 * 60 * 60
+# number of profiles listed by /api/profiles
+max_profiles = 50
+
+# held while a function runs under the profiler: only one profiler can be
+# active at a time, calls made meanwhile (e.g. nested ones) aren't profiled
+_profiler_lock = threading.Lock()
+# set by the Flask request hook when a request asks to be profiled
+_requested = contextvars.ContextVar("t5gweb_profile_requested", default=False)
+# id of the last profile stored while handling the current request
+_last_profile = contextvars.ContextVar("t5gweb_last_profile", default=None)
+
+
+def profile_targets():
+    """Names of the functions profiled on every call
+
+    Read from t5g_profile, a comma separated list of profiled() names such as
+    'get_cards,generate_stats', or 'all'.
+
+    Returns:
+        set: Profiled names, empty if profiling is disabled
+    """
+    targets = os.environ.get("t5g_profile", "")
+    return {target.strip() for target in targets.split(",") if target.strip()}
+
+
+def is_authorized(token):
+    """Check a token against t5g_profile_token
+
+    Profiling on demand is disabled when t5g_profile_token isn't set.
+
+    Args:
+        token: Token sent by the client, or None
+
+    Returns:
+        bool: True if the token is valid
+    """
+    expected = os.environ.get("t5g_profile_token")
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8"))
+
+
+class StackSampler:
+    """Sample the stack of a thread at a fixed interval
+
+    The samples are counted as collapsed stacks ('outer;inner;leaf count'),
+    the input format of flamegraph.pl, speedscope and similar tools.
+
+    Args:
+        thread_id: Identifier of the sampled thread
+        interval: Seconds between two samples. Defaults to 5ms.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    "{} ({}:{})".format(
+                        code.co_name,
+                        os.path.basename(code.co_filename),
+                        code.co_firstlineno,
+                    )
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        """Collapsed stacks, one 'stack count' line per distinct stack"""
+        return "".join(
+            "{} {}\n".format(stack, count) for stack, count in self.stacks.most_common()
+        )
+
+
+def store_profile(name, profiler, sampler, started, duration):
+    """Store the artifacts of a profiled call in Redis
+
+    Args:
+        name: Name of the profiled function
+        profiler: Stopped cProfile.Profile
+        sampler: Stopped StackSampler
+        started: Start of the call, as a datetime
+        duration: Duration of the call in seconds
+
+    Returns:
+        str: Id of the stored profile
+    """
+    profile_id = "{}-{}-{}".format(
+        name, started.strftime("%Y%m%dT%H%M%S"), uuid.uuid4().hex[:6]
+    )
+    profiler.create_stats()
+    info = {
+        "id": profile_id,
+        "name": name,
+        "started": str(started),
+        "duration": round(duration, 3),
+        "samples": sum(sampler.stacks.values()),
+    }
+    r_cache = redis.Redis(host="redis")
+    pipe = r_cache.pipeline()
+    # same format as pstats.Stats.dump_stats(), load with pstats.Stats(path)
+    pipe.set(
+        "profile:{}:pstats".format(profile_id),
+        marshal.dumps(profiler.stats),
+        ex=profile_ttl,
+    )
+    pipe.set(
+        "profile:{}:collapsed".format(profile_id), sampler.collapsed(), ex=profile_ttl
+    )
+    pipe.set("profile:{}:info".format(profile_id), json.dumps(info), ex=profile_ttl)
+    pipe.zadd("profiles", {profile_id: started.timestamp()})
+    pipe.zremrangebyrank("profiles", 0, -max_profiles - 1)
+    pipe.execute()
+    logging.warning("stored profile %s (%.1fs)", profile_id, duration)
+    return profile_id
+
+
+def list_profiles():
+    """List the stored profiles, newest first
+
+    Returns:
+        list: Profile information dictionaries (id, name, started, duration
+            and samples)
+    """
+    r_cache = redis.Redis(host="redis")
+    profile_ids = [p.decode("utf-8") for p in r_cache.zrevrange("profiles", 0, -1)]
+    infos = r_cache.mget(["profile:{}:info".format(p) for p in profile_ids])
+    return [json.loads(info) for info in infos if info is not None]
+
+
+def get_profile(profile_id, artifact):
+    """Get an artifact of a stored profile
+
+    Args:
+        profile_id: Id returned by store_profile()
+        artifact: 'pstats' or 'collapsed'
+
+    Returns:
+        bytes or None: Artifact, None if the profile doesn't exist (anymore)
+    """
+    return redis.Redis(host="redis").get("profile:{}:{}".format(profile_id, artifact))
+
+
+def profiled(name):
+    """Decorator profiling a function when asked to
+
+    A call is profiled when its name is listed in t5g_profile, or when it
+    handles a request with a valid 'profile' token (see init_app()). It runs
+    under cProfile, for pstats, and a stack sampler, for flamegraphs; both
+    are stored in Redis, see store_profile(). Calls made while another
+    profiled call runs aren't profiled separately, nested calls are part of
+    the outer profile.
+
+    Args:
+        name: Name of the profiled function, used in t5g_profile and in the
+            profile ids
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            targets = profile_targets()
+            if not (_requested.get() or name in targets or "all" in targets):
+                return func(*args, **kwargs)
+            if not _profiler_lock.acquire(blocking=False):
+                return func(*args, **kwargs)
+
+            started = datetime.datetime.now(datetime.timezone.utc)
+            start = time.perf_counter()
+            sampler = StackSampler(threading.get_ident())
+            profiler = cProfile.Profile()
+            sampler.start()
+            profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                sampler.stop()
+                _profiler_lock.release()
+                try:
+                    _last_profile.set(
+                        store_profile(
+                            name,
+                            profiler,
+                            sampler,
+                            started,
+                            time.perf_counter() - start,
+                        )
+                    )
+                except redis.exceptions.ConnectionError:
+                    logging.warning("Couldn't connect to redis host, profile lost")
+
+        return wrapper
+
+    return decorator
+
+
+def init_app(app):
+    """Profile the requests of a Flask app that ask for it
+
+    A request with an X-Profile-Token header matching t5g_profile_token
+    profiles the profiled() functions it calls. The token isn't accepted in
+    the query string, where it would end up in access logs and browser
+    history. The id of the stored profile is returned in the X-Profile-Id
+    header. Views answered with a 304 by httpcache.conditional() don't run,
+    so a request is only profiled when it isn't conditional.
+
+    Args:
+        app: Flask application
+    """
+    # imported here so the tasks can use this module without Flask
+    from flask import request
+
+    @app.before_request
+    def request_profile():
+        _last_profile.set(None)
+        _requested.set(is_authorized(request.headers.get("X-Profile-Token")))
+
+    @app.after_request
+    def add_profile_header(response):
+        if _last_profile.get():
+            response.headers["X-Profile-Id"] = _last_profile.get()
+        return response
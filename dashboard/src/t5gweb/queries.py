@@ -0,0 +1,252 @@
+"""queries.py: filtered, projected and paginated queries over cached data"""
+
+import base64
+import bisect
+import csv
+import io
+import json
+import re
+
+# filter name -> function returning the indexed value of a record
+query_filters = {
+    "cards": {
+        "status": lambda card: card["card_status"],
+        "case_status": lambda card: card["case_status"],
+        "severity": lambda card: card["severity"],
+        "account": lambda card: card["account"],
+        "assignee": lambda card: (card["assignee"] or {}).get("displayName"),
+    },
+    "cases": {
+        "status": lambda case: case["status"],
+        "severity": lambda case: _severity_name(case["severity"]),
+        "account": lambda case: case["account"],
+        "assignee": lambda case: case["owner"],
+    },
+}
+
+# function returning the last update of a record, used by 'updated_since'
+query_updated = {
+    "cards": lambda card: card["case_updated_date"],
+    "cases": lambda case: case["last_update"],
+}
+
+# name of the record key in exported records
+export_keys = {"cards": "card", "cases": "case_number"}
+
+default_limit = 100
+max_limit = 1000
+
+
+def _severity_name(severity):
+    """Strip the number of a portal severity, e.g. '2 (High)' -> 'High'"""
+    match = re.search(r"\((\w+)\)", severity or "")
+    return match.group(1) if match else severity
+
+
+def _normalize_time(timestamp):
+    """Normalize a date or datetime string so that it sorts chronologically
+
+    Handles both the cards' 'YYYY-MM-DD HH:MM' and the portal's
+    'YYYY-MM-DDTHH:MM:SSZ' formats by truncating to 'YYYY-MM-DDTHH:MM'.
+    """
+    return str(timestamp).replace(" ", "T")[:16]
+
+
+def build_query_index(data_type, records):
+    """Build the indexes used to answer filtered queries
+
+    Args:
+        data_type: 'cards' or 'cases'
+        records: Dictionary of cached cards or cases
+
+    Returns:
+        dict: {"keys": sorted keys, "filters": {filter: {value: [key, ...]}},
+            "updated": [[normalized last update, key], ...] sorted by time}
+    """
+    filters = {name: {} for name in query_filters[data_type]}
+    updated = []
+    for key in sorted(records):
+        record = records[key]
+        for name, value_of in query_filters[data_type].items():
+            value = str(value_of(record)).lower()
+            filters[name].setdefault(value, []).append(key)
+        last_update = query_updated[data_type](record)
+        if last_update:
+            updated.append([_normalize_time(last_update), key])
+    updated.sort()
+    return {"keys": sorted(records), "filters": filters, "updated": updated}
+
+
+def encode_cursor(key):
+    """Encode the last returned key into an opaque pagination cursor"""
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor created by encode_cursor()
+
+    Raises:
+        ValueError: If the cursor is invalid
+    """
+    try:
+        decoded = base64.b64decode(cursor.encode("ascii"), b"-_", validate=True)
+        return decoded.decode("utf-8")
+    except (UnicodeError, ValueError) as e:
+        raise ValueError("invalid cursor: {}".format(cursor)) from e
+
+
+def parse_query(data_type, args):
+    """Parse the query string of the /api/cards and /api/cases endpoints
+
+    Filters may be repeated or comma separated to match any of the values,
+    different filters must all match.
+
+    Args:
+        data_type: 'cards' or 'cases'
+        args: Query string arguments (e.g. Flask's request.args)
+
+    Returns:
+        dict: 'filters' (filter -> lowercase values), 'updated_since',
+            'fields', 'limit' and 'cursor' (last key of the previous page), or
+            None if no query parameters were given
+
+    Raises:
+        ValueError: If a parameter is invalid
+    """
+    filters = {}
+    for name in query_filters[data_type]:
+        values = [
+            value.strip().lower()
+            for arg in args.getlist(name)
+            for value in arg.split(",")
+            if value.strip()
+        ]
+        if values:
+            filters[name] = values
+    updated_since = args.get("updated_since")
+    fields = args.get("fields")
+    limit = args.get("limit")
+    cursor = args.get("cursor")
+    if not (filters or updated_since or fields or limit or cursor):
+        return None
+
+    if limit is None:
+        limit = default_limit
+    else:
+        try:
+            limit = int(limit)
+        except ValueError as e:
+            raise ValueError("invalid limit: {}".format(limit)) from e
+        if not 0 < limit <= max_limit:
+            raise ValueError("limit must be between 1 and {}".format(max_limit))
+    return {
+        "filters": filters,
+        "updated_since": _normalize_time(updated_since) if updated_since else None,
+        "fields": (
+            [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        ),
+        "limit": limit,
+        "cursor": decode_cursor(cursor) if cursor else None,
+    }
+
+
+def run_query(index, query):
+    """Select one page of record keys matching a query
+
+    Records are returned in key order, which keeps cursors stable while the
+    cache is refreshed.
+
+    Args:
+        index: Index built by build_query_index()
+        query: Query returned by parse_query()
+
+    Returns:
+        tuple: (keys of the page, total number of matching records, cursor of
+            the next page or None if this is the last page)
+    """
+    selected = None
+    for name, values in query["filters"].items():
+        matching = set()
+        for value in values:
+            matching.update(index["filters"][name].get(value, []))
+        selected = matching if selected is None else selected & matching
+    if query["updated_since"]:
+        start = bisect.bisect_left(index["updated"], [query["updated_since"]])
+        recent = {key for _, key in index["updated"][start:]}
+        selected = recent if selected is None else selected & recent
+
+    keys = index["keys"]
+    if selected is not None:
+        keys = [key for key in keys if key in selected]
+    total = len(keys)
+    if query["cursor"] is not None:
+        keys = keys[bisect.bisect_right(keys, query["cursor"]) :]
+    page = keys[: query["limit"]]
+    next_cursor = encode_cursor(page[-1]) if len(keys) > len(page) else None
+    return page, total, next_cursor
+
+
+def project(record, fields):
+    """Only keep the requested top-level fields of a record
+
+    Args:
+        record: Card or case dictionary
+        fields: List of field names, or None to keep every field
+
+    Returns:
+        dict: Projected record
+    """
+    if fields is None:
+        return record
+    return {field: record[field] for field in fields if field in record}
+
+
+def export_ndjson(data_type, records, fields=None):
+    """Serialize records as newline delimited JSON, one record at a time
+
+    Args:
+        data_type: 'cards' or 'cases'
+        records: Iterable of (key, record) tuples
+        fields: List of field names to export, or None for every field
+
+    Yields:
+        str: One JSON document per record, terminated by a newline
+    """
+    for key, record in records:
+        line = {export_keys[data_type]: key}
+        line.update(project(record, fields))
+        yield json.dumps(line, ensure_ascii=False) + "\n"
+
+
+def export_csv(data_type, records, fields=None):
+    """Serialize records as CSV, one record at a time
+
+    Nested values (lists and dictionaries) are exported as JSON.
+
+    Args:
+        data_type: 'cards' or 'cases'
+        records: Iterable of (key, record) tuples
+        fields: List of field names to export. Defaults to the fields of the
+            first record.
+
+    Yields:
+        str: The header row, then one row per record
+    """
+    buffer = io.StringIO()
+    writer = None
+    for key, record in records:
+        if writer is None:
+            columns = [export_keys[data_type]] + (fields or list(record))
+            writer = csv.DictWriter(
+                buffer, fieldnames=columns, restval="", extrasaction="ignore"
+            )
+            writer.writeheader()
+        row = {export_keys[data_type]: key}
+        for field, value in record.items():
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            row[field] = value
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
@@ -0,0 +1,312 @@
+"""records.py: compact in-memory model of the cached cards and cases
+
+The 'cards' and 'cases' caches are dictionaries of dictionaries. Loaded as
+is, every card repeats its keys and its account, engineer, status and
+severity strings, and holds the full case description and comment HTML.
+Card and Case keep the fields in slots instead, share the strings and
+nested values that repeat across records, and keep the large text fields
+compressed until they are read.
+
+Records are read-only mappings, so code reading card["account"] works on
+them unchanged. Use replace() for a modified copy.
+"""
+
+import json
+import sys
+import zlib
+from collections.abc import Mapping
+
+# marks the slots of the fields missing from a record
+_missing = object()
+
+
+def _pack(value):
+    """Compress a large field, None is kept as is"""
+    if value is None:
+        return None
+    return zlib.compress(json.dumps(value).encode("utf-8"), 1)
+
+
+def _unpack(value):
+    """Decompress a field compressed by _pack()
+
+    JSON values are never bytes, so values that aren't are returned as is.
+    """
+    if not isinstance(value, bytes):
+        return value
+    return json.loads(zlib.decompress(value))
+
+
+def _share(value, pool):
+    """Share a value with the identical values of the other records
+
+    Strings are interned, and identical lists and dictionaries are replaced
+    by a single instance kept in the pool, so they must not be modified.
+
+    Args:
+        value: Field value
+        pool: Dictionary of the values already shared by the records of the
+            same load
+
+    Returns:
+        tuple: The shared value and its key in the pool
+    """
+    if isinstance(value, str):
+        value = sys.intern(value)
+        return value, value
+    if isinstance(value, list):
+        items = [_share(item, pool) for item in value]
+        key = (list,) + tuple(k for _, k in items)
+        return pool.setdefault(key, [v for v, _ in items]), key
+    if isinstance(value, dict):
+        items = [(sys.intern(k), _share(v, pool)) for k, v in value.items()]
+        key = (dict,) + tuple((k, vk) for k, (_, vk) in items)
+        return pool.setdefault(key, {k: v for k, (v, _) in items}), key
+    # type(value) keeps 1, 1.0 and True apart
+    return value, (type(value), value)
+
+
+class Record(Mapping):
+    """Read-only mapping of a cached record, stored in slots
+
+    Subclasses list their fields in 'fields' and 'lazy' and declare them as
+    slots. Fields missing from the cached record are missing from the
+    mapping too, and unknown fields are kept in a dictionary.
+
+    Attributes:
+        fields: Fields stored as they are, see 'shared'
+        lazy: Large fields stored compressed and decompressed on every read,
+            slots named with a leading underscore
+        shared: Fields shared with the other records of a load, see _share()
+    """
+
+    __slots__ = ("_extra",)
+    fields = ()
+    lazy = ()
+    shared = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._names = frozenset(cls.fields)
+        cls._lazy = frozenset(cls.lazy)
+        cls._shared = frozenset(cls.shared)
+        cls._slots = tuple(
+            slot for c in cls.__mro__ for slot in getattr(c, "__slots__", ())
+        )
+
+    def __init__(self, data, pool=None):
+        """Build a record from its cached dictionary
+
+        Args:
+            data: Cached dictionary of the record
+            pool: Values shared with the other records, see _share().
+                Defaults to a new pool.
+        """
+        self._extra = None
+        if pool is None:
+            pool = {}
+        for name, value in data.items():
+            self._set(name, value, pool)
+
+    def _set(self, name, value, pool):
+        if name in self._lazy:
+            setattr(self, "_" + name, _pack(value))
+        elif name in self._names:
+            if name in self._shared:
+                value, _ = _share(value, pool)
+            setattr(self, name, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[name] = value
+
+    def __getitem__(self, name):
+        if name in self._names:
+            try:
+                return getattr(self, name)
+            except AttributeError:
+                raise KeyError(name) from None
+        if name in self._lazy:
+            try:
+                return _unpack(getattr(self, "_" + name))
+            except AttributeError:
+                raise KeyError(name) from None
+        if self._extra is not None and name in self._extra:
+            return self._extra[name]
+        raise KeyError(name)
+
+    def __iter__(self):
+        for name in self.fields:
+            if hasattr(self, name):
+                yield name
+        for name in self.lazy:
+            if hasattr(self, "_" + name):
+                yield name
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, dict(self))
+
+    def replace(self, **changes):
+        """Copy the record with some fields changed
+
+        Args:
+            **changes: New values of the fields
+
+        Returns:
+            Record: The copy, sharing the unchanged fields with this record
+        """
+        record = object.__new__(type(self))
+        for slot in self._slots:
+            value = getattr(self, slot, _missing)
+            if value is not _missing:
+                setattr(record, slot, value)
+        if self._extra is not None:
+            record._extra = dict(self._extra)
+        for name, value in changes.items():
+            if name in self._lazy:
+                # copies are short-lived and the changed fields read again
+                # soon, so they aren't compressed
+                setattr(record, "_" + name, value)
+            else:
+                record._set(name, value, {})
+        return record
+
+
+class Card(Record):
+    """Card of the 'cards' cache, see cache.get_cards()"""
+
+    fields = (
+        "card_status",
+        "card_created",
+        "account",
+        "summary",
+        "assignee",
+        "contributor",
+        "case_number",
+        "tags",
+        "labels",
+        "bugzilla",
+        "issues",
+        "severity",
+        "priority",
+        "escalated",
+        "escalated_link",
+        "potential_escalation",
+        "product",
+        "case_status",
+        "crit_sit",
+        "group_name",
+        "case_updated_date",
+        "case_days_open",
+        "case_created",
+        "notified_users",
+        "relief_at",
+        "resolved_at",
+        "daily_telco",
+    )
+    lazy = ("description", "comments")
+    shared = (
+        "card_status",
+        "account",
+        "assignee",
+        "contributor",
+        "tags",
+        "labels",
+        "bugzilla",
+        "issues",
+        "severity",
+        "priority",
+        "product",
+        "case_status",
+        "group_name",
+        "notified_users",
+    )
+    __slots__ = fields + tuple("_" + name for name in lazy)
+
+
+class Case(Record):
+    """Case of the 'cases' cache, see cache.get_cases()"""
+
+    fields = (
+        "owner",
+        "severity",
+        "account",
+        "problem",
+        "status",
+        "createdate",
+        "last_update",
+        "product",
+        "product_version",
+        "bug",
+        "tags",
+        "closeddate",
+    )
+    lazy = ("description",)
+    shared = (
+        "owner",
+        "severity",
+        "account",
+        "status",
+        "product",
+        "product_version",
+        "tags",
+    )
+    __slots__ = fields + tuple("_" + name for name in lazy)
+
+
+def build_records(data, record_class):
+    """Build the compact records of a cached dictionary
+
+    Args:
+        data: Cached dictionary of records, e.g. the 'cards' cache
+        record_class: Card or Case
+
+    Returns:
+        dict: Records keyed like data
+    """
+    pool = {}
+    return {sys.intern(key): record_class(value, pool) for key, value in data.items()}
+
+
+def record_hook(record_class):
+    """Build a json object_hook turning the records into record_class
+
+    Every record is built as soon as it is parsed, so the dictionaries of
+    the whole cache are never in memory at once. Records are recognized by
+    their first field.
+
+    Args:
+        record_class: Card or Case
+
+    Returns:
+        function: Hook for json.loads(object_hook=...)
+    """
+    pool = {}
+    marker = record_class.fields[0]
+
+    def hook(obj):
+        if marker in obj:
+            return record_class(obj, pool)
+        return obj
+
+    return hook
+
+
+def replace(record, **changes):
+    """Copy a record or a dictionary with some fields changed
+
+    Args:
+        record: Dictionary, Record or snapshots.SnapshotRecord
+        **changes: New values of the fields
+
+    Returns:
+        Copy of the same type
+    """
+    if isinstance(record, dict):
+        return dict(record, **changes)
+    return record.replace(**changes)
@@ -0,0 +1,159 @@
+"""sketches.py: mergeable quantile sketches for t5gweb"""
+
+import math
+
+
+class DDSketch:
+    """Mergeable quantile sketch with relative-error guarantees
+
+    Minimal implementation of DDSketch (https://arxiv.org/abs/1908.10693).
+    Values are counted in logarithmically sized bins so that any quantile is
+    returned within ``relative_accuracy`` of the true value, independent of
+    how many values were added. Two sketches with the same accuracy can be
+    merged by adding their bin counts, which makes it cheap to combine sketches
+    stored per day and per dimension into arbitrary windows.
+
+    Only non-negative values are supported; negative values are counted as 0.
+
+    Args:
+        relative_accuracy: Maximum relative error of returned quantiles.
+            Defaults to 0.01 (1%).
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """Add a single value to the sketch
+
+        Args:
+            value: Number to add
+        """
+        value = max(value, 0)
+        if value == 0:
+            self.zero_count += 1
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def remove(self, value):
+        """Remove a value previously added to the sketch
+
+        min and max aren't restored, so they remain bounds of the values
+        rather than their exact minimum and maximum.
+
+        Args:
+            value: Number added before
+        """
+        value = max(value, 0)
+        if value == 0:
+            if not self.zero_count:
+                return
+            self.zero_count -= 1
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            count = self.bins.get(index, 0)
+            if not count:
+                return
+            if count == 1:
+                del self.bins[index]
+            else:
+                self.bins[index] = count - 1
+        self.count -= 1
+        self.sum -= value
+        if self.count == 0:
+            self.sum = 0.0
+            self.min = None
+            self.max = None
+
+    def merge(self, other):
+        """Merge another sketch into this one
+
+        Args:
+            other: DDSketch created with the same relative accuracy
+
+        Raises:
+            ValueError: If the sketches use a different relative accuracy
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("cannot merge sketches with different accuracies")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q):
+        """Estimate a quantile of the added values
+
+        Args:
+            q: Quantile between 0 and 1, e.g. 0.99 for p99
+
+        Returns:
+            float: Estimated value, or None if the sketch is empty
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                value = 2 * self.gamma**index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        """Exact mean of the added values, or None if the sketch is empty"""
+        if self.count == 0:
+            return None
+        return self.sum / self.count
+
+    def to_dict(self):
+        """Serialize the sketch into a JSON-compatible dictionary"""
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "bins": {str(index): count for index, count in self.bins.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Deserialize a sketch created by to_dict()
+
+        Args:
+            data: Dictionary returned by to_dict()
+
+        Returns:
+            DDSketch: Restored sketch
+        """
+        sketch = cls(data["relative_accuracy"])
+        sketch.bins = {int(index): count for index, count in data["bins"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        return sketch
@@ -0,0 +1,337 @@
+"""snapshots.py: memory-mapped snapshots of the cached cards and cases
+
+Every gunicorn worker used to download and decode the 'cards' and 'cases'
+caches on its own. A snapshot is an immutable file holding a decoded
+cache in a flat layout: the record keys, a table of value ids per record
+and field, and every distinct JSON-encoded value once. Workers map the
+file, so its pages are shared by all of them through the page cache, and
+only decode the fields they read.
+
+A snapshot is named after the cache version of its key. The first worker
+of a host needing a version builds it, under a file lock, and the others
+map the same file. When t5g_snapshot_dir is set, the refresh tasks publish
+the snapshots themselves, so with a directory shared with the web
+containers no worker has to decode the cache. Set it to an empty string
+to disable snapshots.
+
+Layout, in native byte order:
+    header      magic, number of fields, records and values, and the
+                sizes of the sections
+    fields      JSON list of the field names
+    keys        JSON list of the record keys
+    rows        uint32 value id of every field of every record, 0 when the
+                record doesn't have the field
+    offsets     uint64 offset of every value in the values section
+    values      JSON encoding of every distinct value
+"""
+
+import fcntl
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Mapping
+
+magic = ("T5GSNAP1" + sys.byteorder[0]).encode("ascii")
+header = struct.Struct("=9sIIIQQQ")
+# decoded values of the shared fields at most this long are kept by the
+# process, see Snapshot.value()
+max_kept_size = 256
+literals = {b"true": True, b"false": False, b"null": None}
+
+
+def snapshot_dir():
+    """Directory of the snapshots, None when they are disabled"""
+    directory = os.environ.get(
+        "t5g_snapshot_dir", os.path.join(tempfile.gettempdir(), "t5gweb-snapshots")
+    )
+    return directory or None
+
+
+def publishing():
+    """Check if the refresh tasks should publish the snapshots
+
+    Only when t5g_snapshot_dir is set, since a snapshot published in a
+    directory the web workers don't share would never be read.
+    """
+    return bool(os.environ.get("t5g_snapshot_dir"))
+
+
+def _pad(size):
+    """Padding aligning a section to 8 bytes"""
+    return b"\0" * (-size % 8)
+
+
+def write_snapshot(path, data):
+    """Write the snapshot of a cached dictionary of records
+
+    The file is written next to path and renamed, so readers never see a
+    partial snapshot.
+
+    Args:
+        path: Path of the snapshot
+        data: Cached dictionary of records, e.g. the 'cards' cache
+    """
+    fields = {}
+    for record in data.values():
+        for name in record:
+            fields.setdefault(name, len(fields))
+    value_ids = {}
+    values = array("Q", [0])
+    encoded = [b""]
+    size = 0
+    rows = array("I", bytes(4 * len(fields) * len(data)))
+    for row, record in enumerate(data.values()):
+        base = row * len(fields)
+        for name, value in record.items():
+            value = json.dumps(value).encode("utf-8")
+            value_id = value_ids.get(value)
+            if value_id is None:
+                value_id = value_ids[value] = len(encoded)
+                encoded.append(value)
+                size += len(value)
+                values.append(size)
+            rows[base + fields[name]] = value_id
+
+    sections = [
+        json.dumps(list(fields)).encode("utf-8"),
+        json.dumps(list(data)).encode("utf-8"),
+        rows.tobytes(),
+        values.tobytes(),
+        b"".join(encoded),
+    ]
+    directory = os.path.dirname(path)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as snapshot:
+        snapshot.write(
+            header.pack(
+                magic,
+                len(fields),
+                len(data),
+                len(encoded),
+                len(sections[0]),
+                len(sections[1]),
+                len(sections[4]),
+            )
+        )
+        snapshot.write(_pad(header.size))
+        for section in sections:
+            snapshot.write(section)
+            snapshot.write(_pad(len(section)))
+    # readable by the web workers when published by the refresh tasks
+    os.chmod(snapshot.name, 0o644)
+    os.replace(snapshot.name, path)
+
+
+class Snapshot(Mapping):
+    """Read-only mapping of the records of a snapshot file
+
+    Args:
+        path: Path of the snapshot
+        shared: Fields whose short values are decoded once per process,
+            e.g. records.Card.shared
+    """
+
+    def __init__(self, path, shared=()):
+        with open(path, "rb") as snapshot:
+            self._map = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        found, n_fields, n_records, n_values, fields_size, keys_size, values_size = (
+            header.unpack_from(self._map)
+        )
+        if found != magic:
+            raise ValueError("not a snapshot: {}".format(path))
+        view = memoryview(self._map)
+        offset = header.size + len(_pad(header.size))
+
+        def section(size):
+            nonlocal offset
+            start = offset
+            offset += size + len(_pad(size))
+            return view[start : start + size]
+
+        self.fields = json.loads(bytes(section(fields_size)))
+        self._field_ids = {name: i for i, name in enumerate(self.fields)}
+        self._keys = {
+            key: row for row, key in enumerate(json.loads(bytes(section(keys_size))))
+        }
+        self._rows = section(4 * n_fields * n_records).cast("I")
+        self._offsets = section(8 * n_values).cast("Q")
+        self._values = section(values_size)
+        self._shared = frozenset(
+            self._field_ids[f] for f in shared if f in self._field_ids
+        )
+        self._kept = {}
+
+    def value(self, row, field_id):
+        """Decode a value of a record
+
+        Args:
+            row: Row of the record
+            field_id: Position of the field in self.fields
+
+        Returns:
+            The decoded value
+
+        Raises:
+            KeyError: The record doesn't have the field
+        """
+        value_id = self._rows[row * len(self.fields) + field_id]
+        if value_id == 0:
+            raise KeyError(self.fields[field_id])
+        value = self._kept.get(value_id, self)
+        if value is not self:
+            return value
+        encoded = bytes(
+            self._values[self._offsets[value_id - 1] : self._offsets[value_id]]
+        )
+        if encoded in literals:
+            return literals[encoded]
+        value = json.loads(encoded)
+        if field_id in self._shared and len(encoded) <= max_kept_size:
+            self._kept[value_id] = value
+        return value
+
+    def has(self, row, field_id):
+        """Check if a record has a field"""
+        return self._rows[row * len(self.fields) + field_id] != 0
+
+    def __getitem__(self, key):
+        return SnapshotRecord(self, self._keys[key])
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class SnapshotRecord(Mapping):
+    """Read-only mapping of a record of a snapshot, decoded on access
+
+    Values of the shared fields may be shared with the other records, so
+    they must not be modified; use replace() for a modified copy.
+    """
+
+    __slots__ = ("_snapshot", "_row", "_changes")
+
+    def __init__(self, snapshot, row, changes=None):
+        self._snapshot = snapshot
+        self._row = row
+        self._changes = changes
+
+    def __getitem__(self, name):
+        if self._changes is not None and name in self._changes:
+            return self._changes[name]
+        field_id = self._snapshot._field_ids.get(name)
+        if field_id is None:
+            raise KeyError(name)
+        return self._snapshot.value(self._row, field_id)
+
+    def __iter__(self):
+        changes = self._changes or {}
+        for field_id, name in enumerate(self._snapshot.fields):
+            if name in changes or self._snapshot.has(self._row, field_id):
+                yield name
+        for name in changes:
+            if name not in self._snapshot._field_ids:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "SnapshotRecord({!r})".format(dict(self))
+
+    def replace(self, **changes):
+        """Copy the record with some fields changed
+
+        Args:
+            **changes: New values of the fields
+
+        Returns:
+            SnapshotRecord: The copy
+        """
+        return SnapshotRecord(
+            self._snapshot, self._row, dict(self._changes or {}, **changes)
+        )
+
+
+def snapshot_path(directory, key, version):
+    """Path of the snapshot of a version of a cached key"""
+    return os.path.join(directory, "{}-{!r}.snapshot".format(key, version))
+
+
+def _remove_others(directory, key, path):
+    """Remove the snapshots of the other versions of a key
+
+    Workers still mapping one of them keep their mapping until they switch.
+    """
+    for other in glob.glob(os.path.join(directory, "{}-*.snapshot".format(key))):
+        if other != path:
+            try:
+                os.remove(other)
+            except OSError:
+                pass
+
+
+def publish_snapshot(key, version, data):
+    """Write the snapshot of a version of a cached key
+
+    Args:
+        key: Cached key, e.g. 'cards'
+        version: Cache version of the key, see libtelco5g.get_cache_version()
+        data: Cached dictionary of records
+    """
+    directory = snapshot_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory, key, version)
+    write_snapshot(path, data)
+    _remove_others(directory, key, path)
+    logging.warning("published snapshot of %s", key)
+
+
+def load_snapshot(key, version, fetch, shared=()):
+    """Map the snapshot of a version of a cached key, building it if needed
+
+    Only one process of the host builds a missing snapshot, the others wait
+    for it and map the same file.
+
+    Args:
+        key: Cached key, e.g. 'cards'
+        version: Cache version of the key, see libtelco5g.get_cache_version()
+        fetch: Function returning the cached dictionary of records, empty
+            if it couldn't be read
+        shared: Fields whose short values are decoded once per process
+
+    Returns:
+        Snapshot: Records of the key, or None if snapshots are disabled or
+            the snapshot can't be built. A snapshot isn't written from empty
+            records, so a failed read isn't kept for the whole version.
+    """
+    directory = snapshot_dir()
+    if directory is None or version is None:
+        return None
+    path = snapshot_path(directory, key, version)
+    try:
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            lock_path = os.path.join(directory, "{}.lock".format(key))
+            with open(lock_path, "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not os.path.exists(path):
+                    records = fetch()
+                    if not records:
+                        return None
+                    write_snapshot(path, records)
+                    _remove_others(directory, key, path)
+        return Snapshot(path, shared)
+    except (OSError, ValueError) as e:
+        logging.warning("couldn't load the snapshot of %s: %s", key, e)
+        return None
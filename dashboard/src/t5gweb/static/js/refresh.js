@@ -120,3 +120,28 @@ function updatePercentage (statusUrl, div) {
 $(function () {
   $('#refresh').click(getBackground)
 })
+
+/**
+ * On page load, show when the cache was last refreshed and when the next
+ * refresh is scheduled. The interval adapts to how much changes upstream.
+ */
+$(document).ready(function () {
+  $.getJSON('/refresh/schedule', function (schedule) {
+    if (!('next_run' in schedule)) {
+      return
+    }
+    const formatTime = function (isoTime) {
+      return new Date(isoTime).toISOString().slice(11, 16)
+    }
+    const parts = []
+    if ('last_run' in schedule) {
+      parts.push('Last refresh ' + formatTime(schedule.last_run) + ' UTC')
+    }
+    parts.push(
+      'next refresh ' + formatTime(schedule.next_run) + ' UTC' +
+      ' (every ' + Math.round(schedule.interval / 60) + ' min)'
+    )
+    const text = parts.join(', ')
+    $('#refresh-schedule').text(text)
+  })
+})
@@ -128,6 +128,156 @@ function format (data) {
   return result + '</div>'
 }
 
+/**
+ * Escape text before inserting it into HTML
+ * @param {*} text - Value to escape
+ * @returns {string} HTML-safe string
+ */
+function escapeHtml (text) {
+  return $('<div>').text(text == null ? '' : text).html()
+}
+
+/**
+ * Options that switch the table to DataTables server-side processing. Rows
+ * are requested page by page from the URL in the table's data-source
+ * attribute and rendered here instead of in the cases_table macro.
+ * @param {object} tableElement - jQuery object of the table
+ * @returns {object} DataTable options
+ */
+function serverSideOptions (tableElement) {
+  const jiraServer = tableElement.data('jira-server')
+  const slaSettings = tableElement.data('sla-settings')
+  const fwBold = function (td, cellData) {
+    if (cellData !== 'No' && cellData !== false) {
+      $(td).addClass('fw-bold')
+    }
+  }
+  return {
+    serverSide: true,
+    processing: true,
+    ajax: tableElement.data('source'),
+    // table_data() serves at most max_page_length rows per page, so there
+    // is no 'All' option
+    lengthMenu: [10, 25, 50, 100, 500],
+    searchPanes: {
+      columns: [2, 3, 6, 7, 9, 16, 17],
+      initCollapsed: true
+    },
+    columns: [
+      { data: null, className: 'align-middle dt-control', orderable: false, defaultContent: '' },
+      {
+        data: 'case_number',
+        className: 'align-middle text-center',
+        render: function (data) {
+          return '<a href="https://access.redhat.com/support/cases/#/case/' + escapeHtml(data) + '" target="_blank">' + escapeHtml(data) + '</a>'
+        }
+      },
+      {
+        data: 'severity',
+        className: 'align-middle text-center',
+        render: function (data) {
+          return '<span class="badge severity ' + escapeHtml(data).toLowerCase() + '">' + escapeHtml(data) + '</span>'
+        }
+      },
+      {
+        data: 'escalated',
+        className: 'align-middle text-center',
+        createdCell: fwBold,
+        render: function (data, type, row) {
+          if (data === 'Yes' && row.escalated_link) {
+            return '<a href="' + escapeHtml(row.escalated_link) + '">Yes</a>'
+          }
+          return data
+        }
+      },
+      {
+        data: 'crit_sit',
+        className: 'align-middle text-center',
+        createdCell: fwBold,
+        render: function (data) {
+          return data ? 'Yes' : 'No'
+        }
+      },
+      { data: 'summary', className: 'align-middle', render: escapeHtml },
+      { data: 'product', className: 'align-middle text-center', render: escapeHtml },
+      {
+        data: 'account',
+        className: 'align-middle text-center',
+        render: function (data) {
+          return '<a href="/account/' + encodeURIComponent(data) + '">' + escapeHtml(data) + '</a>'
+        }
+      },
+      { data: 'case_status', className: 'align-middle text-center', render: escapeHtml },
+      { data: 'card_status', className: 'align-middle text-center', render: escapeHtml },
+      {
+        data: 'assignee',
+        className: 'align-middle text-center',
+        render: function (data, type, row) {
+          let result = data != null
+            ? '<a href="/engineer/' + encodeURIComponent(data) + '">' + escapeHtml(data) + '</a>'
+            : 'None'
+          if (row.contributor.length) {
+            result += '<br><br><span class="fw-bold">Contributor(s):</span> ' +
+              row.contributor.map(escapeHtml).join(', ')
+          }
+          return result
+        }
+      },
+      {
+        data: 'card',
+        className: 'align-middle text-center',
+        render: function (data) {
+          return '<a href="' + escapeHtml(jiraServer) + '/browse/' + escapeHtml(data) + '" target="_blank">' + escapeHtml(data) + '</a>'
+        }
+      },
+      {
+        data: 'last_comment',
+        className: 'align-middle',
+        render: function (comment) {
+          if (comment == null) {
+            return ''
+          }
+          return '<span class="fw-bold fst-italic">' + comment[1].substring(0, 10) + '</span> - ' + comment[0]
+        }
+      },
+      {
+        data: 'case_days_open',
+        className: 'align-middle text-center',
+        render: function (data, type, row) {
+          let daysColor = ' '
+          const slaDays = slaSettings.days[row.severity]
+          if (row.case_status !== 'Closed' && slaSettings.partners.includes(row.account) && data > slaDays / 2) {
+            daysColor = data >= slaDays ? 'badge severity urgent' : 'badge severity high'
+          }
+          return '<span class="' + daysColor + '">' + data + '</span>'
+        }
+      },
+      { data: 'case_updated_date', className: 'align-middle text-center' },
+      {
+        data: 'daily_telco',
+        className: 'align-middle text-center',
+        visible: false,
+        render: function (data) {
+          return data ? 'True' : 'False'
+        }
+      },
+      // Hidden columns backing the 'Escalated?' and 'Case Status Closed, but
+      // Internal Status not Done' search panes, filtered server-side
+      { data: 'escalation_flags', visible: false, orderable: false, defaultContent: '' },
+      { data: 'closed_not_done', visible: false, orderable: false, defaultContent: '' }
+    ],
+    columnDefs: [
+      // Make sure filters are always shown
+      {
+        searchPanes: {
+          show: true
+        },
+        targets: [2, 3, 7, 9, 16, 17]
+      }
+    ]
+  }
+}
+
 // Initialize DataTable
 $(document).ready(function () {
   // Define configuration options for DataTable:
@@ -258,6 +408,42 @@ $(document).ready(function () {
     ]
   }
 
+  // Load rows page by page from the server if the table provides a data source
+  const serverSide = $('#data').data('source') !== undefined
+  if (serverSide) {
+    $.extend(options, serverSideOptions($('#data')))
+  }
+
+  /**
+   * showChild() opens the child row of a table row. The server-side tables
+   * only carry the summary columns, so the child row data is fetched from the
+   * card detail endpoint the first time a row is expanded.
+   */
+  function showChild (row) {
+    if (!serverSide) {
+      row.child(format($(row.node()).data('child-data'))).show()
+      $(row.node()).addClass('shown')
+      return
+    }
+    const tableElement = $('#data')
+    const url = tableElement.data('detail-url') + '/' + encodeURIComponent(row.data().card) + '/detail'
+    const params = {}
+    if (tableElement.data('detail-comments') !== undefined) {
+      params.comments = tableElement.data('detail-comments')
+    }
+    row.child("<div class='card p-3'>Loading...</div>").show()
+    $(row.node()).addClass('shown')
+    $.getJSON(url, params)
+      .done(function (detail) {
+        if (row.child.isShown()) {
+          row.child(format(detail)).show()
+        }
+      })
+      .fail(function () {
+        row.child("<div class='card p-3'>Could not load card details</div>").show()
+      })
+  }
+
   // Initialize Table w/ options defined above
   const table = $('#data').DataTable($.extend(true, options, searchOptions))
   table.searchPanes.container().prependTo(table.table().container())
@@ -274,8 +460,7 @@ $(document).ready(function () {
       tr.removeClass('shown')
     } else {
       // Open this row
-      row.child(format(tr.data('child-data'))).show()
-      tr.addClass('shown')
+      showChild(row)
     }
   })
 
@@ -284,8 +469,7 @@ $(document).ready(function () {
     // Disable array callback rule, this format is necessary w/ the Datatables API
     table.rows().every(function () { // eslint-disable-line array-callback-return
       if (!this.child.isShown()) {
-        this.child(format($(this.node()).data('child-data'))).show()
-        $(this.node()).addClass('shown')
+        showChild(this)
       }
     })
   })
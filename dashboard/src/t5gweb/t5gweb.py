@@ -4,14 +4,32 @@ import json
 import logging
 import os
 import re
-from copy import deepcopy
-from datetime import date, datetime, timezone
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
 
 import click
 from flask.cli import with_appcontext
-from t5gweb.utils import format_date, get_fake_data, set_cfg
+
+from t5gweb.utils import format_date, get_fake_data, parse_timestamp, set_cfg
 
 from . import cache, libtelco5g
+from .database import (
+    create_postgres_tables,
+    load_cases_postgres,
+    load_jira_card_postgres,
+)
+from .records import replace
+
+# views of the cards kept by the process in LRU order, see get_card_view()
+_card_views = {"version": None, "views": OrderedDict()}
+_card_views_lock = threading.Lock()
+# locks of the views being built, so that each view is built once without
+# holding _card_views_lock
+_card_view_builds = {}
+# views kept per version, most are filtered by an account or engineer
+max_card_views = 256
 
 
 def get_new_cases():
@@ -26,7 +44,7 @@ def get_new_cases():
     """
 
     # get cases from cache
-    cases = libtelco5g.redis_get("cases")
+    cases = libtelco5g.get_records("cases")
 
     interval = 7
     today = date.today()
@@ -36,8 +54,9 @@ def get_new_cases():
         if (today - format_date(d["createdate"]).date()).days <= interval
     }
     for case in new_cases:
-        new_cases[case]["severity"] = re.sub(
-            r"\(|\)| |\d", "", new_cases[case]["severity"]
+        new_cases[case] = replace(
+            new_cases[case],
+            severity=re.sub(r"\(|\)| |\d", "", new_cases[case]["severity"]),
         )
     return new_cases
 
@@ -77,26 +96,18 @@ def get_new_comments(cards, new_comments_only=True, account=None, engineer=None)
     account_list = []
 
     for card in cards:
-        comments = []
+        comments = cards[card]["comments"] or []
         if new_comments_only:
-            if cards[card]["comments"] is not None:
-                comments = [
-                    comment
-                    for comment in cards[card]["comments"]
-                    if (
-                        time_now
-                        - datetime.strptime(comment[1], "%Y-%m-%dT%H:%M:%S.%f%z")
-                    ).days
-                    < 7
-                ]
-        else:
-            if cards[card]["comments"] is not None:
-                comments = [comment for comment in cards[card]["comments"]]
+            comments = [
+                comment
+                for comment in comments
+                if (time_now - parse_timestamp(comment[1])).days < 7
+            ]
         if len(comments) == 0:
             continue  # no updates
         else:
-            detailed_cards[card] = cards[card]
-            detailed_cards[card]["comments"] = comments
+            # the cached cards are shared, see records.replace()
+            detailed_cards[card] = replace(cards[card], comments=comments)
         account_list.append(cards[card]["account"])
     account_list.sort()
     logging.warning("found %d detailed cards" % (len(detailed_cards)))
@@ -136,6 +147,155 @@ def get_trending_cards(cards):
     return accounts
 
 
+def get_card_view(view, account=None, engineer=None):
+    """Get a view of the cached cards, organized by account and status
+
+    Every view is built once per version of the 'cards' cache and kept by
+    the process, so the pages showing it don't regroup the cards on every
+    request. The 'recent' view is also rebuilt once its oldest comment is
+    more than 7 days old. At most max_card_views views are kept, the least
+    recently used are dropped first. Requests for a view being built wait
+    for it, requests for other views don't.
+
+    Args:
+        view: 'recent' for the cards with comments from the last week, 'all'
+            for the cards with comments, or 'trends' for the trending cards
+        account: Optional account name to filter the 'all' view by.
+            Defaults to None.
+        engineer: Optional engineer name to filter the 'all' view by.
+            Defaults to None.
+
+    Returns:
+        dict: Cards organized by account and status, see organize_cards().
+            The view is shared by every caller, so it must not be modified.
+    """
+    if view not in ("recent", "all", "trends"):
+        raise ValueError("unknown view: {}".format(view))
+    version = libtelco5g.get_cache_version("cards")
+    key = (view, account, engineer)
+    with _card_views_lock:
+        if version is None or _card_views["version"] != version:
+            _card_views["version"] = version
+            _card_views["views"] = OrderedDict()
+        accounts = _cached_card_view(key)
+        if accounts is not None:
+            return accounts
+        build = _card_view_builds.setdefault(key, threading.Lock())
+
+    try:
+        with build:
+            # built by another request while this one waited
+            with _card_views_lock:
+                if _card_views["version"] == version:
+                    accounts = _cached_card_view(key)
+            if accounts is not None:
+                return accounts
+
+            cards = libtelco5g.get_records("cards")
+            expires = None
+            if view == "recent":
+                accounts = get_new_comments(cards)
+                expires = _recent_expiry(accounts)
+            elif view == "all":
+                accounts = get_new_comments(
+                    cards, new_comments_only=False, account=account, engineer=engineer
+                )
+            else:
+                accounts = get_trending_cards(cards)
+
+            with _card_views_lock:
+                if version is not None and _card_views["version"] == version:
+                    views = _card_views["views"]
+                    views[key] = (accounts, expires)
+                    while len(views) > max_card_views:
+                        views.popitem(last=False)
+    finally:
+        with _card_views_lock:
+            if _card_view_builds.get(key) is build:
+                del _card_view_builds[key]
+    return accounts
+
+
+def _cached_card_view(key):
+    """Get a kept view of the cards, None if it's missing or expired
+
+    Must be called with _card_views_lock held.
+    """
+    cached = _card_views["views"].get(key)
+    if cached is None:
+        return None
+    if cached[1] is not None and datetime.now(timezone.utc) >= cached[1]:
+        del _card_views["views"][key]
+        return None
+    _card_views["views"].move_to_end(key)
+    return cached[0]
+
+
+def new_cases_window(**view_args):
+    """Day the 'last 7 days' window of get_new_cases() is counted from
+
+    Passed as the window of @conditional to the views showing the new cases,
+    or the cases opened and closed today and this week counted by
+    libtelco5g.generate_stats().
+
+    Args:
+        **view_args: Arguments of the view, e.g. the account. Not used.
+
+    Returns:
+        str: Current date in ISO format
+    """
+    return date.today().isoformat()
+
+
+def recent_comments_window(view="recent"):
+    """Expiry of the oldest comment of the 'recent' card view
+
+    Passed as the window of @conditional to the views showing the cards with
+    comments from the last week, as these views change when that comment gets
+    too old, even if the cards don't.
+
+    Args:
+        view: View served by the request. Only the 'recent' view depends on
+            the window. Defaults to 'recent'.
+
+    Returns:
+        str: Expiry of the view in ISO format, None for other views or if
+            the view has no comments
+    """
+    if view != "recent":
+        return None
+    get_card_view("recent")
+    with _card_views_lock:
+        cached = _card_views["views"].get(("recent", None, None))
+    if cached is None or cached[1] is None:
+        return None
+    return cached[1].isoformat()
+
+
+def _recent_expiry(accounts):
+    """Time at which the oldest comment of a 'recent' view gets too old
+
+    Args:
+        accounts: Cards organized by get_new_comments()
+
+    Returns:
+        datetime.datetime: Expiry of the view, None if it has no comments
+    """
+    oldest = min(
+        (
+            parse_timestamp(comment[1])
+            for states in accounts.values()
+            for cards in states.values()
+            for card in cards.values()
+            for comment in card["comments"]
+        ),
+        default=None,
+    )
+    if oldest is None:
+        return None
+    return oldest + timedelta(days=7)
+
+
 def plots():
     """Generate card summary statistics for plotting
 
@@ -165,10 +325,10 @@ def organize_cards(detailed_cards, account_list):
 
     accounts = {}
 
-    states = {"Waiting on Red Hat": {}, "Waiting on Customer": {}, "Closed": {}}
+    states = ("Waiting on Red Hat", "Waiting on Customer", "Closed")
 
     for account in account_list:
-        accounts[account] = deepcopy(states)
+        accounts[account] = {state: {} for state in states}
 
     for i in detailed_cards.keys():
         status = detailed_cards[i]["case_status"]
@@ -230,11 +390,109 @@ def init_cache():
         if stats == {}:
             logging.warning("no t5g stats found in cache. refreshing...")
             cache.get_stats()
+        if libtelco5g.redis_get("histograms") == {}:
+            logging.warning("no histogram stats found in cache. refreshing...")
+            cache.get_histogram_stats()
+        if libtelco5g.redis_get("duration_sketches") == {}:
+            logging.warning("no duration sketches found in cache. refreshing...")
+            cache.get_duration_sketches()
+        if libtelco5g.redis_get("table_index") == {}:
+            logging.warning("no table index found in cache. refreshing...")
+            cache.get_table_index()
+        for data_type in ("cards", "cases"):
+            if libtelco5g.redis_get("{}_query_index".format(data_type)) == {}:
+                logging.warning(
+                    "no {} query index found in cache. refreshing...".format(data_type)
+                )
+                cache.get_query_index(data_type)
     else:
         logging.warning("using fake data")
-        data = get_fake_data()
-        for key, value in data.items():
-            libtelco5g.redis_set(key, json.dumps(value))
+        load_fake_data()
+
+
+def fake_jira_issue(card_key, card):
+    """Wrap a fake card like the JIRA issue it would be built from
+
+    Args:
+        card_key: Key of the card, e.g. 'ABCD-1'
+        card: Fake card, see bin/generate_fake_data.py
+
+    Returns:
+        SimpleNamespace: Object with the JIRA issue attributes used by
+            cache.get_cards() and load_jira_card_postgres()
+    """
+    jira_status = {shown: jira for jira, shown in libtelco5g.status_map.items()}
+    assignee = SimpleNamespace(**card["assignee"])
+    author = SimpleNamespace(displayName=card["assignee"]["displayName"] or "fake")
+    comments = [
+        SimpleNamespace(
+            id="{}-{}".format(card_key, index),
+            body=body,
+            updated=updated,
+            author=author,
+        )
+        for index, (body, updated) in enumerate(card["comments"])
+    ]
+    return SimpleNamespace(
+        key=card_key,
+        fields=SimpleNamespace(
+            summary="{}: {}".format(card["case_number"], card["summary"]),
+            created=card["card_created"],
+            labels=card["labels"],
+            priority=SimpleNamespace(name=card["priority"]),
+            status=SimpleNamespace(name=jira_status[card["card_status"]]),
+            assignee=assignee if card["assignee"]["displayName"] else None,
+            customfield_10466=[
+                SimpleNamespace(**contributor) for contributor in card["contributor"]
+            ],
+            comment=SimpleNamespace(comments=comments),
+        ),
+    )
+
+
+def load_fake_data(path="data/fake_data.json", postgres=False):
+    """Load fake data into Redis and, optionally, PostgreSQL
+
+    Stores the cases, cards, bugs and issues generated by
+    bin/generate_fake_data.py and rebuilds the indexes and statistics the
+    refresh tasks would build from them.
+
+    Args:
+        path: Path to the JSON. Defaults to "data/fake_data.json".
+        postgres: Also load the cases, cards and comments into PostgreSQL.
+            Defaults to False.
+    """
+    data = get_fake_data(path)
+    for key, value in data.items():
+        libtelco5g.redis_set(key, json.dumps(value))
+    cache.get_card_indexes(data["cards"])
+    cache.get_query_index("cases", data["cases"])
+    logging.warning(
+        "loaded %s fake cases and %s fake cards", len(data["cases"]), len(data["cards"])
+    )
+
+    if postgres:
+        create_postgres_tables()
+        load_cases_postgres(data["cases"])
+        for card_key, card in data["cards"].items():
+            load_jira_card_postgres(
+                data["cases"], card["case_number"], fake_jira_issue(card_key, card)
+            )
+        logging.warning("loaded fake data into PostgreSQL")
+
+
+@click.command("load-fake-data")
+@click.argument("path", default="data/fake_data.json")
+@click.option("--postgres", is_flag=True, help="Also load into PostgreSQL.")
+@with_appcontext
+def load_fake_data_command(path, postgres):
+    """Load fake data generated by bin/generate_fake_data.py
+
+    Note:
+        This is a Flask CLI command and should be run using:
+        flask load-fake-data [PATH] [--postgres]
+    """
+    load_fake_data(path, postgres)
 
 
 def init_app(app):
@@ -246,3 +504,4 @@ def init_app(app):
         app: Flask application instance to register commands with
     """
     app.cli.add_command(init_cache)
+    app.cli.add_command(load_fake_data_command)
@@ -0,0 +1,455 @@
+"""tables.py: server-side processing for the t5gweb DataTables views"""
+
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from t5gweb.utils import parse_timestamp
+
+# order in which severities are sorted
+severity_order = {"Low": 1, "Normal": 2, "High": 3, "Urgent": 4}
+
+# DataTables column index -> row key, must match the columns in table.js
+table_columns = [
+    None,  # child row control
+    "case_number",
+    "severity",
+    "escalated",
+    "crit_sit",
+    "summary",
+    "product",
+    "account",
+    "case_status",
+    "card_status",
+    "assignee",
+    "card",
+    "last_comment",
+    "case_days_open",
+    "case_updated_date",
+    "daily_telco",
+    "escalation_flags",
+    "closed_not_done",
+]
+
+# searchPanes shown for the server-side tables, keyed by column data name
+pane_columns = [
+    "severity",
+    "escalated",
+    "product",
+    "account",
+    "card_status",
+    "escalation_flags",
+    "closed_not_done",
+]
+
+# columns matched by the global search. The boolean and hidden columns are
+# only filtered on through the search panes.
+search_columns = [
+    "case_number",
+    "severity",
+    "escalated",
+    "summary",
+    "product",
+    "account",
+    "case_status",
+    "card_status",
+    "assignee",
+    "contributor",
+    "card",
+    "last_comment",
+    "case_days_open",
+    "case_updated_date",
+]
+
+# largest page served by table_data(), 'All' (-1) is capped to it as well
+max_page_length = 500
+
+
+def _escalated_label(card):
+    """Label shown in the 'On Prio-list?' column"""
+    if card["escalated"]:
+        return "Yes"
+    if card["potential_escalation"]:
+        return "Potentially"
+    return "No"
+
+
+def _pane_values(row):
+    """Get the searchPane options a row belongs to
+
+    A row can belong to several options of the same pane, e.g. a potential
+    escalation is listed under both 'No' and 'Potentially' of the 'On
+    Prio-list?' pane, like the custom panes of the client-side tables.
+
+    Args:
+        row: Table row built by _build_row()
+
+    Returns:
+        dict: Pane name -> list of option values
+    """
+    escalated = [row["escalated"]]
+    if row["escalated"] == "Potentially":
+        escalated.append("No")
+    escalation_flags = []
+    if row["escalated"] == "Yes" or row["crit_sit"]:
+        escalation_flags.append("Cases on Prio-list or Crit Sit")
+    if row["daily_telco"]:
+        escalation_flags.append("Cases on Daily Telco List")
+    closed_not_done = []
+    if row["case_status"] == "Closed" and row["card_status"] != "Done":
+        closed_not_done.append("Case Status Closed, but Internal Status not Done")
+    return {
+        "severity": [row["severity"]],
+        "escalated": escalated,
+        "product": [row["product"]],
+        "account": [row["account"]],
+        "card_status": [row["card_status"]],
+        "escalation_flags": escalation_flags,
+        "closed_not_done": closed_not_done,
+    }
+
+
+def _build_row(card, data):
+    """Build the table row of a single card
+
+    Only the summary columns are included; the data shown in the child row is
+    served separately by build_card_detail().
+
+    Args:
+        card: Card key
+        data: Card dictionary from the 'cards' cache
+
+    Returns:
+        dict: Row with the values needed to render the table
+    """
+    comments = data["comments"] or []
+    return {
+        "card": card,
+        "case_number": data["case_number"],
+        "severity": data["severity"],
+        "escalated": _escalated_label(data),
+        "escalated_link": data["escalated_link"],
+        "crit_sit": data["crit_sit"],
+        "summary": data["summary"],
+        "product": data["product"],
+        "account": data["account"],
+        "case_status": data["case_status"],
+        "card_status": data["card_status"],
+        "assignee": data["assignee"]["displayName"],
+        "contributor": [c["displayName"] for c in data["contributor"]],
+        "case_days_open": data["case_days_open"],
+        "case_updated_date": data["case_updated_date"],
+        "daily_telco": data["daily_telco"],
+        "last_comment": comments[-1] if comments else None,
+        "latest_comment": max((c[1] for c in comments), default=None),
+    }
+
+
+def build_card_detail(data):
+    """Build the child row detail of a single card
+
+    Args:
+        data: Card dictionary from the 'cards' cache
+
+    Returns:
+        dict: Case group, severity, bugzillas, JIRA issues and comments
+    """
+    return {
+        "group_name": data["group_name"],
+        "severity": data["severity"],
+        "bugzilla": data["bugzilla"],
+        "issues": data["issues"],
+        "comments": data["comments"] or [],
+    }
+
+
+def recent_comments(comments, time_now=None):
+    """Only keep comments updated within the last 7 days
+
+    Args:
+        comments: List of (body, timestamp) comments
+        time_now: Current datetime. Defaults to now.
+
+    Returns:
+        list: Comments updated within the last 7 days
+    """
+    if time_now is None:
+        time_now = datetime.now(timezone.utc)
+    return [c for c in comments if _is_recent(c[1], time_now)]
+
+
+def recent_expiry(comments, time_now=None):
+    """Time at which the oldest recent comment gets older than 7 days
+
+    Args:
+        comments: List of (body, timestamp) comments
+        time_now: Current datetime. Defaults to now.
+
+    Returns:
+        datetime.datetime: Expiry of the oldest recent comment, None if no
+            comment is recent
+    """
+    oldest = min(
+        (c[1] for c in recent_comments(comments, time_now)),
+        key=parse_timestamp,
+        default=None,
+    )
+    if oldest is None:
+        return None
+    return parse_timestamp(oldest) + timedelta(days=7)
+
+
+def _search_text(row):
+    """Text of a row matched by the global search
+
+    Only the values shown in the table are searched, one per line, so that a
+    search doesn't match the keys of the card or span several columns.
+
+    Args:
+        row: Table row built by _build_row()
+
+    Returns:
+        str: Lowercase search text
+    """
+    values = []
+    for column in search_columns:
+        value = row[column]
+        if column == "contributor":
+            values.extend(value)
+        elif column == "last_comment":
+            if value:
+                values.append("{} - {}".format(value[1][:10], value[0]))
+        elif value is not None:
+            values.append(str(value))
+    return "\n".join(values).lower()
+
+
+def build_table_index(cards):
+    """Precompute the rows and indexes used by the server-side tables
+
+    The rows and search text are kept apart from the index, so that only the
+    rows of the requested page need to be loaded, see query_table().
+
+    Args:
+        cards: Dictionary of cards from the 'cards' cache
+
+    Returns:
+        tuple: A 3-tuple containing:
+            - index: {"views": {view: [card, ...]},
+              "panes": {pane: {value: [card, ...]}},
+              "ranks": {column: {card: rank}}, "latest_comment": {card: date},
+              "digest": digest of the rows}
+            - rows: {card: row}
+            - search: {card: lowercase text searched by the global search}
+    """
+    rows = {}
+    search = {}
+    panes = {pane: {} for pane in pane_columns}
+    views = {"all": [], "trends": []}
+    latest_comment = {}
+    for card, data in cards.items():
+        row = _build_row(card, data)
+        rows[card] = row
+        search[card] = _search_text(row)
+        # cards without comments are never shown in the comment based views
+        if row["last_comment"]:
+            views["all"].append(card)
+            latest_comment[card] = row["latest_comment"]
+        if "Trends" in data["labels"]:
+            views["trends"].append(card)
+        for pane, values in _pane_values(row).items():
+            for value in values:
+                panes[pane].setdefault(str(value), []).append(card)
+
+    # rank of each card per sortable column, equal values get the same rank
+    ranks = {}
+    for column in table_columns:
+        if column is None or any(column not in row for row in rows.values()):
+            continue
+        keys = {card: _sort_key(row, column) for card, row in rows.items()}
+        ranks[column] = {}
+        rank = -1
+        previous = None
+        for card in sorted(keys, key=keys.get):
+            if rank < 0 or keys[card] != previous:
+                rank += 1
+                previous = keys[card]
+            ranks[column][card] = rank
+    digest = hashlib.sha1(
+        json.dumps(rows, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    index = {
+        "views": views,
+        "panes": panes,
+        "ranks": ranks,
+        "latest_comment": latest_comment,
+        "digest": digest,
+    }
+    return index, rows, search
+
+
+def _is_recent(timestamp, time_now):
+    """Check whether a comment timestamp is within the last 7 days"""
+    return (time_now - parse_timestamp(timestamp)).days < 7
+
+
+def _view_cards(index, view, time_now):
+    """Get the card keys of a table view
+
+    Args:
+        index: Index built by build_table_index()
+        view: 'recent', 'all' or 'trends'
+        time_now: Current datetime, used for the 'recent' view
+
+    Returns:
+        list: Card keys in the view
+    """
+    if view == "recent":
+        return [
+            card
+            for card in index["views"]["all"]
+            if _is_recent(index["latest_comment"][card], time_now)
+        ]
+    return list(index["views"].get(view, []))
+
+
+def _sort_key(row, column):
+    """Sort key of a row for a column, see table_columns"""
+    if column == "severity":
+        return severity_order.get(row["severity"], 0)
+    if column == "last_comment":
+        return row["last_comment"][1] if row["last_comment"] else ""
+    value = row.get(column)
+    if isinstance(value, (bool, int, float)):
+        return value
+    return str(value or "").lower()
+
+
+def parse_table_request(args):
+    """Parse the DataTables server-side processing parameters
+
+    Args:
+        args: Mapping of query string arguments (e.g. Flask's request.args)
+
+    Returns:
+        dict: Parsed 'draw', 'start', 'length', 'search', 'order' (list of
+            (column, descending) tuples) and 'panes' (pane -> selected values)
+
+    Raises:
+        ValueError: If 'draw', 'start', 'length' or an order column is not
+            an integer
+    """
+    order = []
+    i = 0
+    while f"order[{i}][column]" in args:
+        column = int(args[f"order[{i}][column]"])
+        if 0 < column < len(table_columns):
+            order.append((column, args.get(f"order[{i}][dir]") == "desc"))
+        i += 1
+
+    panes = {}
+    for pane in pane_columns:
+        selected = []
+        j = 0
+        while f"searchPanes[{pane}][{j}]" in args:
+            selected.append(args[f"searchPanes[{pane}][{j}]"])
+            j += 1
+        if selected:
+            panes[pane] = selected
+
+    length = int(args.get("length", 50))
+    if not 0 <= length <= max_page_length:
+        length = max_page_length
+
+    return {
+        "draw": int(args.get("draw", 0)),
+        "start": max(int(args.get("start", 0)), 0),
+        "length": length,
+        "search": args.get("search[value]", "").strip().lower(),
+        "order": order,
+        "panes": panes,
+    }
+
+
+def lookup(values):
+    """Look up the values of several keys of a dictionary
+
+    Args:
+        values: Dictionary, e.g. the rows returned by build_table_index()
+
+    Returns:
+        function: Function returning {key: value} for a list of keys, like
+            libtelco5g.redis_hmget() does for a Redis hash
+    """
+    return lambda keys: {key: values[key] for key in keys if key in values}
+
+
+def query_table(index, view, params, rows, search=None, time_now=None):
+    """Answer a DataTables server-side processing request
+
+    Filters with the precomputed pane indexes and global search text, sorts
+    by the precomputed ranks and pages the cards of a view. Only the rows of
+    the page, and the search text of the filtered cards when searching, are
+    looked up.
+
+    Args:
+        index: Index built by build_table_index()
+        view: 'recent', 'all' or 'trends'
+        params: Parameters returned by parse_table_request()
+        rows: Function returning {card: row} for a list of cards, e.g. reading
+            the 'table_rows' hash, see lookup()
+        search: Function returning {card: search text} for a list of cards.
+            Only needed when params contains a global search. Defaults to
+            None.
+        time_now: Current datetime. Defaults to now.
+
+    Returns:
+        dict: Response with 'draw', 'recordsTotal', 'recordsFiltered', 'data'
+            and the 'searchPanes' options for the current view
+    """
+    if time_now is None:
+        time_now = datetime.now(timezone.utc)
+    view_cards = _view_cards(index, view, time_now)
+    in_view = set(view_cards)
+
+    selected = set(in_view)
+    for pane, values in params["panes"].items():
+        matching = set()
+        for value in values:
+            matching.update(index["panes"][pane].get(value, []))
+        selected &= matching
+    filtered = [card for card in view_cards if card in selected]
+    if params["search"] and search is not None:
+        texts = search(filtered)
+        filtered = [c for c in filtered if params["search"] in texts.get(c, "")]
+        selected = set(filtered)
+
+    # Python's sort is stable, so sort by the least significant column first
+    for column, descending in reversed(params["order"]):
+        ranks = index["ranks"].get(table_columns[column])
+        if ranks is not None:
+            filtered.sort(key=lambda card: ranks.get(card, -1), reverse=descending)
+
+    page = filtered[params["start"] : params["start"] + params["length"]]
+    page_rows = rows(page)
+    options = {}
+    for pane in pane_columns:
+        options[pane] = [
+            {
+                "label": value,
+                "value": value,
+                "total": len(in_view.intersection(cards)),
+                "count": len(selected.intersection(cards)),
+            }
+            for value, cards in sorted(index["panes"][pane].items())
+            if in_view.intersection(cards)
+        ]
+
+    return {
+        "draw": params["draw"],
+        "recordsTotal": len(view_cards),
+        "recordsFiltered": len(filtered),
+        # rows of cards removed since the index was read are left out
+        "data": [page_rows[card] for card in page if card in page_rows],
+        "searchPanes": {"options": options},
+    }
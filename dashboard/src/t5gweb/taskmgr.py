@@ -1,19 +1,107 @@
 """start celery and manage tasks"""
 
+import datetime
 import json
 import logging
 import os
+import time
+import uuid
 
 import redis
-from celery import Celery
+from celery import Celery, chain, chord, group
 from celery.schedules import crontab
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    task_retry,
+    worker_init,
+)
 
 import t5gweb.cache as cache
 import t5gweb.libtelco5g as libtelco5g
-from t5gweb.utils import set_cfg
+from t5gweb import metrics, tracing
+from t5gweb.utils import next_refresh_interval, set_cfg
 
 mgr = Celery("t5gweb", broker="redis://redis:6379/0", backend="redis://redis:6379/0")
 
+# Queues, so that user-triggered work doesn't wait behind long batch jobs:
+# - interactive: refreshes started by users and short scheduling tasks
+# - ingest: long reads from the Portal, JIRA and Bugzilla APIs
+# - mutation: tasks that change JIRA/Bugzilla or send notifications
+# Within a queue, tasks with a lower priority number run first.
+task_routes = {
+    "t5gweb.taskmgr.refresh_background": {"queue": "interactive", "priority": 0},
+    "t5gweb.taskmgr.refresh_tick": {"queue": "interactive", "priority": 3},
+    "t5gweb.taskmgr.refresh_pipeline": {"queue": "interactive", "priority": 3},
+    "t5gweb.taskmgr.refresh_stage": {"queue": "ingest", "priority": 3},
+    "t5gweb.taskmgr.cache_data": {"queue": "ingest", "priority": 5},
+    "t5gweb.taskmgr.cache_stats": {"queue": "ingest", "priority": 7},
+    "t5gweb.taskmgr.portal_jira_sync": {"queue": "mutation", "priority": 3},
+    "t5gweb.taskmgr.t_sync_priority": {"queue": "mutation", "priority": 5},
+    "t5gweb.taskmgr.t_tag_bz": {"queue": "mutation", "priority": 7},
+}
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Route a task to its queue, see task_routes
+
+    On-demand refreshes (refresh_job) are routed by data type: cards, cases
+    and stats are quick enough for the interactive queue, creating JIRA cards
+    is a mutation and everything else is ingested in the background.
+
+    Returns:
+        dict or None: Queue and priority of the task, None for the default
+    """
+    if name == "t5gweb.taskmgr.refresh_job":
+        data_type = (args or [kwargs.get("data_type")])[0]
+        if data_type == "create_jira_cards":
+            return {"queue": "mutation", "priority": 1}
+        if data_type in ("cards", "cases", "stats"):
+            return {"queue": "interactive", "priority": 1}
+        return {"queue": "ingest", "priority": 1}
+    return task_routes.get(name)
+
+
+mgr.conf.update(
+    task_routes=(route_task,),
+    task_default_queue="ingest",
+    task_default_priority=5,
+    # a worker only reserves the task it runs, so that long tasks don't hold
+    # back short ones queued behind them
+    worker_prefetch_multiplier=1,
+    broker_transport_options={
+        "priority_steps": list(range(10)),
+        "sep": ":",
+        "queue_order_strategy": "priority",
+    },
+)
+
+# Stages of the refresh pipeline: the cache keys each stage writes, and the
+# minimum/maximum time in seconds between two refreshes. A stage is refreshed
+# when an upstream stage changed and min_age has passed, or when max_age has
+# passed, since some sources (e.g. Bugzilla) also change on their own.
+refresh_stages = {
+    "cases": {"keys": ("cases",), "min_age": 0, "max_age": 0},
+    "details": {"keys": ("details", "case_bz"), "min_age": 3600, "max_age": 43200},
+    "bugs": {"keys": ("bugs",), "min_age": 3600, "max_age": 43200},
+    "issues": {"keys": ("issues",), "min_age": 3600, "max_age": 43200},
+    "escalations": {"keys": ("escalations",), "min_age": 900, "max_age": 7200},
+    "cards": {"keys": ("cards",), "min_age": 900, "max_age": 3600},
+}
+
+# data types that can be refreshed on demand through refresh_job
+refresh_types = (
+    "cards",
+    "cases",
+    "details",
+    "bugs",
+    "escalations",
+    "issues",
+    "create_jira_cards",
+    "stats",
+)
+
 
 # https://docs.celeryproject.org/en/stable/userguide/periodic-tasks.html#entries
 @mgr.on_after_configure.connect
@@ -28,22 +116,16 @@ def setup_scheduled_tasks(sender, **kwargs):
 
     Scheduled tasks include:
     - Portal to JIRA sync (hourly + 10min)
-    - Card cache updates (hourly + 21min)
-    - Case cache updates (every 15min)
-    - Details cache updates (twice daily)
-    - Issues cache updates (twice daily)
+    - Refresh pipeline for cases, details, bugs, issues, escalations and
+      cards (adaptive interval, checked every minute), see refresh_tick()
     - Daily statistics generation (daily at 4:40)
     - Priority sync (daily at 3:12, read-write only)
     - Bug tagging (daily, read-write only, telco5g specific)
-    - Bugzilla details cache (twice daily, if API key configured)
-    - Escalations cache (12x daily, if configured)
 
     Args:
         sender: Celery application instance
         **kwargs: Additional keyword arguments from the signal
     """
-    cfg = set_cfg()
-
     # Anything except for 'true' will be set to False
     read_only = os.getenv("READ_ONLY", "false") == "true"
 
@@ -73,32 +155,11 @@ def setup_scheduled_tasks(sender, **kwargs):
     else:
         logging.warning("Read only - Not making changes to Jira boards.")
 
-    # update card cache
-    sender.add_periodic_task(
-        crontab(hour="*", minute="21"),  # on the hour + offset
-        cache_data.s("cards"),
-        name="card_sync",
-    )
-
-    # update case cache
-    sender.add_periodic_task(
-        crontab(hour="*", minute="*/15"),  # every 15 minutes
-        cache_data.s("cases"),
-        name="case_sync",
-    )
-
-    # update details cache
-    sender.add_periodic_task(
-        crontab(hour="*/12", minute="24"),  # twice a day
-        cache_data.s("details"),
-        name="details_sync",
-    )
-
-    # update Jira bug details cache
+    # refresh cases and everything that depends on them when due
     sender.add_periodic_task(
-        crontab(hour="*/12", minute="54"),  # twice a day
-        cache_data.s("issues"),
-        name="issues_sync",
+        crontab(hour="*", minute="*"),  # every minute
+        refresh_tick.s(),
+        name="refresh_tick",
     )
 
     # generate daily stats
@@ -108,25 +169,78 @@ def setup_scheduled_tasks(sender, **kwargs):
         name="cache_stats",
     )
 
-    # optional tasks
 
-    # update bugzilla details cache
-    if cfg["bz_key"] is not None and cfg["bz_key"] != "":
-        sender.add_periodic_task(
-            crontab(hour="*/12", minute="48"),  # twice a day
-            cache_data.s("bugs"),
-            name="bugs_sync",
-        )
+@worker_init.connect
+def start_metrics_server(sender=None, **kwargs):
+    """Expose the task and external call metrics of this worker
 
-    # update escalations cache
-    if cfg["jira_escalations_project"] and cfg["jira_escalations_label"]:
-        sender.add_periodic_task(
-            crontab(hour="*/2", minute="37"),  # 12x a day
-            cache_data.s("escalations"),
-            name="escalations_sync",
+    Each worker serves its metrics on the 'worker_metrics_port' (9808 by
+    default, 0 disables the server), see metrics.start_worker_server().
+    """
+    metrics.start_worker_server(int(set_cfg()["worker_metrics_port"]))
+
+
+# start time of the tasks running in this process, by task id
+task_start_times = {}
+
+
+@task_prerun.connect
+def record_task_start(task_id=None, **kwargs):
+    """Record when a task starts, see record_task_duration()"""
+    task_start_times[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def record_task_duration(task_id=None, task=None, state=None, **kwargs):
+    """Observe the run time of a task in the task duration histogram"""
+    start = task_start_times.pop(task_id, None)
+    if start is not None:
+        metrics.TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - start
         )
 
 
+@task_retry.connect
+def count_task_retry(sender=None, **kwargs):
+    """Count the retries of a task"""
+    metrics.TASK_RETRIES.labels(sender.name).inc()
+
+
+@before_task_publish.connect
+def inject_trace_context(headers=None, **kwargs):
+    """Propagate the current span to the tasks it starts
+
+    The span's traceparent is sent in the task message headers, so a task
+    started by a request or by another task is traced as its child.
+    """
+    traceparent = tracing.current_traceparent()
+    if traceparent and headers is not None:
+        headers["traceparent"] = traceparent
+
+
+# spans of the tasks running in this process, by task id
+task_spans = {}
+
+
+@task_prerun.connect
+def start_task_span(task_id=None, task=None, **kwargs):
+    """Start the span of a task, child of the span that published it"""
+    parent = tracing.parse_traceparent(getattr(task.request, "traceparent", None))
+    task_spans[task_id] = tracing.start_span(
+        "task {}".format(task.name), parent=parent, task_id=task_id
+    )
+
+
+@task_postrun.connect
+def end_task_span(task_id=None, retval=None, state=None, **kwargs):
+    """End the span of a task"""
+    error = retval if isinstance(retval, Exception) else None
+    task_span = task_spans.pop(task_id, None)
+    if task_span is not None:
+        task_span.attributes["state"] = state
+    tracing.end_span(task_span, error)
+
+
 @mgr.task
 def portal_jira_sync():
     """Celery task to synchronize Red Hat Portal cases to JIRA cards
@@ -148,6 +262,9 @@ def portal_jira_sync():
         have_lock = sync_lock.acquire(blocking=False)
         if have_lock:
             result = libtelco5g.sync_portal_to_jira()
+            if result["cards_created"]:
+                # the new cards were only added to the 'cards' cache
+                cache.get_card_indexes()
         else:
             result = {"locked": "Task is Locked"}
     finally:
@@ -162,46 +279,48 @@ def cache_data(data_type):
 
     Fetches data from external APIs and updates the Redis cache for the
     specified data type. Supports cases, cards, details, bugs, issues, and
-    escalations. Card refreshes use a distributed lock to prevent concurrent
-    updates (30-minute timeout).
+    escalations. Refreshes of the same data type never run concurrently: a
+    second call waits up to a minute for the running one and returns its
+    result or raises its error, see singleflight(). Card refreshes time out
+    after 30 minutes, the others after an hour.
 
     Task automatically retries up to 5 times with 30-second backoff on failure.
 
     Args:
         data_type: Type of data to cache. Valid values:
             - 'cases': Red Hat Portal cases
-            - 'cards': JIRA cards (uses locking)
+            - 'cards': JIRA cards
             - 'details': Case details including CritSit status
             - 'bugs': Bugzilla bug details
             - 'issues': JIRA issues linked to cases
             - 'escalations': Escalated cases from JIRA board
 
     Returns:
-        dict or None: Result dictionary for card refresh with count, None for
-            other data types. Returns None if locked when attempting card refresh.
+        dict or None: Result dictionary for card refresh with count,
+            {'caching <data_type>': 'ok'} for the other data types. None if
+            the refresh was skipped because another one was running and its
+            result isn't available, e.g. a card refresh started by
+            refresh_background.
     """
     logging.warning("job: sync {}".format(data_type))
+    if data_type == "cards":
+        # shares refresh_background's lock to prevent concurrent card refreshes
+        return singleflight(
+            "cards", lambda: _cache_data(data_type), 60 * 30, lock_name="refresh_lock"
+        )
+    return singleflight(data_type, lambda: _cache_data(data_type))
+
 
+def _cache_data(data_type):
+    """Refresh the cache of a data type, see cache_data()"""
     cfg = set_cfg()
 
-    result = None
+    result = {"caching {}".format(data_type): "ok"}
 
     if data_type == "cases":
         cache.get_cases(cfg)
     elif data_type == "cards":
-        # Use redis locks to prevent concurrent refreshes
-
-        have_lock = False
-        refresh_lock = redis.Redis(host="redis").lock("refresh_lock", timeout=60 * 30)
-        try:
-            have_lock = refresh_lock.acquire(blocking=False)
-            if have_lock:
-                result = cache.get_cards(cfg)
-            else:
-                logging.warning("lock found. bailing...")
-        finally:
-            if have_lock:
-                refresh_lock.release()
+        result = cache.get_cards(cfg)
     elif data_type == "details":
         cache.get_case_details(cfg)
     elif data_type == "bugs":
@@ -214,10 +333,84 @@ def cache_data(data_type):
         libtelco5g.redis_set("escalations", json.dumps(escalations))
     else:
         logging.warning("unknown data type")
+        result = None
 
     return result
 
 
+def singleflight(key, func, timeout=60 * 60, lock_name=None, wait=60):
+    """Run func at most once at a time per key across all workers
+
+    The first caller (the leader) runs func while holding a Redis lock and
+    publishes its result, or its error if it fails. Callers arriving while it
+    runs don't run func again: they wait up to `wait` seconds for the leader
+    to finish and return its result, or raise its error. Each attempt is
+    counted in the 'singleflight_attempts' hash as leader, coalesced, failed
+    or timeout, see t5gweb.metrics.
+
+    Args:
+        key: Name of the work, e.g. the data type being refreshed
+        func: Function without arguments returning a JSON-serializable result
+        timeout: Seconds after which the lock and the published result
+            expire. Defaults to 1 hour.
+        lock_name: Name of the Redis lock. Defaults to 'singleflight:<key>'.
+        wait: Seconds a caller waits for the in-flight run. Defaults to 60.
+
+    Returns:
+        Result of func, from this call or the in-flight one. None if the
+            in-flight run is still running after `wait` seconds or didn't
+            publish a result.
+
+    Raises:
+        RuntimeError: If the in-flight run failed
+    """
+    r_cache = redis.Redis(host="redis")
+    lock_name = lock_name or "singleflight:{}".format(key)
+    result_key = "singleflight:{}:result".format(key)
+    lock = r_cache.lock(lock_name, timeout=timeout)
+
+    # the lock's token identifies the run, so waiting callers can tell
+    # whether the published result is the one of the run they waited for
+    run_id = str(uuid.uuid4())
+    if lock.acquire(blocking=False, token=run_id):
+        r_cache.hincrby("singleflight_attempts", "{}|leader".format(key), 1)
+        # published as is if func is interrupted, e.g. by a time limit
+        published = {"run_id": run_id, "error": "interrupted"}
+        try:
+            result = func()
+            published = {"run_id": run_id, "result": result}
+        except Exception as e:
+            published["error"] = str(e)
+            raise
+        finally:
+            r_cache.set(result_key, json.dumps(published), ex=timeout)
+            try:
+                lock.release()
+            except redis.exceptions.LockError:
+                logging.warning("{} lock expired before the run finished".format(key))
+        return result
+
+    run_id = r_cache.get(lock_name)
+    logging.warning("{} already running, waiting for its result".format(key))
+    deadline = time.time() + wait
+    while r_cache.exists(lock_name):
+        if time.time() > deadline:
+            r_cache.hincrby("singleflight_attempts", "{}|timeout".format(key), 1)
+            return None
+        time.sleep(2)
+    published = r_cache.get(result_key)
+    published = json.loads(published) if published is not None else {}
+    if run_id is None or published.get("run_id") != run_id.decode("utf-8"):
+        published = {}
+    outcome = "failed" if "error" in published else "coalesced"
+    r_cache.hincrby("singleflight_attempts", "{}|{}".format(key, outcome), 1)
+    if "error" in published:
+        raise RuntimeError(
+            "{} failed in another worker: {}".format(key, published["error"])
+        )
+    return published.get("result")
+
+
 @mgr.task(autoretry_for=(Exception,), max_retries=3, retry_backoff=30)
 def t_tag_bz():
     """Celery task to tag Bugzilla and JIRA bugs with Telco keywords
@@ -305,3 +498,223 @@ def t_sync_priority():
     cfg = set_cfg()
     libtelco5g.sync_priority(cfg)
     logging.warning("...sync completed")
+
+
+def start_refresh(data_type):
+    """Start an on-demand refresh, or join the one already running
+
+    A job is recorded under the 'refresh_job:<data_type>' key until it
+    finishes, so concurrent requests for the same data type share one job.
+    The key expires after 2 hours in case a worker dies mid-job.
+
+    Args:
+        data_type: One of refresh_types
+
+    Returns:
+        tuple: (job ID, True if a new job was started or False if an existing
+            job was joined)
+    """
+    r_cache = redis.Redis(host="redis")
+    job_key = "refresh_job:{}".format(data_type)
+    job_id = str(uuid.uuid4())
+    if r_cache.set(job_key, job_id, nx=True, ex=60 * 60 * 2):
+        refresh_job.apply_async(args=(data_type,), task_id=job_id)
+        return job_id, True
+    running_id = r_cache.get(job_key)
+    if running_id is None:
+        # the job finished in the meantime, start a new one
+        return start_refresh(data_type)
+    return running_id.decode("utf-8"), False
+
+
+@mgr.task(bind=True)
+def refresh_job(self, data_type):
+    """Celery task to refresh a data type on demand
+
+    Started by start_refresh() for the /api/refresh endpoint. Runs the same
+    code as the scheduled tasks and clears the 'refresh_job:<data_type>' key
+    when done, so the next request starts a new job.
+
+    Args:
+        self: Celery task instance (bound), used to get the job ID
+        data_type: One of refresh_types
+
+    Returns:
+        dict: Result of the refresh. {'caching <data_type>': 'skipped: already
+            running'} if another refresh of the data type was running and
+            this job didn't get its result.
+    """
+    try:
+        if data_type == "create_jira_cards":
+            result = portal_jira_sync()
+        elif data_type == "stats":
+            cache_stats()
+            result = {"caching stats": "ok"}
+        else:
+            result = cache_data(data_type)
+            if result is None:
+                result = {"caching {}".format(data_type): "skipped: already running"}
+    finally:
+        r_cache = redis.Redis(host="redis")
+        job_key = "refresh_job:{}".format(data_type)
+        running_id = r_cache.get(job_key)
+        if running_id is not None and running_id.decode("utf-8") == self.request.id:
+            r_cache.delete(job_key)
+    return result
+
+
+def _stage_enabled(data_type, cfg):
+    """Check whether an optional pipeline stage is configured"""
+    if data_type == "bugs":
+        return cfg["bz_key"] is not None and cfg["bz_key"] != ""
+    if data_type == "escalations":
+        return bool(cfg["jira_escalations_project"] and cfg["jira_escalations_label"])
+    return True
+
+
+def _upstream_changed(upstream):
+    """Check whether any upstream stage reported a change
+
+    Args:
+        upstream: Result of the previous stage (bool), a list of results when
+            the stage follows a chord, or None for the first stage
+    """
+    if isinstance(upstream, list):
+        return any(_upstream_changed(result) for result in upstream)
+    return bool(upstream)
+
+
+@mgr.task(autoretry_for=(Exception,), max_retries=3, retry_backoff=30)
+def refresh_stage(upstream, data_type):
+    """Celery task running one stage of the refresh pipeline
+
+    Skips the refresh if no upstream stage changed and the stage's data is
+    younger than its max_age, or if the data is younger than its min_age.
+    Changes are detected through the cache versions, which redis_set() only
+    bumps when the data actually changed. A failing refresh is logged and
+    treated as unchanged, so the downstream stages still run with the data
+    cached by its last successful run, and it is retried by the next run of
+    the pipeline.
+
+    Args:
+        upstream: Result(s) of the upstream stage(s), see _upstream_changed()
+        data_type: Name of the stage in refresh_stages
+
+    Returns:
+        bool: True if this stage or any upstream stage changed the cache
+    """
+    stage = refresh_stages[data_type]
+    changed = _upstream_changed(upstream)
+    r_cache = redis.Redis(host="redis")
+    age = time.time() - float(r_cache.hget("refresh_times", data_type) or 0)
+    due = age >= stage["max_age"] or (changed and age >= stage["min_age"])
+    if not due or not _stage_enabled(data_type, set_cfg()):
+        logging.warning("job: skipping {} refresh".format(data_type))
+        return changed
+
+    before = libtelco5g.get_cache_version(*stage["keys"])
+    try:
+        cache_data(data_type)
+    except Exception as e:
+        logging.error("job: {} refresh failed: {}".format(data_type, e))
+        return changed
+    r_cache.hset("refresh_times", data_type, time.time())
+    stage_changed = libtelco5g.get_cache_version(*stage["keys"]) != before
+    changes = 0
+    if stage_changed:
+        records = libtelco5g.redis_get(stage["keys"][0])
+        if isinstance(records, dict):
+            changes = libtelco5g.count_record_changes(stage["keys"][0], records)
+        else:
+            changes = 1
+    r_cache.hset("refresh_changes", data_type, changes)
+    logging.warning("job: {} {} changed".format(changes, data_type))
+    if data_type == "cases":
+        schedule_next_refresh(changes)
+    return changed or stage_changed
+
+
+def schedule_next_refresh(changes):
+    """Schedule the next run of the refresh pipeline
+
+    The interval adapts to the number of cases that changed during the last
+    run, see utils.next_refresh_interval(). The schedule is stored in the
+    'refresh_schedule' key and displayed on the dashboard.
+
+    Args:
+        changes: Number of cases that changed during the last refresh
+    """
+    cfg = set_cfg()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    schedule = libtelco5g.redis_get("refresh_schedule")
+    interval = next_refresh_interval(schedule.get("interval"), changes, now, cfg)
+    refresh_changes = redis.Redis(host="redis").hgetall("refresh_changes")
+    schedule.update(
+        {
+            "interval": interval,
+            "last_run": now.isoformat(),
+            "next_run": (now + datetime.timedelta(seconds=interval)).isoformat(),
+            "changes": {
+                stage.decode("utf-8"): int(count)
+                for stage, count in refresh_changes.items()
+            },
+        }
+    )
+    libtelco5g.redis_set("refresh_schedule", json.dumps(schedule))
+
+
+@mgr.task
+def refresh_tick():
+    """Celery task starting the refresh pipeline when it is due
+
+    Runs every minute. The pipeline runs when the 'next_run' time of the
+    'refresh_schedule' key has passed, or when there is no schedule yet.
+
+    Returns:
+        str or None: ID of the started pipeline, None if it isn't due yet
+    """
+    schedule = libtelco5g.redis_get("refresh_schedule")
+    now = datetime.datetime.now(datetime.timezone.utc)
+    if schedule and datetime.datetime.fromisoformat(schedule["next_run"]) > now:
+        return None
+    # Postpone the next check by the current interval, so that a slow
+    # pipeline isn't started again before its cases stage reschedules it
+    interval = schedule.get("interval") or int(set_cfg()["refresh_min_interval"])
+    schedule["interval"] = interval
+    schedule["next_run"] = (now + datetime.timedelta(seconds=interval)).isoformat()
+    libtelco5g.redis_set("refresh_schedule", json.dumps(schedule))
+    return refresh_pipeline()
+
+
+@mgr.task
+def refresh_pipeline():
+    """Celery task starting the dependency-aware cache refresh pipeline
+
+    Runs the stages in dependency order, starting each stage as soon as its
+    inputs are refreshed:
+
+        cases -> details -> bugs ---\
+              -> issues -------------> cards
+              -> escalations -------/
+
+    Details, issues and escalations only need the cases, so they run in
+    parallel. Bugs need the case_bz mapping from details, and cards need
+    everything else. Stages whose inputs didn't change are skipped, see
+    refresh_stage().
+
+    Returns:
+        str: ID of the pipeline's final task
+    """
+    logging.warning("job: refresh pipeline")
+    pipeline = chain(
+        refresh_stage.si(None, "cases"),
+        chord(
+            group(
+                chain(refresh_stage.s("details"), refresh_stage.s("bugs")),
+                refresh_stage.s("issues"),
+                refresh_stage.s("escalations"),
+            ),
+            refresh_stage.s("cards"),
+        ),
+    )
+    return pipeline.apply_async().id
@@ -0,0 +1,319 @@
+"""tracing.py: lightweight span tracing for t5gweb"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+# span currently running in this thread/context
+_current_span = contextvars.ContextVar("t5gweb_current_span", default=None)
+
+
+class SpanContext:
+    """Identifiers of a span running in another process
+
+    Args:
+        trace_id: 32 hex digit trace id
+        span_id: 16 hex digit span id
+    """
+
+    def __init__(self, trace_id, span_id):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+class Span:
+    """A timed operation, modelled after OpenTelemetry spans
+
+    Spans started while another span runs in the same process are its
+    children. The first span of a trace in a process (the local root) buffers
+    its descendants and exports them all when it ends, so a trace is written
+    with a single call to the exporter.
+
+    Args:
+        name: Name of the operation
+        parent: Parent Span, SpanContext of a remote parent, or None
+        attributes: Dictionary of attributes describing the operation
+    """
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.parent = parent if isinstance(parent, Span) else None
+        self.root = self.parent.root if self.parent else self
+        self.attributes = dict(attributes or {})
+        self.status = "OK"
+        self.start = time.time_ns()
+        self.end = None
+        self.spans = []
+
+    @property
+    def traceparent(self):
+        """W3C traceparent header propagating this span to another process"""
+        return "00-{}-{}-01".format(self.trace_id, self.span_id)
+
+    def to_dict(self):
+        """Serialize the span, see export()"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start,
+            "endTimeUnixNano": self.end,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class FileExporter:
+    """Append finished spans to a file, one JSON document per line
+
+    Args:
+        path: Path of the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(
+            json.dumps(span.to_dict(), default=str) + "\n" for span in spans
+        )
+        with self._lock, open(self.path, "a", encoding="utf-8") as trace_file:
+            trace_file.write(lines)
+
+
+class OTLPExporter:
+    """Send finished spans to an OpenTelemetry collector (OTLP/HTTP JSON)
+
+    Args:
+        endpoint: Traces endpoint of the collector, e.g.
+            http://otel-collector:4318/v1/traces
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    @staticmethod
+    def _attributes(attributes):
+        values = []
+        for key, value in attributes.items():
+            if isinstance(value, bool):
+                values.append({"key": key, "value": {"boolValue": value}})
+            elif isinstance(value, int):
+                values.append({"key": key, "value": {"intValue": str(value)}})
+            elif isinstance(value, float):
+                values.append({"key": key, "value": {"doubleValue": value}})
+            else:
+                values.append({"key": key, "value": {"stringValue": str(value)}})
+        return values
+
+    def export(self, spans):
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,  # internal
+                "startTimeUnixNano": str(span.start),
+                "endTimeUnixNano": str(span.end),
+                "attributes": self._attributes(span.attributes),
+                "status": {"code": 2 if span.status == "ERROR" else 1},
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            otlp_spans.append(otlp_span)
+        resource = {"service.name": "t5gweb", "process.pid": os.getpid()}
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": self._attributes(resource)},
+                    "scopeSpans": [{"scope": {"name": "t5gweb"}, "spans": otlp_spans}],
+                }
+            ]
+        }
+        try:
+            requests.post(self.endpoint, json=payload, timeout=5)
+        except requests.exceptions.RequestException as e:
+            logging.warning("failed to export %s spans: %s", len(spans), e)
+
+
+_exporters = None
+
+
+def get_exporters():
+    """Configure the exporters from the environment, once per process
+
+    Tracing is disabled unless t5g_trace_file (path of a JSON lines file)
+    and/or t5g_trace_endpoint (OTLP/HTTP traces endpoint) are set.
+
+    Returns:
+        list: Configured exporters, empty if tracing is disabled
+    """
+    global _exporters
+    if _exporters is None:
+        _exporters = []
+        if os.environ.get("t5g_trace_file"):
+            _exporters.append(FileExporter(os.environ["t5g_trace_file"]))
+        if os.environ.get("t5g_trace_endpoint"):
+            _exporters.append(OTLPExporter(os.environ["t5g_trace_endpoint"]))
+    return _exporters
+
+
+def parse_traceparent(header):
+    """Parse a W3C traceparent header
+
+    Args:
+        header: Header value, e.g. '00-<trace id>-<span id>-01', or None
+
+    Returns:
+        SpanContext or None: Remote parent, None if the header is missing or
+            invalid
+    """
+    parts = (header or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+
+def current_traceparent():
+    """traceparent header of the current span, or None outside of a trace"""
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+
+def start_span(name, parent=None, **attributes):
+    """Start a span and make it the current span
+
+    Prefer span() unless the span starts and ends in different callbacks,
+    e.g. Flask request hooks or Celery signals.
+
+    Args:
+        name: Name of the operation
+        parent: SpanContext of a remote parent. Defaults to the current span.
+        **attributes: Attributes of the span
+
+    Returns:
+        Span or None: Started span, None if tracing is disabled
+    """
+    if not get_exporters():
+        return None
+    span = Span(name, parent or _current_span.get(), attributes)
+    _current_span.set(span)
+    return span
+
+
+def end_span(span, error=None):
+    """End a span started by start_span() and export its trace when complete
+
+    Args:
+        span: Span returned by start_span(), or None
+        error: Exception that ended the span, if any. Defaults to None.
+    """
+    if span is None:
+        return
+    span.end = time.time_ns()
+    if error is not None:
+        span.status = "ERROR"
+        span.attributes["exception"] = repr(error)
+    if _current_span.get() is span:
+        _current_span.set(span.parent)
+    span.root.spans.append(span)
+    if span.root is span:
+        for exporter in get_exporters():
+            exporter.export(span.spans)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Trace a block of code
+
+    Usage: with span("build_card", card=key): ...
+
+    Args:
+        name: Name of the operation
+        **attributes: Attributes of the span
+
+    Yields:
+        Span or None: Running span, None if tracing is disabled
+    """
+    current = start_span(name, **attributes)
+    try:
+        yield current
+    except Exception as e:
+        end_span(current, e)
+        raise
+    end_span(current)
+
+
+def traced(name=None):
+    """Decorator tracing every call of a function
+
+    Args:
+        name: Name of the spans. Defaults to the function's qualified name.
+    """
+
+    def decorator(func):
+        span_name = name or "{}.{}".format(func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_span(name, duration, **attributes):
+    """Record a child of the current span that already finished
+
+    Used for operations only reported after the fact, like the requests made
+    by the JIRA library, see metrics.response_hook().
+
+    Args:
+        name: Name of the operation
+        duration: Duration of the operation in seconds
+        **attributes: Attributes of the span
+    """
+    finished = start_span(name, **attributes)
+    if finished is not None:
+        finished.start = time.time_ns() - int(duration * 1e9)
+        end_span(finished)
+
+
+def init_app(app):
+    """Trace every request of a Flask app
+
+    A traceparent header sent by the client is used as the parent of the
+    request's span, and Celery tasks started by the request are traced as its
+    children, see taskmgr.inject_trace_context().
+
+    Args:
+        app: Flask application
+    """
+    from flask import g, request
+
+    @app.before_request
+    def start_request_span():
+        g.trace_span = start_span(
+            "{} {}".format(request.method, request.url_rule or request.path),
+            parent=parse_traceparent(request.headers.get("traceparent")),
+            path=request.full_path,
+        )
+
+    @app.teardown_request
+    def end_request_span(error=None):
+        end_span(g.pop("trace_span", None), error)
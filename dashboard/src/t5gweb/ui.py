@@ -6,6 +6,7 @@
 import json
 import logging
 import os
+from functools import partial
 from urllib.parse import urljoin, urlparse
 
 from flask import (
@@ -22,14 +23,31 @@ from flask_login import LoginManager, UserMixin, login_required, login_user
 from onelogin.saml2.auth import OneLogin_Saml2_Auth
 from onelogin.saml2.utils import OneLogin_Saml2_Utils
 
+from t5gweb.httpcache import conditional
 from t5gweb.libtelco5g import (
-    generate_histogram_stats,
     generate_stats,
+    get_cache_version,
+    histogram_bucket_labels,
+    lookup_histogram_stats,
     plot_stats,
     redis_get,
+    redis_hmget,
     redis_set,
 )
-from t5gweb.t5gweb import get_new_cases, get_new_comments, get_trending_cards, plots
+from t5gweb.profiling import profiled
+from t5gweb.t5gweb import (
+    get_card_view,
+    get_new_cases,
+    new_cases_window,
+    plots,
+    recent_comments_window,
+)
+from t5gweb.tables import (
+    build_table_index,
+    lookup,
+    parse_table_request,
+    query_table,
+)
 from t5gweb.taskmgr import refresh_background
 from t5gweb.utils import make_pie_dict, set_cfg
 
@@ -263,6 +281,7 @@ def login():
 # end of deprecated routes
 @BP.route("/home")
 @login_required
+@conditional("cards", "cases", "timestamp", window=new_cases_window)
 def index():
     """Display dashboard home page with new cases and statistics
 
@@ -369,8 +388,22 @@ def refresh():
     return jsonify({}), 202, {"Location": url_for("ui.refresh_status", task_id=task.id)}
 
 
+@BP.route("/refresh/schedule")
+@login_required
+def refresh_schedule():
+    """Return the schedule of the adaptive cache refresh
+
+    Returns:
+        Response: JSON response with the current 'interval' (seconds), the
+            'last_run' and 'next_run' times and the number of 'changes' per
+            data type seen during the last refresh
+    """
+    return jsonify(redis_get("refresh_schedule"))
+
+
 @BP.route("/updates/")
 @login_required
+@conditional("cards", "timestamp", window=recent_comments_window)
 def report_view():
     """Display cards with comments from the last week
 
@@ -381,11 +414,10 @@ def report_view():
         str: Rendered HTML template showing cards with recent updates
     """
     cfg = set_cfg()
-    cards = redis_get("cards")
     return render_template(
         "ui/updates.html",
         timestamp=redis_get("timestamp"),
-        new_comments=get_new_comments(cards),
+        new_comments=get_card_view("recent"),
         jira_server=cfg["server"],
         page_title="recent updates",
     )
@@ -393,6 +425,7 @@ def report_view():
 
 @BP.route("/updates/all")
 @login_required
+@conditional("cards", "timestamp")
 def report_view_all():
     """Display all cards with all comments
 
@@ -403,11 +436,10 @@ def report_view_all():
         str: Rendered HTML template showing all cards and comments
     """
     cfg = set_cfg()
-    cards = redis_get("cards")
     return render_template(
         "ui/updates.html",
         timestamp=redis_get("timestamp"),
-        new_comments=get_new_comments(cards=cards, new_comments_only=False),
+        new_comments=get_card_view("all"),
         jira_server=cfg["server"],
         page_title="all cards",
     )
@@ -415,6 +447,7 @@ def report_view_all():
 
 @BP.route("/trends/")
 @login_required
+@conditional("cards", "timestamp")
 def trends():
     """Display cards marked with the 'Trends' label
 
@@ -426,11 +459,10 @@ def trends():
         str: Rendered HTML template showing trending cards with SLA settings
     """
     cfg = set_cfg()
-    cards = redis_get("cards")
     return render_template(
         "ui/updates.html",
         timestamp=redis_get("timestamp"),
-        new_comments=get_trending_cards(cards),
+        new_comments=get_card_view("trends"),
         jira_server=cfg["server"],
         page_title="trends",
         sla_settings=cfg["sla_settings"],
@@ -439,22 +471,22 @@ def trends():
 
 @BP.route("/table/trends")
 @login_required
+@conditional("timestamp")
 def table_view_trends():
     """Display cards marked with the 'Trends' label in table format
 
     Retrieves and displays JIRA cards that have been labeled with 'Trends',
-    typically used for tracking trending issues or patterns. Cards are
-    organized by account and status.
+    typically used for tracking trending issues or patterns. Rows are loaded
+    page by page from table_data().
 
     Returns:
         str: Rendered HTML table template showing trending cards with SLA settings
     """
     cfg = set_cfg()
-    cards = redis_get("cards")
     return render_template(
         "ui/table.html",
         timestamp=redis_get("timestamp"),
-        new_comments=get_trending_cards(cards),
+        data_url=url_for("ui.table_data", view="trends"),
         jira_server=cfg["server"],
         page_title="trends",
         sla_settings=cfg["sla_settings"],
@@ -463,21 +495,23 @@ def table_view_trends():
 
 @BP.route("/table/")
 @login_required
+@conditional("timestamp")
 def table_view():
     """Display cards with recent comments in table format sorted by severity
 
     Shows JIRA cards with comments from the last 7 days in a table view,
-    organized by severity level for prioritization.
+    organized by severity level for prioritization. Rows are loaded page by
+    page from table_data().
 
     Returns:
         str: Rendered HTML table template with cards sorted by severity
     """
     cfg = set_cfg()
-    cards = redis_get("cards")
     return render_template(
         "ui/table.html",
         timestamp=redis_get("timestamp"),
-        new_comments=get_new_comments(cards),
+        data_url=url_for("ui.table_data", view="recent"),
+        recent_comments=True,
         jira_server=cfg["server"],
         page_title="severity",
         sla_settings=cfg["sla_settings"],
@@ -486,29 +520,73 @@ def table_view():
 
 @BP.route("/table/all")
 @login_required
+@conditional("timestamp")
 def table_view_all():
     """Display all cards in table format sorted by severity
 
     Shows all JIRA cards (not just those with recent comments) in a table
-    view, organized by severity level for comprehensive overview.
+    view, organized by severity level for comprehensive overview. Rows are
+    loaded page by page from table_data().
 
     Returns:
         str: Rendered HTML table template with all cards sorted by severity
     """
     cfg = set_cfg()
-    cards = redis_get("cards")
     return render_template(
         "ui/table.html",
         timestamp=redis_get("timestamp"),
-        new_comments=get_new_comments(cards=cards, new_comments_only=False),
+        data_url=url_for("ui.table_data", view="all"),
         jira_server=cfg["server"],
         page_title="all-severity",
         sla_settings=cfg["sla_settings"],
     )
 
 
+@BP.route("/table/data/<string:view>")
+@login_required
+@conditional("cards", "table_index", window=recent_comments_window)
+def table_data(view):
+    """Serve one page of a card table for DataTables server-side processing
+
+    Paging, sorting, the global search and the search panes are evaluated
+    against the indexes precomputed by cache.get_table_index(), so only the
+    rows of the requested page are read from the cache and sent to the
+    browser.
+
+    Args:
+        view: Table to serve. Valid values:
+            - 'recent': cards with comments from the last 7 days
+            - 'all': all cards with comments
+            - 'trends': cards marked with the 'Trends' label
+
+    Returns:
+        Response: JSON response in the DataTables server-side format
+    """
+    if view not in ("recent", "all", "trends"):
+        abort(404)
+    try:
+        params = parse_table_request(request.args)
+    except ValueError:
+        return jsonify({"error": "invalid table request"}), 400
+    # the rows are rewritten by every refresh of the index, after the cards
+    index = {}
+    rows_version = get_cache_version("table_rows")
+    if rows_version is not None and rows_version >= (get_cache_version("cards") or 0):
+        index = redis_get("table_index")
+    if index == {}:
+        # the index is missing or older than the cards
+        index, rows, search = build_table_index(redis_get("cards"))
+        get_rows = lookup(rows)
+        get_search = lookup(search)
+    else:
+        get_rows = partial(redis_hmget, "table_rows")
+        get_search = partial(redis_hmget, "table_search")
+    return jsonify(query_table(index, view, params, get_rows, get_search))
+
+
 @BP.route("/weekly/")
 @login_required
+@conditional("cards", "timestamp", window=recent_comments_window)
 def weekly_updates():
     """Display weekly updates in plain format for easy copying
 
@@ -520,11 +598,10 @@ def weekly_updates():
         str: Rendered HTML template with plain-formatted weekly updates
     """
     cfg = set_cfg()
-    cards = redis_get("cards")
     return render_template(
         "ui/weekly_report.html",
         timestamp=redis_get("timestamp"),
-        new_comments=get_new_comments(cards),
+        new_comments=get_card_view("recent"),
         jira_server=cfg["server"],
         page_title="weekly-update",
         sla_settings=cfg["sla_settings"],
@@ -533,6 +610,16 @@ def weekly_updates():
 
 @BP.route("/stats")
 @login_required
+@conditional(
+    "cards",
+    "cases",
+    "bugs",
+    "issues",
+    "stats",
+    "histograms",
+    "timestamp",
+    window=new_cases_window,
+)
 def get_stats():
     """Display comprehensive statistics and metrics dashboard
 
@@ -546,7 +633,7 @@ def get_stats():
     """
     stats = generate_stats()
     x_values, y_values = plot_stats()
-    histogram_stats = generate_histogram_stats()
+    histogram_stats = lookup_histogram_stats()
     return render_template(
         "ui/stats.html",
         timestamp=redis_get("timestamp"),
@@ -554,12 +641,25 @@ def get_stats():
         x_values=x_values,
         y_values=y_values,
         histogram_stats=histogram_stats,
+        histogram_labels=histogram_bucket_labels(),
         page_title="stats",
     )
 
 
 @BP.route("/account/<string:account>")
 @login_required
+@conditional(
+    "cards",
+    "cases",
+    "bugs",
+    "issues",
+    "stats",
+    "histograms",
+    "timestamp",
+    window=new_cases_window,
+)
+# below @conditional: 304 responses don't run the view and aren't profiled
+@profiled("get_account")
 def get_account(account):
     """Display detailed view for a specific account
 
@@ -574,10 +674,9 @@ def get_account(account):
     """
     cfg = set_cfg()
     stats = generate_stats(account)
-    cards = redis_get("cards")
-    comments = get_new_comments(cards=cards, new_comments_only=False, account=account)
+    comments = get_card_view("all", account=account)
     pie_stats = make_pie_dict(stats)
-    histogram_stats = generate_histogram_stats(account)
+    histogram_stats = lookup_histogram_stats(account)
     return render_template(
         "ui/account.html",
         page_title=account,
@@ -588,12 +687,25 @@ def get_account(account):
         jira_server=cfg["server"],
         pie_stats=pie_stats,
         histogram_stats=histogram_stats,
+        histogram_labels=histogram_bucket_labels(),
         sla_settings=cfg["sla_settings"],
     )
 
 
 @BP.route("/engineer/<string:engineer>")
 @login_required
+@conditional(
+    "cards",
+    "cases",
+    "bugs",
+    "issues",
+    "stats",
+    "histograms",
+    "timestamp",
+    window=new_cases_window,
+)
+# below @conditional: 304 responses don't run the view and aren't profiled
+@profiled("get_engineer")
 def get_engineer(engineer):
     """Display detailed view for a specific engineer
 
@@ -608,11 +720,10 @@ def get_engineer(engineer):
         str: Rendered HTML template with engineer-specific data and statistics
     """
     cfg = set_cfg()
-    cards = redis_get("cards")
     stats = generate_stats(engineer=engineer)
-    comments = get_new_comments(cards=cards, new_comments_only=False, engineer=engineer)
+    comments = get_card_view("all", engineer=engineer)
     pie_stats = make_pie_dict(stats)
-    histogram_stats = generate_histogram_stats(engineer=engineer)
+    histogram_stats = lookup_histogram_stats(engineer=engineer)
     return render_template(
         "ui/account.html",
         page_title=engineer,
@@ -623,6 +734,7 @@ def get_engineer(engineer):
         jira_server=cfg["server"],
         pie_stats=pie_stats,
         histogram_stats=histogram_stats,
+        histogram_labels=histogram_bucket_labels(),
         engineer_view=True,
         sla_settings=cfg["sla_settings"],
     )
@@ -1,17 +1,46 @@
 """utils.py: utility functions for the t5gweb"""
 
 import datetime
+import functools
 import json
 import logging
 import os
 import re
 import smtplib
 from email.message import EmailMessage
+from types import MappingProxyType
 
 import requests
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
+from t5gweb.metrics import external_call
+
+# configuration built by set_cfg()
+_cfg = None
+
+# dates and timestamps fromisoformat() parses like format_date() and
+# parse_timestamp() expect, anything else goes through strptime()
+date_regex = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ")
+timestamp_regex = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}[+-]\d{4}")
+
+# number of dates and of timestamps format_date() and parse_timestamp() keep
+# parsed. Past it, a scan over every comment evicts them in the order it
+# reads them and no lookup hits, so it should exceed the number of comments
+# cached (about 6 per case): the default covers about 20k cases.
+date_cache_size = int(os.environ.get("t5g_date_cache_size", 2**17))
+
+# links formatted by format_comment(): plain URLs, and JIRA's [text|url]
+url_regex = re.compile(
+    r"(?<!\||\s)\s*?((http|ftp|https):\/\/([\w_-]+(?:(?:\.[\w_-]+)+))"
+    r"([\w.,@?^=%&:\/~+#-]*[\w@?^=%&\/~+#-])?)"
+)
+jira_link_regex = re.compile(
+    r'\[([\s\w!"#$%&\'()*+,-.\/:;<=>?@[^_`{|}~]*?\s*?)\|\s*?'
+    r"((http|ftp|https):\/\/([\w_-]+(?:(?:\.[\w_-]+)+))"
+    r"([\w.,@?^=%&:\/~+#-]*[\w@?^=%&\/~+#-])?[\s]*)\]"
+)
+
 
 def email_notify(ini, message_content, recipient=None, subject=None):
     """Send email notification about new cases or updates
@@ -43,9 +72,10 @@ def email_notify(ini, message_content, recipient=None, subject=None):
     msg["Subject"] = ini[subject] if subject else ini["subject"]
     msg["From"] = ini["from"]
     msg["To"] = ini[recipient] if recipient else ini["to"]
-    sendmail = smtplib.SMTP(ini["smtp"])
-    sendmail.send_message(msg)
-    sendmail.quit()
+    with external_call("smtp", "send"):
+        sendmail = smtplib.SMTP(ini["smtp"])
+        sendmail.send_message(msg)
+        sendmail.quit()
 
 
 def exists_or_zero(data, key):
@@ -67,7 +97,7 @@ def exists_or_zero(data, key):
     return 0
 
 
-def get_token(offline_token):
+def get_token(offline_token, sso_url="https://sso.redhat.com"):
     """Exchange offline token for Red Hat Portal access token
 
     Uses the Red Hat SSO service to exchange a refresh token (offline token)
@@ -76,6 +106,8 @@ def get_token(offline_token):
 
     Args:
         offline_token: Red Hat offline/refresh token for authentication
+        sso_url: Base URL of the SSO service. Defaults to
+            https://sso.redhat.com.
 
     Returns:
         str: Bearer access token for Red Hat Portal API requests
@@ -86,11 +118,9 @@ def get_token(offline_token):
         "client_id": "rhsm-api",
         "refresh_token": offline_token,
     }
-    url = (
-        "https://sso.redhat.com"
-        "/auth/realms/redhat-external/protocol/openid-connect/token"
-    )
-    response = requests.post(url, data=data, timeout=5)
+    url = sso_url + "/auth/realms/redhat-external/protocol/openid-connect/token"
+    with external_call("sso", "token"):
+        response = requests.post(url, data=data, timeout=5)
     # It returns 'application/x-www-form-urlencoded'
     token = response.json()["access_token"]
     return token
@@ -147,6 +177,47 @@ def read_env_config(keys):
 
 
 def set_cfg():
+    """Get the configuration built from the defaults and environment variables
+
+    The configuration is built once per process, on the first call, so
+    requests and tasks don't rebuild it. Code changing os.environ, like the
+    tests, must call reload_cfg() afterwards. Gunicorn and Celery workers
+    see a changed environment once restarted, e.g. by a SIGHUP to their
+    master process.
+
+    Returns:
+        MappingProxyType: Read-only configuration, see build_cfg(). Nested
+            dictionaries are read-only too and lists are tuples, since they
+            are shared by every caller: copy the configuration with dict()
+            to change a setting.
+    """
+    cfg = _cfg
+    if cfg is None:
+        cfg = reload_cfg()
+    return cfg
+
+
+def reload_cfg():
+    """Rebuild the configuration returned by set_cfg() from the environment
+
+    Returns:
+        MappingProxyType: The new configuration
+    """
+    global _cfg
+    _cfg = _freeze(build_cfg())
+    return _cfg
+
+
+def _freeze(value):
+    """Make a configuration value read-only, see set_cfg()"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(v) for key, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def build_cfg():
     """Generate complete configuration from defaults and environment variables
 
     Creates the working configuration by combining default values with
@@ -280,13 +351,59 @@ def set_defaults():
     defaults["low_severity_slack_channel"] = ""
     defaults["max_jira_results"] = False
     defaults["max_portal_results"] = 5000
+    # API endpoints not set by their own variables, see t5gweb.mockservices
+    defaults["sso_url"] = "https://sso.redhat.com"
+    defaults["bz_url"] = "bugzilla.redhat.com"
     defaults["sla_settings"] = {
         "days": {"Urgent": 14, "High": 20, "Normal": 90, "Low": 180},
         "partners": [],
     }
+    # adaptive refresh schedule, intervals in seconds, hours in UTC
+    defaults["refresh_min_interval"] = 300
+    defaults["refresh_max_interval"] = 3600
+    defaults["refresh_business_interval"] = 900
+    defaults["refresh_business_hours"] = "8-18"
+    defaults["refresh_busy_changes"] = 10
+    # port of the Prometheus metrics server of each Celery worker, 0 disables it
+    defaults["worker_metrics_port"] = 9808
     return defaults
 
 
+def next_refresh_interval(interval, changes, now, cfg):
+    """Adapt the refresh interval to the observed change rate
+
+    Polls at the minimum interval when many records changed, twice as often
+    when some changed and backs off by 50% when nothing changed. During
+    business hours (Monday to Friday) the interval is capped at
+    refresh_business_interval. The result is always kept within
+    refresh_min_interval and refresh_max_interval.
+
+    Args:
+        interval: Previous interval in seconds, or None for the first run
+        changes: Number of records that changed during the last refresh
+        now: Current datetime (UTC)
+        cfg: generated by set_cfg()
+
+    Returns:
+        int: Seconds until the next refresh
+    """
+    min_interval = int(cfg["refresh_min_interval"])
+    max_interval = int(cfg["refresh_max_interval"])
+    if interval is None:
+        interval = min_interval
+    if changes >= int(cfg["refresh_busy_changes"]):
+        interval = min_interval
+    elif changes > 0:
+        interval = interval / 2
+    else:
+        interval = interval * 1.5
+
+    start, end = (int(hour) for hour in cfg["refresh_business_hours"].split("-"))
+    if now.weekday() < 5 and start <= now.hour < end:
+        interval = min(interval, int(cfg["refresh_business_interval"]))
+    return int(min(max(interval, min_interval), max_interval))
+
+
 def slack_notify(ini, notification_content):
     """Send Slack notifications for new cases
 
@@ -337,10 +454,12 @@ def slack_notify(ini, notification_content):
         else:
             channel = ini["low_severity_slack_channel"]
         try:
-            message = client.chat_postMessage(channel=channel, text=body)
-            client.chat_postMessage(
-                channel=channel, text=description, thread_ts=message["ts"]
-            )
+            with external_call("slack", "post"):
+                message = client.chat_postMessage(channel=channel, text=body)
+            with external_call("slack", "post"):
+                client.chat_postMessage(
+                    channel=channel, text=description, thread_ts=message["ts"]
+                )
         except SlackApiError as slack_error:
             logging.warning("failed to post to slack: %s", slack_error)
 
@@ -400,19 +519,43 @@ def make_headers(token):
     return headers
 
 
+@functools.lru_cache(maxsize=date_cache_size)
 def format_date(the_date):
     """Converts a date string in to the required format
 
+    Dates are parsed once per process: the same case dates are read by
+    every request. At most date_cache_size dates are kept
+    (t5g_date_cache_size).
+
     Args:
         date(str): A date stored as a string
 
     Returns:
         datetime.date: A datetime object
     """
+    if date_regex.fullmatch(the_date):
+        return datetime.datetime.fromisoformat(the_date[:-1])
     formatted_date = datetime.datetime.strptime(the_date, "%Y-%m-%dT%H:%M:%SZ")
     return formatted_date
 
 
+@functools.lru_cache(maxsize=date_cache_size)
+def parse_timestamp(timestamp):
+    """Parse a JIRA timestamp, e.g. the update time of a comment
+
+    Like format_date(), timestamps are parsed once per process.
+
+    Args:
+        timestamp: Timestamp formatted as '%Y-%m-%dT%H:%M:%S.%f%z'
+
+    Returns:
+        datetime.datetime: Timezone-aware datetime
+    """
+    if timestamp_regex.fullmatch(timestamp):
+        return datetime.datetime.fromisoformat(timestamp)
+    return datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%f%z")
+
+
 def format_comment(comment):
     """Format a JIRA comment for HTML display with clickable links
 
@@ -427,22 +570,27 @@ def format_comment(comment):
     Returns:
         str: HTML-formatted comment body with clickable links
     """
-    body = comment.body
-    body = re.sub(
-        (
-            r"(?<!\||\s)\s*?((http|ftp|https):\/\/([\w_-]+(?:(?:\.[\w_-]+)+))"
-            r"([\w.,@?^=%&:\/~+#-]*[\w@?^=%&\/~+#-])?)"
-        ),
+    body = url_regex.sub(
         '<a href="' + r"\g<0>" + "\" target='_blank'>" + r"\g<0>" "</a>",
-        body,
+        comment.body,
     )
-    body = re.sub(
-        (
-            r'\[([\s\w!"#$%&\'()*+,-.\/:;<=>?@[^_`{|}~]*?\s*?)\|\s*?'
-            r"((http|ftp|https):\/\/([\w_-]+(?:(?:\.[\w_-]+)+))"
-            r"([\w.,@?^=%&:\/~+#-]*[\w@?^=%&\/~+#-])?[\s]*)\]"
-        ),
+    body = jira_link_regex.sub(
         '<a href="' + r"\2" + "\" target='_blank'>" + r"\1" + "</a>",
         body,
     )
     return body
+
+
+def comment_key(comment):
+    """Key of the formatted body of a JIRA comment
+
+    Changes when the comment is edited, so formatted bodies can be kept
+    under it, see cache.get_cards().
+
+    Args:
+        comment: JIRA comment object with id and updated attributes
+
+    Returns:
+        str: '<comment id>:<update time>'
+    """
+    return "{}:{}".format(comment.id, comment.updated)
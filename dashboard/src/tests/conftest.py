@@ -9,9 +9,21 @@ from unittest.mock import patch
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import scoped_session, sessionmaker
+from t5gweb import utils
 from t5gweb.database import Base
 
 
+@pytest.fixture(autouse=True)
+def reload_cfg():
+    """Rebuild the configuration after each test
+
+    set_cfg() builds it once per process, so the environment a test sets
+    must not stay in it for the next tests.
+    """
+    yield
+    utils.reload_cfg()
+
+
 @pytest.fixture(scope="session")
 def fake_data():
     """Load fake data from JSON file once per test session"""
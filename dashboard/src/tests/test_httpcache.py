@@ -0,0 +1,169 @@
+import pytest
+from flask import Flask, abort
+
+from t5gweb import httpcache
+
+
+@pytest.fixture
+def versions(mocker):
+    """Cache versions returned for the keys of the views, by key"""
+    versions = {"cards": 1700000000.5, "cases": 1700000100.0}
+
+    def get_cache_version(*keys):
+        if any(key not in versions for key in keys):
+            return None
+        return max(versions[key] for key in keys)
+
+    mocker.patch("t5gweb.httpcache.get_cache_version", side_effect=get_cache_version)
+    return versions
+
+
+@pytest.fixture
+def window():
+    return {"value": "2024-06-15", "args": []}
+
+
+@pytest.fixture
+def client(window):
+    app = Flask(__name__)
+    calls = []
+
+    @app.route("/cards")
+    @httpcache.conditional("cards", "cases")
+    def cards():
+        calls.append("cards")
+        return "cards"
+
+    @app.route("/recent")
+    @httpcache.conditional("cards", window=lambda: window["value"])
+    def recent():
+        calls.append("recent")
+        return "recent"
+
+    def account_window(account):
+        window["args"].append(account)
+        return window["value"]
+
+    @app.route("/account/<string:account>")
+    @httpcache.conditional("cards", window=account_window)
+    def account(account):
+        return account
+
+    @app.route("/missing/<string:key>")
+    @httpcache.conditional("cards")
+    def missing(key):
+        abort(404)
+
+    @app.route("/uncached")
+    @httpcache.conditional("unknown")
+    def uncached():
+        calls.append("uncached")
+        return "uncached"
+
+    client = app.test_client()
+    client.calls = calls
+    return client
+
+
+def test_validators(client, versions):
+    response = client.get("/cards")
+
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('W/"')
+    # the newest version of the keys, truncated to the second
+    assert response.last_modified.timestamp() == 1700000100
+    assert "no-cache" in response.headers["Cache-Control"]
+    assert "private" in response.headers["Cache-Control"]
+
+
+def test_if_none_match(client, versions):
+    etag = client.get("/cards").headers["ETag"]
+
+    response = client.get("/cards", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert client.calls == ["cards"]
+
+    # a refresh of any key changes the ETag
+    versions["cards"] = 1700000200.0
+    response = client.get("/cards", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_etag_depends_on_query_string(client, versions):
+    etag = client.get("/cards").headers["ETag"]
+
+    assert client.get("/cards?account=a").headers["ETag"] != etag
+    response = client.get("/cards?account=a", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_if_modified_since(client, versions):
+    response = client.get(
+        "/cards", headers={"If-Modified-Since": "Tue, 14 Nov 2023 22:15:00 GMT"}
+    )
+    assert response.status_code == 304
+
+    response = client.get(
+        "/cards", headers={"If-Modified-Since": "Tue, 14 Nov 2023 22:14:59 GMT"}
+    )
+    assert response.status_code == 200
+
+
+def test_if_none_match_takes_precedence(client, versions):
+    response = client.get(
+        "/cards",
+        headers={
+            "If-None-Match": 'W/"other"',
+            "If-Modified-Since": "Tue, 14 Nov 2023 22:15:00 GMT",
+        },
+    )
+    assert response.status_code == 200
+
+
+def test_window(client, versions, window):
+    response = client.get("/recent")
+    etag = response.headers["ETag"]
+    # the time the window last moved isn't known
+    assert response.last_modified is None
+    assert client.get("/recent", headers={"If-None-Match": etag}).status_code == 304
+    response = client.get(
+        "/recent", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+    )
+    assert response.status_code == 200
+
+    # the cache didn't change, but the window moved
+    window["value"] = "2024-06-16"
+    response = client.get("/recent", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_window_gets_view_arguments(client, versions, window):
+    assert client.get("/account/a").status_code == 200
+    assert window["args"] == ["a"]
+
+
+def test_window_none(client, versions, window):
+    window["value"] = None
+
+    response = client.get("/recent")
+    assert response.last_modified is not None
+
+
+def test_error_responses_have_no_validators(client, versions):
+    response = client.get("/missing/CARD-1")
+
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
+
+
+def test_without_version(client, versions):
+    response = client.get("/uncached", headers={"If-None-Match": "*"})
+
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert response.last_modified is None
+    assert client.calls == ["uncached"]
@@ -1,13 +1,27 @@
+import hashlib
+import json
+
 import pytest
+from prometheus_client import REGISTRY
 
 from t5gweb.libtelco5g import (
     _assign_cases_batch,
+    count_record_changes,
+    generate_all_histogram_stats,
+    generate_histogram_stats,
+    get_cache_version,
     get_case_number,
+    get_duration_percentiles,
+    histogram_bucket_edges,
+    histogram_bucket_labels,
     is_bug_missing_target,
     jira_connection,
     redis_get,
     redis_set,
+    sync_portal_to_jira,
+    update_duration_sketches,
 )
+from t5gweb.utils import reload_cfg
 
 
 def test_get_jira_connection(mocker):
@@ -24,6 +38,8 @@ def test_get_jira_connection(mocker):
         server=cfg["server"], basic_auth=(cfg["username"], cfg["password"])
     )
     assert result == mock_jira.return_value
+    hooks = mock_jira.return_value._session.hooks["response"]
+    hooks.append.assert_called_once()
 
 
 @pytest.fixture
@@ -34,10 +50,33 @@ def mock_redis(mocker):
 def test_redis_set(mock_redis):
     key = "test_key"
     value = "test_value"
-    redis_set(key, value)
+    mock_redis.return_value.hget.return_value = None
+    assert redis_set(key, value) is True
 
     mock_redis.assert_called_once_with(host="redis")
     mock_redis.return_value.mset.assert_called_once_with({key: value})
+    hashes = [c.args[:2] for c in mock_redis.return_value.hset.call_args_list]
+    assert hashes == [("cache_versions", key), ("cache_digests", key)]
+
+
+def test_redis_set_value_size(mock_redis):
+    mock_redis.return_value.hget.return_value = None
+    labels = {"key": "size_key"}
+    before = REGISTRY.get_sample_value("t5gweb_redis_value_bytes_sum", labels) or 0
+
+    redis_set("size_key", '{"summary": "é"}')
+
+    after = REGISTRY.get_sample_value("t5gweb_redis_value_bytes_sum", labels)
+    assert after - before == 17  # 'é' is 2 bytes in UTF-8
+
+
+def test_redis_set_unchanged(mock_redis):
+    digest = hashlib.sha1(b"same").hexdigest()
+    mock_redis.return_value.hget.return_value = digest.encode()
+
+    assert redis_set("test_key", "same") is False
+    mock_redis.return_value.mset.assert_not_called()
+    mock_redis.return_value.hset.assert_not_called()
 
 
 @pytest.mark.parametrize(
@@ -54,6 +93,36 @@ def test_redis_get(key, value, expected_result, mock_redis):
     assert result == expected_result
 
 
+def test_count_record_changes(mock_redis):
+    records = {"1": {"status": "Closed"}, "2": {"status": "Open"}}
+    digest = hashlib.sha1(json.dumps(records["1"]).encode()).hexdigest()
+    # '1' is unchanged, '2' is new and '3' was removed
+    mock_redis.return_value.hgetall.return_value = {
+        b"1": digest.encode(),
+        b"3": b"outdated",
+    }
+
+    assert count_record_changes("cases", records) == 2
+    pipe = mock_redis.return_value.pipeline.return_value
+    pipe.delete.assert_called_once_with("record_digests:cases")
+    assert set(pipe.hset.call_args.kwargs["mapping"]) == {"1", "2"}
+
+
+@pytest.mark.parametrize(
+    "versions,expected_result",
+    [([b"100.5", b"200.25"], 200.25), ([b"100.5", None], None)],
+)
+def test_get_cache_version(versions, expected_result, mock_redis):
+    mock_redis.return_value.hmget.return_value = versions
+
+    result = get_cache_version("cards", "cases")
+
+    mock_redis.return_value.hmget.assert_called_once_with(
+        "cache_versions", ("cards", "cases")
+    )
+    assert result == expected_result
+
+
 @pytest.mark.parametrize(
     "link, pfilter, expected_case_number",
     [
@@ -195,3 +264,216 @@ def test_displayname_always_set(team, cases):
 
     for assignee in result.values():
         assert assignee["displayName"] == assignee["name"]
+
+
+# --- histogram tests ---
+
+
+def _histogram_card(account, engineer, severity, relief_at=None, resolved_at=None):
+    return {
+        "account": account,
+        "assignee": {"displayName": engineer},
+        "severity": severity,
+        "case_created": "2024-01-01T00:00:00Z",
+        "relief_at": relief_at,
+        "resolved_at": resolved_at,
+    }
+
+
+@pytest.fixture
+def histogram_cards():
+    return {
+        "CARD-1": _histogram_card(
+            "Acme", "Alice", "Urgent", relief_at="2024-01-01T12:00:00Z"
+        ),
+        "CARD-2": _histogram_card(
+            "Acme", "Bob", "Urgent", resolved_at="2024-01-11T00:00:00Z"
+        ),
+        "CARD-3": _histogram_card(
+            "Globex",
+            "Alice",
+            "Low",
+            relief_at="2024-01-03T00:00:00Z",
+            resolved_at="2025-06-01T00:00:00Z",
+        ),
+    }
+
+
+def test_histogram_relief_and_resolved_are_separate(histogram_cards):
+    result = generate_histogram_stats(cards=histogram_cards)
+
+    assert result["Relief"]["Urgent"]["count"] == 1
+    assert result["Relief"]["Urgent"]["mean"] == 0.5
+    assert result["Resolved"]["Urgent"]["count"] == 1
+    assert result["Resolved"]["Urgent"]["mean"] == 10
+    assert result["Resolved"]["High"]["count"] == 0
+    assert result["Resolved"]["High"]["mean"] is None
+
+
+def test_histogram_buckets(histogram_cards):
+    result = generate_histogram_stats(cards=histogram_cards)
+    labels = histogram_bucket_labels()
+
+    assert len(labels) == len(histogram_bucket_edges)
+    assert labels[-1] == "365+"
+    for outcome in result.values():
+        for summary in outcome.values():
+            assert len(summary["buckets"]) == len(histogram_bucket_edges)
+            assert sum(summary["buckets"]) == summary["count"]
+    # 0.5 days -> "0-1", 10 days -> "7-14", 2 days -> "2-3", 517 days -> "365+"
+    assert result["Relief"]["Urgent"]["buckets"][labels.index("0-1")] == 1
+    assert result["Resolved"]["Urgent"]["buckets"][labels.index("7-14")] == 1
+    assert result["Relief"]["Low"]["buckets"][labels.index("2-3")] == 1
+    assert result["Resolved"]["Low"]["buckets"][labels.index("365+")] == 1
+
+
+def test_histogram_percentiles():
+    cards = {
+        f"CARD-{day}": _histogram_card(
+            "Acme", "Alice", "Normal", relief_at=f"2024-01-{day + 1:02d}T00:00:00Z"
+        )
+        for day in range(1, 11)
+    }
+    result = generate_histogram_stats(cards=cards)["Relief"]["Normal"]
+
+    assert result["count"] == 10
+    assert result["mean"] == 5.5
+    assert result["median"] == 5.5
+    assert result["p90"] == pytest.approx(9.1)
+
+
+def test_histogram_filters(histogram_cards):
+    by_account = generate_histogram_stats(account="Globex", cards=histogram_cards)
+    by_engineer = generate_histogram_stats(engineer="Alice", cards=histogram_cards)
+
+    assert by_account["Relief"]["Urgent"]["count"] == 0
+    assert by_account["Relief"]["Low"]["count"] == 1
+    assert by_engineer["Relief"]["Urgent"]["count"] == 1
+    assert by_engineer["Resolved"]["Urgent"]["count"] == 0
+
+
+def test_all_histogram_stats_match_filtered_stats(histogram_cards):
+    result = generate_all_histogram_stats(histogram_cards)
+
+    assert result["all"] == generate_histogram_stats(cards=histogram_cards)
+    for account in ("Acme", "Globex"):
+        assert result["accounts"][account] == generate_histogram_stats(
+            account=account, cards=histogram_cards
+        )
+    for engineer in ("Alice", "Bob"):
+        assert result["engineers"][engineer] == generate_histogram_stats(
+            engineer=engineer, cards=histogram_cards
+        )
+
+
+# --- duration sketch tests ---
+
+
+def test_update_duration_sketches_is_incremental(histogram_cards):
+    duration_sketches = update_duration_sketches({}, histogram_cards)
+    urgent = duration_sketches["sketches"]["Relief"]["2024-01"]["Urgent"]
+
+    assert sorted(duration_sketches["recorded"]["Relief"]) == ["CARD-1", "CARD-3"]
+    assert sorted(duration_sketches["recorded"]["Resolved"]) == ["CARD-2", "CARD-3"]
+    assert urgent["all"]["count"] == 1
+    assert urgent["accounts"]["Acme"]["count"] == 1
+    assert urgent["engineers"]["Alice"]["count"] == 1
+
+    # Refreshing with the same cards must not count them again
+    update_duration_sketches(duration_sketches, histogram_cards)
+    urgent = duration_sketches["sketches"]["Relief"]["2024-01"]["Urgent"]
+    assert urgent["all"]["count"] == 1
+
+    histogram_cards["CARD-4"] = _histogram_card(
+        "Acme", "Alice", "Urgent", relief_at="2024-01-01T06:00:00Z"
+    )
+    update_duration_sketches(duration_sketches, histogram_cards)
+    urgent = duration_sketches["sketches"]["Relief"]["2024-01"]["Urgent"]
+    assert urgent["all"]["count"] == 2
+
+
+def test_update_duration_sketches_rerecords_changed_cards(histogram_cards):
+    duration_sketches = update_duration_sketches({}, histogram_cards)
+
+    # relief moved to another month and another engineer
+    histogram_cards["CARD-1"] = _histogram_card(
+        "Acme", "Bob", "Urgent", relief_at="2024-02-01T00:00:00Z"
+    )
+    update_duration_sketches(duration_sketches, histogram_cards)
+    relief = duration_sketches["sketches"]["Relief"]
+    assert relief["2024-01"]["Urgent"]["all"]["count"] == 0
+    assert relief["2024-01"]["Urgent"]["engineers"]["Alice"]["count"] == 0
+    assert relief["2024-02"]["Urgent"]["engineers"]["Bob"]["sum"] == 31
+
+    # cards no longer cached are forgotten, their durations are kept
+    del histogram_cards["CARD-1"]
+    update_duration_sketches(duration_sketches, histogram_cards)
+    assert "CARD-1" not in duration_sketches["recorded"]["Relief"]
+    assert relief["2024-02"]["Urgent"]["all"]["count"] == 1
+
+
+def test_update_duration_sketches_rebuilds_old_format(histogram_cards):
+    old = {"recorded": {"Relief": ["CARD-1"]}, "sketches": {"Relief": {}}}
+    duration_sketches = update_duration_sketches(old, histogram_cards)
+
+    assert duration_sketches["version"] == 2
+    assert sorted(duration_sketches["recorded"]["Relief"]) == ["CARD-1", "CARD-3"]
+
+
+def test_get_duration_percentiles(mocker, histogram_cards):
+    duration_sketches = update_duration_sketches({}, histogram_cards)
+    mocker.patch("t5gweb.libtelco5g.redis_get", return_value=duration_sketches)
+
+    relief = get_duration_percentiles("Relief")
+    assert relief["All"]["count"] == 2
+    assert relief["Urgent"]["p50"] == pytest.approx(0.5, rel=0.01)
+    assert relief["Low"]["p99"] == pytest.approx(2, rel=0.01)
+    assert relief["High"]["count"] == 0
+    assert relief["High"]["p90"] is None
+
+    # windows are widened to whole months
+    assert get_duration_percentiles("Relief", start="2024-01-02")["All"]["count"] == 2
+    assert get_duration_percentiles("Relief", start="2024-02")["All"]["count"] == 0
+    windowed = get_duration_percentiles("Resolved", start="2025-06-15")
+    assert windowed["All"]["count"] == 1
+    assert windowed["Low"]["count"] == 1
+
+    by_engineer = get_duration_percentiles("Resolved", engineer="Bob")
+    assert by_engineer["All"]["count"] == 1
+    assert by_engineer["Urgent"]["mean"] == 10
+
+    by_account = get_duration_percentiles("Resolved", account="Globex", end="2024")
+    assert by_account["All"]["count"] == 0
+
+    with pytest.raises(ValueError):
+        get_duration_percentiles("Resolved", account="Globex", engineer="Bob")
+
+
+def test_sync_portal_to_jira_creates_cards(mocker, monkeypatch):
+    monkeypatch.setenv("email_subject", "New cards")
+    monkeypatch.setenv("max_to_create", "5")
+    monkeypatch.setenv("slack_token", "token")
+    monkeypatch.setenv("high_severity_slack_channel", "channel")
+    cfg = reload_cfg()
+    cache = {
+        "cases": {"001": {"status": "Waiting on Red Hat"}},
+        "cards": {"CARD-1": {"case_number": "000"}},
+    }
+    mocker.patch("t5gweb.libtelco5g.redis_get", side_effect=cache.get)
+    redis_set = mocker.patch("t5gweb.libtelco5g.redis_set", return_value=True)
+    mocker.patch("t5gweb.libtelco5g.publish_records")
+    new_card = {"case_number": "001"}
+    mocker.patch(
+        "t5gweb.libtelco5g.create_cards",
+        return_value=({"CARD-2": {"body": ""}}, {"CARD-2": new_card}, ["001"]),
+    )
+    email_notify = mocker.patch("t5gweb.libtelco5g.email_notify")
+    slack_notify = mocker.patch("t5gweb.libtelco5g.slack_notify")
+
+    assert sync_portal_to_jira() == {"cards_created": 1}
+
+    assert email_notify.call_args.args[0]["subject"] == "New cards: 001"
+    assert slack_notify.call_args.args[0]["subject"] == "New cards: 001"
+    # the shared configuration is left untouched
+    assert cfg["subject"] == "New cards"
+    assert json.loads(redis_set.call_args.args[1])["CARD-2"] == new_card
@@ -0,0 +1,171 @@
+import json
+import threading
+
+import pytest
+import requests
+
+from t5gweb import cache
+from t5gweb.mockservices import MockServices, make_server
+from t5gweb.utils import set_defaults
+
+
+@pytest.fixture
+def mock_services(fake_data):
+    services = MockServices(fake_data, escalations_project="ESCALATE")
+    server = make_server(services)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield services, "http://127.0.0.1:{}".format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cfg(mock_services):
+    _, url = mock_services
+    return dict(
+        set_defaults(),
+        redhat_api=url,
+        sso_url=url,
+        bz_url=url + "/xmlrpc.cgi",
+        server=url,
+        offline_token="offline",
+        query="case_status:*",
+        bz_key="key",
+        username="user",
+        password="token",
+        project="CARDS",
+        board="board",
+        jira_query="telco",
+        jira_escalations_project="ESCALATE",
+        jira_escalations_label="escalated",
+    )
+
+
+@pytest.fixture
+def redis_cache(mocker):
+    """Cache held in a dictionary instead of Redis"""
+    values = {}
+
+    def redis_set(key, value):
+        values[key] = value
+        return True
+
+    def redis_get(key):
+        return json.loads(values[key]) if key in values else {}
+
+    def redis_hset(key, mapping):
+        values[key] = dict(mapping)
+
+    def redis_hmget(key, fields):
+        fields_set = values.get(key, {})
+        return {f: json.loads(fields_set[f]) for f in fields if f in fields_set}
+
+    mocker.patch("t5gweb.libtelco5g.redis_set", side_effect=redis_set)
+    mocker.patch("t5gweb.libtelco5g.redis_get", side_effect=redis_get)
+    mocker.patch("t5gweb.libtelco5g.redis_hset", side_effect=redis_hset)
+    mocker.patch("t5gweb.libtelco5g.redis_hmget", side_effect=redis_hmget)
+    for index in ("query_index", "histogram_stats", "duration_sketches", "table_index"):
+        mocker.patch("t5gweb.cache.get_{}".format(index))
+    return redis_get
+
+
+def test_ingest(cfg, redis_cache, fake_data):
+    cache.get_cases(cfg)
+    cache.get_case_details(cfg)
+    cache.get_bz_details(cfg)
+    cache.get_issue_details(cfg)
+
+    cases = redis_cache("cases")
+    assert cases.keys() == fake_data["cases"].keys()
+    for case_number, case in cases.items():
+        expected = fake_data["cases"][case_number]
+        assert case["product"] == expected["product"]
+        assert case["status"] == expected["status"]
+    open_cases = {c for c, d in cases.items() if d["status"] != "Closed"}
+    assert redis_cache("details").keys() == open_cases
+    for case_number, bugs in redis_cache("bugs").items():
+        expected = fake_data["bugs"].get(case_number, [])
+        expected = {b["bugzillaNumber"]: b for b in expected}
+        for bug in bugs:
+            assert bug["assignee"] == expected[bug["bugzillaNumber"]]["assignee"]
+    issues = redis_cache("issues")
+    assert issues.keys() == open_cases & fake_data["issues"].keys()
+
+
+def test_cards(cfg, redis_cache, fake_data):
+    cache.get_cases(cfg)
+    escalations = cache.get_escalations(cfg, redis_cache("cases"))
+    assert sorted(escalations) == sorted(
+        c["case_number"] for c in fake_data["cards"].values() if c["escalated"]
+    )
+    cache.get_cards(cfg)
+
+    cards = redis_cache("cards")
+    assert cards
+    for key, card in cards.items():
+        expected = fake_data["cards"][key]
+        assert card["case_number"] == expected["case_number"]
+        assert card["card_status"] == expected["card_status"]
+        assert len(card["comments"]) == len(expected["comments"])
+
+
+def test_formatted_comments_are_reused(mock_services, cfg, redis_cache, mocker):
+    services, _ = mock_services
+    cache.get_cases(cfg)
+    cache.get_cards(cfg)
+    cards = redis_cache("cards")
+    format_comment = mocker.spy(cache, "format_comment")
+
+    cache.get_cards(cfg)
+    assert format_comment.call_count == 0
+    assert redis_cache("cards") == cards
+
+    # an edited comment is formatted again
+    issue = next(i for i in services.jira_cards if i["fields"]["comment"]["comments"])
+    comment = issue["fields"]["comment"]["comments"][0]
+    comment["body"] += " https://example.com"
+    comment["updated"] = "2030-01-01T00:00:00.000+0000"
+    cache.get_cards(cfg)
+    assert format_comment.call_count == 1
+    body, updated = redis_cache("cards")[issue["key"]]["comments"][0]
+    assert body.endswith("https://example.com</a>")
+    assert updated == comment["updated"]
+
+
+def test_expired_token_reauthenticates(mock_services, cfg, redis_cache, mocker):
+    services, _ = mock_services
+    cache.get_cases(cfg)
+
+    # let the token expire after the first case
+    token_valid = services.token_valid
+    checks = []
+
+    def expire_second(authorization):
+        checks.append(authorization)
+        return token_valid(authorization) and len(checks) != 2
+
+    mocker.patch.object(services, "token_valid", side_effect=expire_second)
+    cache.get_case_details(cfg)
+
+    stats = services.stats()
+    assert stats["sso token 200"] == 3
+    assert stats["portal case 401"] == 1
+    assert len(redis_cache("details")) == stats["portal case 200"]
+
+
+def test_faults_are_repeatable(fake_data):
+    first = MockServices(fake_data, error_rate=0.2, unauthorized_rate=0.1, seed=1)
+    second = MockServices(fake_data, error_rate=0.2, unauthorized_rate=0.1, seed=1)
+    outcomes = [first.fault("portal case", True)[1] for _ in range(200)]
+
+    assert outcomes == [second.fault("portal case", True)[1] for _ in range(200)]
+    assert 10 < outcomes.count(401) < 30
+    assert 25 < outcomes.count(503) < 55
+    assert {first.fault("sso token", False)[1] for _ in range(200)} == {None, 503}
+
+
+def test_unknown_routes(mock_services):
+    _, url = mock_services
+    assert requests.get(url + "/rest/api/2/issue/NOPE-1").status_code == 404
+    assert requests.get(url + "/unknown").status_code == 404
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from t5gweb import profiling
+
+
+@pytest.fixture
+def mock_store(mocker):
+    return mocker.patch("t5gweb.profiling.store_profile", return_value="profile-id")
+
+
+def slow_sum():
+    time.sleep(0.05)
+    return sum(range(1000))
+
+
+def test_profiled_disabled(mock_store, monkeypatch):
+    monkeypatch.delenv("t5g_profile", raising=False)
+    assert profiling.profiled("get_cards")(slow_sum)() == 499500
+    mock_store.assert_not_called()
+
+
+@pytest.mark.parametrize("targets", ["get_cards", "generate_stats, get_cards", "all"])
+def test_profiled_targets(targets, mock_store, monkeypatch):
+    monkeypatch.setenv("t5g_profile", targets)
+    assert profiling.profiled("get_cards")(slow_sum)() == 499500
+
+    mock_store.assert_called_once()
+    name, profiler, sampler, _, duration = mock_store.call_args.args
+    assert name == "get_cards"
+    assert duration >= 0.05
+    profiler.create_stats()
+    assert any("slow_sum" in str(function) for function in profiler.stats)
+    assert sampler.stacks
+    assert all("slow_sum" in stack for stack in sampler.stacks)
+
+
+def test_profiled_nested(mock_store, monkeypatch):
+    monkeypatch.setenv("t5g_profile", "all")
+    inner = profiling.profiled("inner")(slow_sum)
+    outer = profiling.profiled("outer")(lambda: inner() + 1)
+
+    assert outer() == 499501
+    assert [c.args[0] for c in mock_store.call_args_list] == ["outer"]
+
+
+def test_collapsed_stacks():
+    sampler = profiling.StackSampler(thread_id=0)
+    sampler.stacks.update({"main;work": 3, "main": 1})
+    assert sampler.collapsed() == "main;work 3\nmain 1\n"
+
+
+@pytest.mark.parametrize(
+    "expected,token,valid",
+    [("secret", "secret", True), ("secret", "wrong", False), (None, "", False)],
+)
+def test_is_authorized(expected, token, valid, monkeypatch):
+    if expected:
+        monkeypatch.setenv("t5g_profile_token", expected)
+    else:
+        monkeypatch.delenv("t5g_profile_token", raising=False)
+    assert profiling.is_authorized(token) is valid
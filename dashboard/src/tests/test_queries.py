@@ -0,0 +1,135 @@
+import csv
+import json
+
+import pytest
+
+from t5gweb.queries import (
+    build_query_index,
+    decode_cursor,
+    export_csv,
+    export_ndjson,
+    parse_query,
+    project,
+    run_query,
+)
+
+
+class Args(dict):
+    """Minimal stand-in for Flask's request.args"""
+
+    def getlist(self, key):
+        value = self.get(key)
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+
+def _query(data_type, records, **args):
+    # the index is stored as JSON in Redis
+    index = json.loads(json.dumps(build_query_index(data_type, records)))
+    return run_query(index, parse_query(data_type, Args(args)))
+
+
+def test_no_query_parameters():
+    assert parse_query("cards", Args()) is None
+
+
+def test_filters_match_records(fake_data):
+    cases = fake_data["cases"]
+    case = next(iter(cases.values()))
+    keys, count, next_cursor = _query(
+        "cases", cases, status=case["status"].upper(), account=case["account"]
+    )
+
+    expected = sorted(
+        key
+        for key, data in cases.items()
+        if data["status"] == case["status"] and data["account"] == case["account"]
+    )
+    assert keys == expected
+    assert count == len(expected)
+    assert next_cursor is None
+
+
+def test_severity_and_multiple_values(fake_data):
+    cards = fake_data["cards"]
+    keys, count, _ = _query("cards", cards, severity="High,Urgent")
+    assert keys == sorted(
+        key for key, card in cards.items() if card["severity"] in ("High", "Urgent")
+    )
+
+    # portal severities are indexed by name, e.g. '2 (High)' -> 'high'
+    cases = fake_data["cases"]
+    keys, _, _ = _query("cases", cases, severity=["High", "Urgent"])
+    assert keys == sorted(
+        key
+        for key, case in cases.items()
+        if case["severity"] in ("1 (Urgent)", "2 (High)")
+    )
+
+
+def test_updated_since(fake_data):
+    cases = fake_data["cases"]
+    since = sorted(case["last_update"] for case in cases.values())[-3]
+    keys, count, _ = _query("cases", cases, updated_since=since[:10])
+
+    assert count >= 3
+    assert all(cases[key]["last_update"][:10] >= since[:10] for key in keys)
+
+
+def test_cursor_pagination(fake_data):
+    cards = fake_data["cards"]
+    pages = []
+    cursor = None
+    while True:
+        args = {"limit": "3"}
+        if cursor:
+            args["cursor"] = cursor
+        keys, count, cursor = _query("cards", cards, **args)
+        assert count == len(cards)
+        pages.append(keys)
+        if cursor is None:
+            break
+        assert decode_cursor(cursor) == keys[-1]
+
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    assert sum(pages, []) == sorted(cards)
+
+
+@pytest.mark.parametrize(
+    "args", [{"limit": "0"}, {"limit": "abc"}, {"limit": "1001"}, {"cursor": "%%"}]
+)
+def test_invalid_parameters(args):
+    with pytest.raises(ValueError):
+        parse_query("cards", Args(args))
+
+
+def test_project():
+    record = {"status": "Closed", "problem": "summary", "owner": "Alice"}
+
+    assert project(record, None) == record
+    assert project(record, ["status", "missing"]) == {"status": "Closed"}
+
+
+def test_export_ndjson(fake_data):
+    cases = fake_data["cases"]
+    lines = list(export_ndjson("cases", cases.items(), ["status", "owner"]))
+
+    assert len(lines) == len(cases)
+    assert all(line.endswith("\n") for line in lines)
+    first = json.loads(lines[0])
+    key = first.pop("case_number")
+    assert first == {"status": cases[key]["status"], "owner": cases[key]["owner"]}
+
+
+def test_export_csv(fake_data):
+    cards = fake_data["cards"]
+    chunks = list(export_csv("cards", cards.items()))
+
+    # one chunk per record, the first one includes the header
+    assert len(chunks) == len(cards)
+    rows = list(csv.DictReader("".join(chunks).splitlines()))
+    assert [row["card"] for row in rows] == list(cards)
+    card = cards[rows[0]["card"]]
+    assert rows[0]["severity"] == card["severity"]
+    assert json.loads(rows[0]["assignee"]) == card["assignee"]
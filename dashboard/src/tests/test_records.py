@@ -0,0 +1,114 @@
+import json
+
+import pytest
+import redis
+
+from t5gweb import libtelco5g
+from t5gweb.records import Card, Case, build_records, record_hook, replace
+
+
+@pytest.fixture
+def cards(fake_data):
+    return build_records(fake_data["cards"], Card)
+
+
+def test_records_match_cache(fake_data, cards):
+    cases = build_records(fake_data["cases"], Case)
+
+    assert cards == fake_data["cards"]
+    assert cases == fake_data["cases"]
+    for key, card in cards.items():
+        assert json.loads(json.dumps(dict(card))) == fake_data["cards"][key]
+
+
+def test_missing_and_extra_fields(fake_data):
+    data = dict(fake_data["cases"][next(iter(fake_data["cases"]))], extra=[1])
+    data.pop("closeddate", None)
+    case = Case(data)
+
+    assert "closeddate" not in case
+    assert case.get("closeddate") is None
+    with pytest.raises(KeyError):
+        case["closeddate"]
+    assert case["extra"] == [1]
+    assert set(case) == set(data)
+
+
+def test_repeated_values_are_shared(cards):
+    assignees = {}
+    severities = {}
+    for card in cards.values():
+        assignee = json.dumps(card["assignee"], sort_keys=True)
+        assert assignees.setdefault(assignee, card["assignee"]) is card["assignee"]
+        assert severities.setdefault(card["severity"], card["severity"]) is (
+            card["severity"]
+        )
+
+    assert len(assignees) < len(cards)
+
+
+def test_large_fields_are_compressed(fake_data, cards):
+    key = next(k for k, c in fake_data["cards"].items() if c["comments"])
+    card = cards[key]
+
+    assert isinstance(card._comments, bytes)
+    assert not hasattr(card, "comments")
+    assert card["comments"] == fake_data["cards"][key]["comments"]
+    assert card["comments"] is not card["comments"]
+
+
+def test_replace(fake_data, cards):
+    key = next(iter(cards))
+    card = cards[key]
+
+    copy = replace(card, comments=[], severity="Low")
+
+    assert copy["comments"] == []
+    assert copy["severity"] == "Low"
+    assert copy["account"] is card["account"]
+    assert card == fake_data["cards"][key]
+    assert replace({"a": 1}, a=2) == {"a": 2}
+
+
+def test_record_hook(fake_data):
+    cards = json.loads(json.dumps(fake_data["cards"]), object_hook=record_hook(Card))
+
+    assert all(isinstance(card, Card) for card in cards.values())
+    assert cards == fake_data["cards"]
+
+
+def test_get_records(mocker, monkeypatch, fake_data):
+    monkeypatch.setenv("t5g_snapshot_dir", "")
+    mocker.patch.dict(libtelco5g._records, clear=True)
+    version = mocker.patch("t5gweb.libtelco5g.get_cache_version", return_value=1.0)
+    redis_get = mocker.patch("t5gweb.libtelco5g.redis.Redis").return_value.get
+    redis_get.return_value = json.dumps(fake_data["cards"]).encode()
+
+    cards = libtelco5g.get_records("cards")
+    assert libtelco5g.get_records("cards") is cards
+    assert redis_get.call_count == 1
+    assert cards == fake_data["cards"]
+    assert isinstance(cards[next(iter(cards))], Card)
+
+    # rebuilt when the cache changes, or when it has no version
+    version.return_value = 2.0
+    assert libtelco5g.get_records("cards") is not cards
+    version.return_value = None
+    libtelco5g.get_records("cards")
+    libtelco5g.get_records("cards")
+    assert redis_get.call_count == 4
+
+
+def test_get_records_failed_read(mocker, monkeypatch, fake_data):
+    monkeypatch.setenv("t5g_snapshot_dir", "")
+    mocker.patch.dict(libtelco5g._records, clear=True)
+    mocker.patch("t5gweb.libtelco5g.get_cache_version", return_value=1.0)
+    redis_get = mocker.patch("t5gweb.libtelco5g.redis.Redis").return_value.get
+    redis_get.side_effect = redis.exceptions.ConnectionError
+
+    assert libtelco5g.get_records("cards") == {}
+
+    # the next request reads the cache again instead of keeping the failure
+    redis_get.side_effect = None
+    redis_get.return_value = json.dumps(fake_data["cards"]).encode()
+    assert libtelco5g.get_records("cards") == fake_data["cards"]
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from t5gweb.sketches import DDSketch
+
+
+def _exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def test_empty_sketch():
+    sketch = DDSketch()
+    assert sketch.count == 0
+    assert sketch.mean is None
+    assert sketch.quantile(0.5) is None
+
+
+@pytest.mark.parametrize("q", [0.0, 0.5, 0.9, 0.99, 1.0])
+def test_quantile_relative_accuracy(q):
+    rng = random.Random(42)
+    values = [rng.lognormvariate(2, 1.5) for _ in range(5000)]
+    sketch = DDSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    expected = _exact_quantile(values, q)
+    assert sketch.quantile(q) == pytest.approx(expected, rel=0.01)
+    assert sketch.count == len(values)
+    assert sketch.mean == pytest.approx(sum(values) / len(values))
+
+
+def test_zero_and_negative_values():
+    sketch = DDSketch()
+    for value in (-1, 0, 0, 5):
+        sketch.add(value)
+
+    assert sketch.zero_count == 3
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(5, rel=0.01)
+
+
+def test_merge_matches_single_sketch():
+    rng = random.Random(7)
+    values = [rng.uniform(0, 400) for _ in range(1000)]
+    single = DDSketch()
+    first, second = DDSketch(), DDSketch()
+    for index, value in enumerate(values):
+        single.add(value)
+        (first if index % 2 else second).add(value)
+
+    first.merge(second)
+    assert first.bins == single.bins
+    assert first.count == single.count
+    assert first.min == single.min
+    assert first.max == single.max
+    assert first.quantile(0.9) == single.quantile(0.9)
+
+
+def test_merge_different_accuracy():
+    with pytest.raises(ValueError):
+        DDSketch(0.01).merge(DDSketch(0.02))
+
+
+def test_serialization_round_trip():
+    sketch = DDSketch()
+    for value in (0, 1.5, 3, 90, 365):
+        sketch.add(value)
+
+    restored = DDSketch.from_dict(sketch.to_dict())
+    assert restored.to_dict() == sketch.to_dict()
+    assert restored.quantile(0.99) == sketch.quantile(0.99)
+
+
+def test_remove():
+    sketch = DDSketch()
+    for value in (0, 1, 10, 10, 100):
+        sketch.add(value)
+
+    sketch.remove(10)
+    sketch.remove(0)
+    sketch.remove(5)  # never added
+
+    assert sketch.count == 3
+    assert sketch.sum == 111
+    assert sketch.quantile(0.5) == pytest.approx(10, rel=0.01)
+    for value in (1, 10, 100):
+        sketch.remove(value)
+    assert sketch.count == 0
+    assert sketch.quantile(0.5) is None
@@ -0,0 +1,127 @@
+import json
+import os
+
+import pytest
+
+from t5gweb import libtelco5g
+from t5gweb.records import Card, replace
+from t5gweb.snapshots import (
+    Snapshot,
+    load_snapshot,
+    publish_snapshot,
+    snapshot_path,
+    write_snapshot,
+)
+
+
+@pytest.fixture
+def snapshot_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("t5g_snapshot_dir", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def cards(fake_data, tmp_path):
+    path = str(tmp_path / "cards.snapshot")
+    write_snapshot(path, fake_data["cards"])
+    return Snapshot(path, Card.shared)
+
+
+def test_snapshot_matches_cache(fake_data, cards):
+    assert list(cards) == list(fake_data["cards"])
+    assert cards == fake_data["cards"]
+    for key, card in cards.items():
+        assert json.loads(json.dumps(dict(card))) == fake_data["cards"][key]
+
+
+def test_missing_fields(tmp_path):
+    path = str(tmp_path / "records.snapshot")
+    write_snapshot(path, {"a": {"x": 1, "y": None}, "b": {"y": [1, 2]}})
+    records = Snapshot(path)
+
+    assert "x" not in records["b"]
+    assert records["b"].get("x") is None
+    with pytest.raises(KeyError):
+        records["b"]["x"]
+    with pytest.raises(KeyError):
+        records["a"]["unknown"]
+    assert list(records["b"]) == ["y"]
+    assert records["a"]["y"] is None
+
+
+def test_shared_values_are_decoded_once(cards):
+    key = next(iter(cards))
+
+    assert cards[key]["account"] is cards[key]["account"]
+    assert cards[key]["case_number"] == cards[key]["case_number"]
+
+
+def test_replace(fake_data, cards):
+    key = next(iter(cards))
+    card = cards[key]
+
+    copy = replace(card, comments=[], new_field=1)
+
+    assert copy["comments"] == []
+    assert copy["new_field"] == 1
+    assert list(copy) == list(fake_data["cards"][key]) + ["new_field"]
+    assert replace(copy, severity="Low")["comments"] == []
+    assert card == fake_data["cards"][key]
+
+
+def test_load_snapshot(snapshot_dir, fake_data):
+    fetched = []
+
+    def fetch():
+        fetched.append(1)
+        return fake_data["cards"]
+
+    cards = load_snapshot("cards", 1.0, fetch)
+    assert cards == fake_data["cards"]
+    assert load_snapshot("cards", 1.0, fetch) == fake_data["cards"]
+    assert len(fetched) == 1
+
+    # a new version replaces the snapshots of the older ones
+    publish_snapshot("cards", 2.0, {"a": {"x": 1}})
+    assert not os.path.exists(snapshot_path(str(snapshot_dir), "cards", 1.0))
+    assert load_snapshot("cards", 2.0, fetch) == {"a": {"x": 1}}
+    assert len(fetched) == 1
+    # the mapping of the old version stays readable
+    assert cards == fake_data["cards"]
+
+
+def test_load_snapshot_disabled(monkeypatch, fake_data):
+    monkeypatch.setenv("t5g_snapshot_dir", "")
+
+    assert load_snapshot("cards", 1.0, lambda: fake_data["cards"]) is None
+
+
+def test_load_snapshot_invalid(snapshot_dir):
+    with open(snapshot_path(str(snapshot_dir), "cards", 1.0), "wb") as snapshot:
+        snapshot.write(b"not a snapshot" * 10)
+
+    assert load_snapshot("cards", 1.0, dict) is None
+
+
+def test_load_snapshot_failed_fetch(snapshot_dir, fake_data):
+    assert load_snapshot("cards", 1.0, dict) is None
+    assert not os.path.exists(snapshot_path(str(snapshot_dir), "cards", 1.0))
+
+    # built once the cache can be read again
+    assert load_snapshot("cards", 1.0, lambda: fake_data["cards"]) == fake_data["cards"]
+
+
+def test_get_records_maps_snapshot(mocker, snapshot_dir, fake_data):
+    mocker.patch.dict(libtelco5g._records, clear=True)
+    mocker.patch("t5gweb.libtelco5g.get_cache_version", return_value=1.0)
+    redis_get = mocker.patch("t5gweb.libtelco5g.redis.Redis").return_value.get
+    redis_get.return_value = json.dumps(fake_data["cards"]).encode()
+
+    cards = libtelco5g.get_records("cards")
+
+    assert isinstance(cards, Snapshot)
+    assert cards == fake_data["cards"]
+    # another worker maps the same file without reading the cache
+    libtelco5g._records.clear()
+    assert libtelco5g.get_records("cards") == fake_data["cards"]
+    assert redis_get.call_count == 1
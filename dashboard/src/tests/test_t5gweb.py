@@ -0,0 +1,159 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from t5gweb import t5gweb
+
+
+@pytest.fixture
+def views(mocker, monkeypatch):
+    """Empty card views and mocked builders counting the views built"""
+    monkeypatch.setattr(
+        t5gweb, "_card_views", {"version": None, "views": OrderedDict()}
+    )
+    monkeypatch.setattr(t5gweb, "_card_view_builds", {})
+
+    class Views:
+        def __init__(self):
+            self.version = 1.0
+            self.now = datetime(2024, 6, 15, tzinfo=timezone.utc)
+            self.expiry = None
+            self.built = []
+
+    views = Views()
+    mocker.patch(
+        "t5gweb.t5gweb.libtelco5g.get_cache_version",
+        side_effect=lambda *keys: views.version,
+    )
+    mocker.patch(
+        "t5gweb.t5gweb.libtelco5g.get_records",
+        side_effect=lambda key: {"version": views.version},
+    )
+
+    def get_new_comments(cards, new_comments_only=True, account=None, engineer=None):
+        view = "recent" if new_comments_only else "all"
+        views.built.append((view, account, engineer))
+        return {"view": view, "account": account, "cards": cards}
+
+    def get_trending_cards(cards):
+        views.built.append(("trends", None, None))
+        return {"view": "trends", "cards": cards}
+
+    views.get_new_comments = mocker.patch(
+        "t5gweb.t5gweb.get_new_comments", side_effect=get_new_comments
+    )
+    mocker.patch("t5gweb.t5gweb.get_trending_cards", side_effect=get_trending_cards)
+    mocker.patch("t5gweb.t5gweb._recent_expiry", side_effect=lambda _: views.expiry)
+    clock = mocker.patch("t5gweb.t5gweb.datetime")
+    clock.now.side_effect = lambda tz=None: views.now
+    return views
+
+
+def test_get_card_view(views):
+    recent = t5gweb.get_card_view("recent")
+    assert recent["view"] == "recent"
+    assert t5gweb.get_card_view("all", account="a")["account"] == "a"
+    assert t5gweb.get_card_view("trends")["view"] == "trends"
+
+    # kept, and shared by every caller
+    assert t5gweb.get_card_view("recent") is recent
+    t5gweb.get_card_view("all", account="a")
+    assert views.built == [
+        ("recent", None, None),
+        ("all", "a", None),
+        ("trends", None, None),
+    ]
+
+    with pytest.raises(ValueError):
+        t5gweb.get_card_view("other")
+
+
+def test_get_card_view_rebuilt_on_new_version(views):
+    t5gweb.get_card_view("recent")
+    t5gweb.get_card_view("all", engineer="e")
+
+    views.version = 2.0
+    assert t5gweb.get_card_view("recent")["cards"] == {"version": 2.0}
+    assert t5gweb.get_card_view("all", engineer="e")["cards"] == {"version": 2.0}
+    assert len(views.built) == 4
+
+
+def test_get_card_view_not_kept_without_version(views):
+    views.version = None
+
+    t5gweb.get_card_view("trends")
+    t5gweb.get_card_view("trends")
+    assert len(views.built) == 2
+
+
+def test_get_recent_view_expires(views):
+    views.expiry = views.now + timedelta(hours=1)
+    t5gweb.get_card_view("recent")
+    t5gweb.get_card_view("all")
+
+    views.now += timedelta(minutes=59)
+    t5gweb.get_card_view("recent")
+    assert len(views.built) == 2
+
+    # the oldest comment is more than 7 days old, the other views are kept
+    views.now += timedelta(minutes=1)
+    t5gweb.get_card_view("recent")
+    t5gweb.get_card_view("all")
+    assert views.built == [
+        ("recent", None, None),
+        ("all", None, None),
+        ("recent", None, None),
+    ]
+
+
+def test_get_card_view_evicts_least_recently_used(views, monkeypatch):
+    monkeypatch.setattr(t5gweb, "max_card_views", 3)
+    for account in ("a", "b", "c"):
+        t5gweb.get_card_view("all", account=account)
+    # a is used again, so b is the least recently used
+    t5gweb.get_card_view("all", account="a")
+
+    t5gweb.get_card_view("all", account="d")
+    assert list(t5gweb._card_views["views"]) == [
+        ("all", "c", None),
+        ("all", "a", None),
+        ("all", "d", None),
+    ]
+    t5gweb.get_card_view("all", account="a")
+    t5gweb.get_card_view("all", account="b")
+    assert [account for _, account, _ in views.built] == ["a", "b", "c", "d", "b"]
+
+
+def test_get_card_view_built_once(views):
+    building = threading.Event()
+    release = threading.Event()
+    get_new_comments = views.get_new_comments.side_effect
+
+    def slow_get_new_comments(cards, **kwargs):
+        building.set()
+        release.wait(5)
+        return get_new_comments(cards, **kwargs)
+
+    views.get_new_comments.side_effect = slow_get_new_comments
+    results = []
+
+    def request():
+        results.append(t5gweb.get_card_view("recent"))
+
+    threads = [threading.Thread(target=request) for _ in range(2)]
+    threads[0].start()
+    assert building.wait(5)
+    threads[1].start()
+    # requests for other views don't wait for the build
+    assert t5gweb.get_card_view("trends")["view"] == "trends"
+    threads[1].join(0.1)
+    assert threads[1].is_alive()
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert views.built == [("trends", None, None), ("recent", None, None)]
+    assert results[0] is results[1]
+    assert t5gweb._card_view_builds == {}
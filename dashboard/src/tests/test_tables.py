@@ -0,0 +1,289 @@
+import os
+import re
+from datetime import datetime, timezone
+
+import pytest
+
+from t5gweb import tables
+from t5gweb.tables import (
+    build_card_detail,
+    build_table_index,
+    lookup,
+    max_page_length,
+    parse_table_request,
+    query_table,
+    recent_comments,
+    recent_expiry,
+    table_columns,
+)
+
+TIME_NOW = datetime(2024, 6, 15, tzinfo=timezone.utc)
+
+
+def _card(case_number, severity, account, comments, **overrides):
+    card = {
+        "account": account,
+        "assignee": {"displayName": "Alice"},
+        "bugzilla": None,
+        "card_status": "Debugging",
+        "case_days_open": 10,
+        "case_number": case_number,
+        "case_status": "Waiting on Red Hat",
+        "case_updated_date": "2024-06-01 10:00",
+        "comments": comments,
+        "contributor": [],
+        "crit_sit": False,
+        "daily_telco": False,
+        "escalated": False,
+        "escalated_link": None,
+        "group_name": None,
+        "issues": None,
+        "labels": [],
+        "potential_escalation": False,
+        "product": "OpenShift 4.14",
+        "severity": severity,
+        "summary": f"Summary of {case_number}",
+    }
+    card.update(overrides)
+    return card
+
+
+@pytest.fixture
+def cards():
+    return {
+        "CARD-1": _card(
+            "00000001",
+            "Low",
+            "Acme",
+            [["old", "2024-01-01T00:00:00.000+0000"]],
+            labels=["Trends"],
+        ),
+        "CARD-2": _card(
+            "00000002",
+            "Urgent",
+            "Globex",
+            [
+                ["older", "2024-01-01T00:00:00.000+0000"],
+                ["recent", "2024-06-14T00:00:00.000+0000"],
+            ],
+            escalated=True,
+        ),
+        "CARD-3": _card(
+            "00000003",
+            "High",
+            "Acme",
+            [["needle in the haystack", "2024-06-13T00:00:00.000+0000"]],
+            potential_escalation=True,
+            case_status="Closed",
+        ),
+        "CARD-4": _card("00000004", "Normal", "Acme", [], labels=["Trends"]),
+    }
+
+
+def _query(cards, view="all", **args):
+    index, rows, search = build_table_index(cards)
+    params = parse_table_request({"draw": "3", **args})
+    return query_table(
+        index, view, params, lookup(rows), lookup(search), time_now=TIME_NOW
+    )
+
+
+def _case_numbers(response):
+    return [row["case_number"] for row in response["data"]]
+
+
+def test_views(cards):
+    assert _query(cards, "all")["recordsTotal"] == 3
+    assert _query(cards, "trends")["recordsTotal"] == 2
+    recent = _query(cards, "recent")
+    assert recent["recordsTotal"] == 2
+
+
+def test_rows_only_carry_summary_columns(cards):
+    rows = _query(cards, "all")["data"]
+    card_2 = [row for row in rows if row["card"] == "CARD-2"][0]
+
+    for key in ("bugzilla", "issues", "comments", "group_name"):
+        assert key not in card_2
+    assert card_2["last_comment"] == ["recent", "2024-06-14T00:00:00.000+0000"]
+
+
+def test_rows_match_table_js(cards):
+    path = os.path.join(os.path.dirname(tables.__file__), "static", "js", "table.js")
+    with open(path) as table_js:
+        source = table_js.read()
+    options = source[source.index("function serverSideOptions") :]
+    options = options[: options.index("\n}\n")]
+    columns = [
+        column or None for column in re.findall(r"data: (?:'(\w+)'|null)", options)
+    ]
+
+    # columns with a defaultContent are only filtered on, not sent in rows
+    optional = re.findall(r"data: '(\w+)'[^}\n]*defaultContent", options)
+
+    assert columns == table_columns
+    row = _query(cards, "all")["data"][0]
+    read = set(columns[1:]) | set(re.findall(r"\brow\.(\w+)", options))
+    assert optional == ["escalation_flags", "closed_not_done"]
+    assert read - set(optional) <= set(row)
+
+
+def test_card_detail(cards):
+    detail = build_card_detail(cards["CARD-2"])
+
+    assert set(detail) == {"group_name", "severity", "bugzilla", "issues", "comments"}
+    assert len(detail["comments"]) == 2
+    assert recent_comments(detail["comments"], time_now=TIME_NOW) == [
+        ["recent", "2024-06-14T00:00:00.000+0000"]
+    ]
+    assert build_card_detail(cards["CARD-4"])["comments"] == []
+
+
+def test_recent_expiry(cards):
+    comments = cards["CARD-2"]["comments"]
+
+    assert recent_expiry(comments, time_now=TIME_NOW) == datetime(
+        2024, 6, 21, tzinfo=timezone.utc
+    )
+    assert recent_expiry(comments[:1], time_now=TIME_NOW) is None
+    assert recent_expiry([], time_now=TIME_NOW) is None
+
+
+def test_sort_and_page(cards):
+    args = {"order[0][column]": "2", "order[0][dir]": "desc"}
+    response = _query(cards, **args)
+    assert response["draw"] == 3
+    assert _case_numbers(response) == ["00000002", "00000003", "00000001"]
+
+    page = _query(cards, start="1", length="1", **args)
+    assert page["recordsFiltered"] == 3
+    assert _case_numbers(page) == ["00000003"]
+
+
+def test_page_length_is_capped():
+    assert parse_table_request({"length": "-1"})["length"] == max_page_length
+    assert parse_table_request({"length": "1000000"})["length"] == max_page_length
+    assert parse_table_request({"length": "0"})["length"] == 0
+    assert parse_table_request({})["length"] == 50
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        {"draw": "x"},
+        {"start": ""},
+        {"length": "1e9"},
+        {"order[0][column]": "severity"},
+    ],
+)
+def test_invalid_table_request(args):
+    with pytest.raises(ValueError):
+        parse_table_request(args)
+
+
+def test_multi_column_sort(cards):
+    response = _query(
+        cards,
+        **{
+            "order[0][column]": "7",
+            "order[0][dir]": "asc",
+            "order[1][column]": "1",
+            "order[1][dir]": "desc",
+        },
+    )
+    assert _case_numbers(response) == ["00000003", "00000001", "00000002"]
+
+
+def test_global_search(cards):
+    response = _query(cards, **{"search[value]": "Needle"})
+    assert response["recordsTotal"] == 3
+    assert response["recordsFiltered"] == 1
+    assert _case_numbers(response) == ["00000003"]
+
+
+@pytest.mark.parametrize("text", ["case", "null", "true", "false", "comments"])
+def test_global_search_ignores_keys(cards, text):
+    # keys and values of the card that aren't shown in the table
+    response = _query(cards, **{"search[value]": text})
+    assert response["recordsFiltered"] == 0
+
+
+def test_global_search_matches_shown_values(cards):
+    cards["CARD-1"]["contributor"] = [{"displayName": "Bob"}]
+
+    assert _case_numbers(_query(cards, **{"search[value]": "bob"})) == ["00000001"]
+    assert len(_query(cards, **{"search[value]": "alice"})["data"]) == 3
+    # the date shown with the last comment
+    response = _query(cards, **{"search[value]": "2024-06-14"})
+    assert _case_numbers(response) == ["00000002"]
+    # older comments aren't shown
+    assert _query(cards, **{"search[value]": "older"})["recordsFiltered"] == 0
+    # columns are searched separately
+    response = _query(cards, **{"search[value]": "00000001 openshift"})
+    assert response["recordsFiltered"] == 0
+
+
+def test_only_page_rows_are_read(cards):
+    index, rows, search = build_table_index(cards)
+    read = []
+
+    def get_rows(keys):
+        read.append(list(keys))
+        return lookup(rows)(keys)
+
+    params = parse_table_request(
+        {"order[0][column]": "2", "order[0][dir]": "asc", "length": "2"}
+    )
+    response = query_table(index, "all", params, get_rows, time_now=TIME_NOW)
+    assert read == [["CARD-1", "CARD-3"]]
+    assert response["recordsFiltered"] == 3
+    assert "rows" not in index
+
+    # cards removed since the index was read are left out
+    del rows["CARD-1"]
+    response = query_table(index, "all", params, lookup(rows), time_now=TIME_NOW)
+    assert _case_numbers(response) == ["00000003"]
+
+
+def test_sort_ties_keep_order(cards):
+    # every card is assigned to Alice, so the second column orders them
+    args = {
+        "order[0][column]": "10",
+        "order[0][dir]": "desc",
+        "order[1][column]": "13",
+        "order[1][dir]": "desc",
+    }
+    assert _case_numbers(_query(cards, **args)) == ["00000001", "00000002", "00000003"]
+
+    cards["CARD-2"]["case_days_open"] = 20
+    assert _case_numbers(_query(cards, **args)) == ["00000002", "00000001", "00000003"]
+
+
+def test_search_panes(cards):
+    response = _query(cards, **{"searchPanes[account][0]": "Acme"})
+    assert sorted(_case_numbers(response)) == ["00000001", "00000003"]
+
+    # potential escalations are listed under 'No' too
+    response = _query(cards, **{"searchPanes[escalated][0]": "No"})
+    assert sorted(_case_numbers(response)) == ["00000001", "00000003"]
+
+    response = _query(
+        cards,
+        **{
+            "searchPanes[closed_not_done][0]": (
+                "Case Status Closed, but Internal Status not Done"
+            )
+        },
+    )
+    assert _case_numbers(response) == ["00000003"]
+
+
+def test_search_pane_options(cards):
+    response = _query(cards, **{"searchPanes[severity][0]": "Urgent"})
+    accounts = {
+        option["value"]: option
+        for option in response["searchPanes"]["options"]["account"]
+    }
+    assert accounts["Acme"]["total"] == 2
+    assert accounts["Acme"]["count"] == 0
+    assert accounts["Globex"]["count"] == 1
@@ -0,0 +1,462 @@
+import json
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+import redis
+
+from t5gweb import taskmgr
+
+
+@pytest.fixture
+def r_cache(mocker):
+    """Fake Redis server shared by every redis.Redis() client of the test"""
+    server = fakeredis.FakeServer()
+    # only taskmgr's clients, Celery's own Redis transport subclasses redis.Redis
+    mocker.patch.object(
+        taskmgr,
+        "redis",
+        SimpleNamespace(
+            Redis=lambda *args, **kwargs: fakeredis.FakeRedis(server=server),
+            exceptions=redis.exceptions,
+        ),
+    )
+    return fakeredis.FakeRedis(server=server)
+
+
+@pytest.fixture
+def clock(mocker):
+    """Fake clock for taskmgr; callbacks in clock.on_sleep run on each sleep"""
+
+    class Clock:
+        def __init__(self):
+            self.now = 1700000000.0
+            self.on_sleep = []
+
+        def time(self):
+            return self.now
+
+        def sleep(self, seconds):
+            self.now += seconds
+            if self.on_sleep:
+                self.on_sleep.pop(0)()
+
+    clock = Clock()
+    mocker.patch("t5gweb.taskmgr.time", clock)
+    return clock
+
+
+def attempts(r_cache):
+    return {
+        key.decode("utf-8"): int(value)
+        for key, value in r_cache.hgetall("singleflight_attempts").items()
+    }
+
+
+def start_leader(r_cache, run_id="run-1", lock_name="singleflight:cards"):
+    """Hold the lock as if another worker was running"""
+    r_cache.set(lock_name, run_id)
+
+
+def finish_leader(r_cache, published, lock_name="singleflight:cards"):
+    """Publish the result of the other worker's run and release its lock"""
+
+    def finish():
+        r_cache.set("singleflight:cards:result", json.dumps(published))
+        r_cache.delete(lock_name)
+
+    return finish
+
+
+def test_singleflight_leader(r_cache, clock):
+    calls = []
+
+    def func():
+        calls.append(r_cache.get("singleflight:cards"))
+        return {"cards": 1}
+
+    assert taskmgr.singleflight("cards", func) == {"cards": 1}
+    # func ran while holding the lock, which is released afterwards
+    run_id = calls[0].decode("utf-8")
+    assert not r_cache.exists("singleflight:cards")
+    published = json.loads(r_cache.get("singleflight:cards:result"))
+    assert published == {"run_id": run_id, "result": {"cards": 1}}
+    assert attempts(r_cache) == {"cards|leader": 1}
+
+
+def test_singleflight_leader_fails(r_cache, clock):
+    def func():
+        raise ValueError("portal down")
+
+    with pytest.raises(ValueError):
+        taskmgr.singleflight("cards", func, lock_name="refresh_lock")
+
+    assert not r_cache.exists("refresh_lock")
+    published = json.loads(r_cache.get("singleflight:cards:result"))
+    assert published["error"] == "portal down"
+    assert "result" not in published
+
+
+def test_singleflight_waiter_gets_result(r_cache, clock, mocker):
+    func = mocker.Mock()
+    start_leader(r_cache)
+    clock.on_sleep.append(
+        finish_leader(r_cache, {"run_id": "run-1", "result": {"cards": 2}})
+    )
+
+    assert taskmgr.singleflight("cards", func) == {"cards": 2}
+    func.assert_not_called()
+    assert attempts(r_cache) == {"cards|coalesced": 1}
+
+
+def test_singleflight_waiter_gets_error(r_cache, clock, mocker):
+    func = mocker.Mock()
+    start_leader(r_cache, lock_name="refresh_lock")
+    clock.on_sleep.append(
+        finish_leader(
+            r_cache, {"run_id": "run-1", "error": "interrupted"}, "refresh_lock"
+        )
+    )
+
+    with pytest.raises(RuntimeError, match="cards failed in another worker"):
+        taskmgr.singleflight("cards", func, lock_name="refresh_lock")
+    func.assert_not_called()
+    assert attempts(r_cache) == {"cards|failed": 1}
+
+
+def test_singleflight_wait_timeout(r_cache, clock, mocker):
+    func = mocker.Mock()
+    start_leader(r_cache)
+
+    assert taskmgr.singleflight("cards", func, wait=10) is None
+    func.assert_not_called()
+    assert clock.now > 1700000010
+    # the leader still holds its lock
+    assert r_cache.get("singleflight:cards") == b"run-1"
+    assert attempts(r_cache) == {"cards|timeout": 1}
+
+
+def test_singleflight_ignores_stale_result(r_cache, clock, mocker):
+    # the result of an earlier run is still published
+    r_cache.set(
+        "singleflight:cards:result",
+        json.dumps({"run_id": "run-0", "error": "interrupted"}),
+    )
+    start_leader(r_cache)
+    # the leader finished without publishing, e.g. after its lock expired
+    clock.on_sleep.append(lambda: r_cache.delete("singleflight:cards"))
+
+    assert taskmgr.singleflight("cards", mocker.Mock()) is None
+    assert attempts(r_cache) == {"cards|coalesced": 1}
+
+
+def test_singleflight_counts_attempts(r_cache, clock):
+    taskmgr.singleflight("cards", lambda: "first")
+    taskmgr.singleflight("cards", lambda: "second")
+    taskmgr.singleflight("bugs", lambda: "bugs")
+    start_leader(r_cache)
+    taskmgr.singleflight("cards", lambda: "third", wait=0)
+
+    assert attempts(r_cache) == {
+        "cards|leader": 2,
+        "cards|timeout": 1,
+        "bugs|leader": 1,
+    }
+
+
+@pytest.fixture
+def stage(mocker, r_cache, clock):
+    """Mocks for refresh_stage: cache_data bumps the versions in stage.versions"""
+
+    class Stage:
+        def __init__(self):
+            self.versions = {}
+            self.cfg = {
+                "bz_key": "key",
+                "jira_escalations_project": "ESC",
+                "jira_escalations_label": "label",
+            }
+
+        def refreshed(self, data_type):
+            """Set when refresh_stage last refreshed data_type"""
+            refreshed = r_cache.hget("refresh_times", data_type)
+            return float(refreshed) if refreshed is not None else None
+
+    stage = Stage()
+
+    def cache_data(data_type):
+        for key in taskmgr.refresh_stages[data_type]["keys"]:
+            stage.versions[key] = clock.now
+
+    stage.cache_data = mocker.patch("t5gweb.taskmgr.cache_data", side_effect=cache_data)
+    mocker.patch(
+        "t5gweb.taskmgr.libtelco5g.get_cache_version",
+        side_effect=lambda *keys: max(stage.versions.get(key, 0) for key in keys),
+    )
+    mocker.patch("t5gweb.taskmgr.libtelco5g.redis_get", return_value={"1": {}})
+    stage.count = mocker.patch(
+        "t5gweb.taskmgr.libtelco5g.count_record_changes", return_value=3
+    )
+    stage.schedule = mocker.patch("t5gweb.taskmgr.schedule_next_refresh")
+    mocker.patch("t5gweb.taskmgr.set_cfg", side_effect=lambda: stage.cfg)
+    return stage
+
+
+@pytest.mark.parametrize(
+    "upstream, changed",
+    [
+        (None, False),
+        (False, False),
+        (True, True),
+        ([False, False, False], False),
+        ([False, True, False], True),
+        # the details -> bugs chain of the cards chord
+        ([[False], False, False], False),
+        ([[True], False, False], True),
+    ],
+)
+def test_upstream_changed(upstream, changed):
+    assert taskmgr._upstream_changed(upstream) is changed
+
+
+def test_refresh_stage_changed(r_cache, clock, stage):
+    assert taskmgr.refresh_stage(None, "cases") is True
+
+    stage.cache_data.assert_called_once_with("cases")
+    assert stage.refreshed("cases") == clock.now
+    assert r_cache.hget("refresh_changes", "cases") == b"3"
+    stage.count.assert_called_once_with("cases", {"1": {}})
+    stage.schedule.assert_called_once_with(3)
+
+
+def test_refresh_stage_unchanged(r_cache, clock, stage):
+    stage.cache_data.side_effect = None
+
+    # the pipeline goes on, the downstream stages decide by themselves
+    assert taskmgr.refresh_stage(True, "issues") is True
+    assert taskmgr.refresh_stage(False, "escalations") is False
+
+    assert stage.cache_data.call_count == 2
+    assert r_cache.hget("refresh_changes", "issues") == b"0"
+    stage.schedule.assert_not_called()
+
+
+def test_refresh_stage_min_age(r_cache, clock, stage):
+    # bugs: min_age 1 hour, max_age 12 hours
+    r_cache.hset("refresh_times", "bugs", clock.now - 3599)
+    assert taskmgr.refresh_stage(True, "bugs") is True
+    stage.cache_data.assert_not_called()
+
+    clock.now += 1
+    assert taskmgr.refresh_stage([True], "bugs") is True
+    stage.cache_data.assert_called_once_with("bugs")
+
+
+def test_refresh_stage_max_age(r_cache, clock, stage):
+    # cards: min_age 15 minutes, max_age 1 hour
+    r_cache.hset("refresh_times", "cards", clock.now - 3599)
+    assert taskmgr.refresh_stage([[False], False, False], "cards") is False
+    stage.cache_data.assert_not_called()
+
+    clock.now += 1
+    assert taskmgr.refresh_stage([[False], False, False], "cards") is True
+    stage.cache_data.assert_called_once_with("cards")
+
+
+def test_refresh_stage_upstream_changed(r_cache, clock, stage):
+    r_cache.hset("refresh_times", "cards", clock.now - 900)
+
+    assert taskmgr.refresh_stage([[True], False, False], "cards") is True
+    stage.cache_data.assert_called_once_with("cards")
+
+
+def test_refresh_stage_disabled(r_cache, clock, stage):
+    stage.cfg = dict(stage.cfg, bz_key="")
+
+    assert taskmgr.refresh_stage(True, "bugs") is True
+    stage.cache_data.assert_not_called()
+
+
+def test_refresh_stage_fails(r_cache, clock, stage):
+    r_cache.hset("refresh_times", "details", clock.now - 43200)
+    stage.cache_data.side_effect = ValueError("portal down")
+
+    # logged and treated as unchanged, and retried by the next run
+    assert taskmgr.refresh_stage(False, "details") is False
+    assert taskmgr.refresh_stage(True, "details") is True
+    assert stage.refreshed("details") == clock.now - 43200
+    assert r_cache.hget("refresh_changes", "details") is None
+
+
+def test_refresh_pipeline(mocker):
+    apply_async = mocker.patch("celery.canvas._chain.apply_async", autospec=True)
+
+    taskmgr.refresh_pipeline()
+
+    pipeline = apply_async.call_args.args[0]
+    cases, cards = pipeline.tasks
+    # the first stage doesn't get the result of a previous task
+    assert cases.task == "t5gweb.taskmgr.refresh_stage"
+    assert cases.immutable
+    assert cases.args == (None, "cases")
+    # cards run once all other stages finished, bugs after details
+    details_bugs, issues, escalations = cards.tasks
+    assert [s.args for s in details_bugs.tasks] == [("details",), ("bugs",)]
+    assert issues.args == ("issues",)
+    assert escalations.args == ("escalations",)
+    assert cards.body.args == ("cards",)
+    assert not any(s.immutable for s in (*details_bugs.tasks, issues, cards.body))
+
+
+def test_start_refresh(r_cache, mocker):
+    apply_async = mocker.patch("t5gweb.taskmgr.refresh_job.apply_async")
+
+    job_id, started = taskmgr.start_refresh("cards")
+    assert started is True
+    apply_async.assert_called_once_with(args=("cards",), task_id=job_id)
+    assert r_cache.get("refresh_job:cards").decode("utf-8") == job_id
+    assert 0 < r_cache.ttl("refresh_job:cards") <= 60 * 60 * 2
+
+    # concurrent requests join the running job
+    assert taskmgr.start_refresh("cards") == (job_id, False)
+    apply_async.assert_called_once()
+
+    # other data types get their own job
+    other_id, started = taskmgr.start_refresh("bugs")
+    assert started is True
+    assert other_id != job_id
+
+
+def test_start_refresh_after_job_finished(r_cache, mocker):
+    apply_async = mocker.patch("t5gweb.taskmgr.refresh_job.apply_async")
+    r_cache.set("refresh_job:cards", "job-1")
+
+    # the job finishes between the two Redis calls of start_refresh
+    def get(self, name):
+        r_cache.delete(name)
+        return None
+
+    get = mocker.patch.object(
+        fakeredis.FakeRedis, "get", autospec=True, side_effect=get
+    )
+
+    job_id, started = taskmgr.start_refresh("cards")
+    get.assert_called_once()
+    assert started is True
+    assert job_id != "job-1"
+    apply_async.assert_called_once_with(args=("cards",), task_id=job_id)
+
+
+def test_refresh_job(r_cache, mocker):
+    cache_data = mocker.patch(
+        "t5gweb.taskmgr.cache_data", return_value={"caching bugs": "ok"}
+    )
+    r_cache.set("refresh_job:bugs", "job-1")
+
+    result = taskmgr.refresh_job.apply(args=("bugs",), task_id="job-1")
+    assert result.get() == {"caching bugs": "ok"}
+    cache_data.assert_called_once_with("bugs")
+    # the next request starts a new job
+    assert not r_cache.exists("refresh_job:bugs")
+
+
+def test_refresh_job_skipped(r_cache, mocker):
+    mocker.patch("t5gweb.taskmgr.cache_data", return_value=None)
+
+    result = taskmgr.refresh_job.apply(args=("cards",), task_id="job-1")
+    assert result.get() == {"caching cards": "skipped: already running"}
+
+
+def test_refresh_job_keeps_other_job(r_cache, mocker):
+    mocker.patch("t5gweb.taskmgr.cache_data", return_value={"caching cases": "ok"})
+    # a newer job was started after the key of this one expired
+    r_cache.set("refresh_job:cases", "job-2")
+
+    taskmgr.refresh_job.apply(args=("cases",), task_id="job-1").get()
+    assert r_cache.get("refresh_job:cases") == b"job-2"
+
+
+def test_refresh_job_fails(r_cache, mocker):
+    mocker.patch("t5gweb.taskmgr.cache_stats", side_effect=ValueError("db down"))
+    r_cache.set("refresh_job:stats", "job-1")
+
+    result = taskmgr.refresh_job.apply(args=("stats",), task_id="job-1")
+    with pytest.raises(ValueError):
+        result.get()
+    assert not r_cache.exists("refresh_job:stats")
+
+
+def test_refresh_job_create_jira_cards(r_cache, mocker):
+    mocker.patch("t5gweb.taskmgr.portal_jira_sync", return_value={"cards": "ok"})
+
+    result = taskmgr.refresh_job.apply(args=("create_jira_cards",), task_id="job-1")
+    assert result.get() == {"cards": "ok"}
+
+
+@pytest.mark.parametrize(
+    "data_type, queue",
+    [
+        ("cards", "interactive"),
+        ("cases", "interactive"),
+        ("stats", "interactive"),
+        ("create_jira_cards", "mutation"),
+        ("details", "ingest"),
+        ("bugs", "ingest"),
+        ("escalations", "ingest"),
+        ("issues", "ingest"),
+    ],
+)
+def test_route_refresh_job(data_type, queue):
+    name = "t5gweb.taskmgr.refresh_job"
+    expected = {"queue": queue, "priority": 1}
+
+    assert taskmgr.route_task(name, (data_type,), {}, {}) == expected
+    assert taskmgr.route_task(name, [data_type], {}, {}) == expected
+    assert taskmgr.route_task(name, (), {"data_type": data_type}, {}) == expected
+    assert taskmgr.route_task(name, None, {"data_type": data_type}, {}) == expected
+
+
+def test_route_task():
+    assert taskmgr.mgr.conf.task_routes == (taskmgr.route_task,)
+    assert taskmgr.route_task("t5gweb.taskmgr.refresh_background", (), {}, {}) == {
+        "queue": "interactive",
+        "priority": 0,
+    }
+    assert taskmgr.route_task("t5gweb.taskmgr.cache_data", ("bugs",), {}, {}) == {
+        "queue": "ingest",
+        "priority": 5,
+    }
+    assert taskmgr.route_task("t5gweb.taskmgr.t_tag_bz", (), {}, {}) == {
+        "queue": "mutation",
+        "priority": 7,
+    }
+    # Celery's default routing, see task_default_queue
+    assert taskmgr.route_task("celery.chord_unlock", (), {}, {}) is None
+
+
+def test_task_routes_cover_tasks():
+    tasks = {name for name in taskmgr.mgr.tasks if name.startswith("t5gweb.")}
+
+    # refresh_job is routed by route_task itself
+    assert set(taskmgr.task_routes) | {"t5gweb.taskmgr.refresh_job"} == tasks
+
+
+@pytest.mark.parametrize("created, rebuilt", [(2, True), (0, False)])
+def test_portal_jira_sync_rebuilds_indexes(r_cache, mocker, created, rebuilt):
+    mocker.patch(
+        "t5gweb.taskmgr.libtelco5g.sync_portal_to_jira",
+        return_value={"cards_created": created},
+    )
+    get_card_indexes = mocker.patch("t5gweb.taskmgr.cache.get_card_indexes")
+
+    assert taskmgr.portal_jira_sync() == {"cards_created": created}
+    assert get_card_indexes.called is rebuilt
+    assert not r_cache.exists("sync_lock")
+
+
+def test_portal_jira_sync_locked(r_cache, mocker):
+    sync = mocker.patch("t5gweb.taskmgr.libtelco5g.sync_portal_to_jira")
+    r_cache.set("sync_lock", "other")
+
+    assert taskmgr.portal_jira_sync() == {"locked": "Task is Locked"}
+    sync.assert_not_called()
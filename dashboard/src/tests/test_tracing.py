@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from t5gweb import tracing
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "trace.jsonl"
+    monkeypatch.setattr(tracing, "_exporters", [tracing.FileExporter(str(path))])
+    return path
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_parse_traceparent():
+    parent = tracing.parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16 + "-01")
+    assert (parent.trace_id, parent.span_id) == ("a" * 32, "b" * 16)
+    assert tracing.parse_traceparent(None) is None
+    assert tracing.parse_traceparent("invalid") is None
+
+
+def test_nested_spans_exported_with_root(trace_file):
+    with tracing.span("stage", stage="cards") as root:
+        with tracing.span("build_card", card="CARD-1"):
+            assert not trace_file.exists()
+        tracing.record_span("jira GET", 0.5, target="jira")
+    spans = read_spans(trace_file)
+
+    assert [s["name"] for s in spans] == ["build_card", "jira GET", "stage"]
+    assert {s["traceId"] for s in spans} == {root.trace_id}
+    assert [s["parentSpanId"] for s in spans[:2]] == [root.span_id] * 2
+    assert spans[2]["parentSpanId"] is None
+    assert spans[2]["attributes"] == {"stage": "cards"}
+    jira = spans[1]
+    assert jira["endTimeUnixNano"] - jira["startTimeUnixNano"] >= 5e8
+    assert tracing.current_traceparent() is None
+
+
+def test_remote_parent_and_errors(trace_file):
+    parent = tracing.parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16 + "-01")
+    task_span = tracing.start_span("task", parent=parent)
+    assert tracing.current_traceparent() == task_span.traceparent
+    with pytest.raises(ValueError):
+        with tracing.span("failing"):
+            raise ValueError("boom")
+    tracing.end_span(task_span)
+    failing, task = read_spans(trace_file)
+
+    assert failing["status"] == "ERROR"
+    assert failing["attributes"]["exception"] == "ValueError('boom')"
+    assert task["traceId"] == "a" * 32
+    assert task["parentSpanId"] == "b" * 16
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(tracing, "_exporters", [])
+    with tracing.span("stage") as span:
+        assert span is None
+    assert tracing.current_traceparent() is None
@@ -1,6 +1,16 @@
+from datetime import datetime, timezone
+
 import pytest
 
-from t5gweb.utils import exists_or_zero, set_defaults
+from t5gweb.utils import (
+    exists_or_zero,
+    format_date,
+    next_refresh_interval,
+    parse_timestamp,
+    reload_cfg,
+    set_cfg,
+    set_defaults,
+)
 
 
 @pytest.mark.parametrize(
@@ -59,3 +69,87 @@ def test_set_default():
     assert defaults["low_severity_slack_channel"] == ""
     assert defaults["max_jira_results"] is False
     assert defaults["max_portal_results"] == 5000
+    assert defaults["refresh_min_interval"] == 300
+    assert defaults["refresh_max_interval"] == 3600
+
+
+# Saturday night and Monday noon, UTC
+WEEKEND = datetime(2024, 6, 15, 22, tzinfo=timezone.utc)
+BUSINESS_HOURS = datetime(2024, 6, 17, 12, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "interval, changes, now, expected",
+    [
+        (None, 0, WEEKEND, 450),  # first run starts from the minimum
+        (1200, 0, WEEKEND, 1800),  # idle: back off
+        (3000, 0, WEEKEND, 3600),  # never above the maximum
+        (1200, 3, WEEKEND, 600),  # some changes: poll twice as often
+        (400, 3, WEEKEND, 300),  # never below the minimum
+        (3600, 50, WEEKEND, 300),  # busy: poll at the minimum
+        (1200, 0, BUSINESS_HOURS, 900),  # capped during business hours
+    ],
+)
+def test_next_refresh_interval(interval, changes, now, expected):
+    cfg = set_defaults()
+    assert next_refresh_interval(interval, changes, now, cfg) == expected
+
+
+def test_next_refresh_interval_env_overrides():
+    # values read from the environment are strings
+    cfg = dict(set_defaults(), refresh_min_interval="60", refresh_busy_changes="2")
+    assert next_refresh_interval(3600, 2, WEEKEND, cfg) == 60
+
+
+@pytest.mark.parametrize(
+    "value", ["2024-02-29T23:59:58Z", "2024-2-3T4:05:06Z", "2024-02-03T04:05:06Z"]
+)
+def test_format_date(value):
+    assert format_date(value) == datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+    assert format_date(value) is format_date(value)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2024-01-01T01:00:00.123+0000",
+        "2024-01-01T01:00:00.123-0530",
+        "2024-01-01T01:00:00.1+0200",
+    ],
+)
+def test_parse_timestamp(value):
+    expected = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+    assert parse_timestamp(value) == expected
+    assert parse_timestamp(value).utcoffset() == expected.utcoffset()
+
+
+def test_date_parsers_reject_other_formats():
+    with pytest.raises(ValueError):
+        format_date("2024-01-01")
+    with pytest.raises(ValueError):
+        parse_timestamp("2024-01-01T01:00:00Z")
+
+
+def test_set_cfg_is_cached(monkeypatch):
+    monkeypatch.setenv("jira_server", "https://jira.example.com")
+    monkeypatch.setenv("team", '[{"name": "a", "user": "b"}]')
+    cfg = reload_cfg()
+
+    assert set_cfg() is cfg
+    assert cfg["server"] == "https://jira.example.com"
+    assert cfg["team"] == ({"name": "a", "user": "b"},)
+    with pytest.raises(TypeError):
+        cfg["server"] = "changed"
+    with pytest.raises(TypeError):
+        cfg["team"][0]["name"] = "changed"
+    with pytest.raises(TypeError):
+        cfg["sla_settings"]["days"]["Urgent"] = 1
+    with pytest.raises(AttributeError):
+        cfg["rbac"].append("changed")
+    assert dict(cfg, to="someone")["to"] == "someone"
+
+    # environment changes are only seen after a reload
+    monkeypatch.setenv("jira_server", "https://other.example.com")
+    assert set_cfg()["server"] == "https://jira.example.com"
+    assert reload_cfg()["server"] == "https://other.example.com"
+    assert set_cfg()["server"] == "https://other.example.com"